@@ -0,0 +1,516 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from game_logic import GameState, ActionType, ObservationEncoder, observation_size
+
+# File con i digest delle tracce di riferimento, versionato insieme alle regole
+GOLDEN_TRACES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_traces.json")
+GOLDEN_SEEDS = (0, 1, 2, 3, 4)
+GOLDEN_STEPS = 5000
+# Rapporto richiesto tra i passi/s di VecGameState (1024 partite) e quelli del ciclo scalare
+VEC_TARGET_SPEEDUP = 50
+
+
+def _seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def _metric(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+# --- TRACCE DI RIFERIMENTO ---
+
+def state_signature(game_state: GameState) -> tuple:
+    # Tutto lo stato osservabile, indipendente dall'ordine interno dei buff
+    participants = tuple(
+        (p.x, p.y, p.hp, p.armor, p.vision_duration, p.freeze_status,
+         p.freeze_attack_count, p.last_movement_direction.name)
+        for p in (game_state.human, game_state.ai))
+    buffs = tuple(sorted((b.x, b.y, b.buff_type.name, b.duration) for b in game_state.buffs))
+    return (participants, buffs, game_state.turn, game_state.current_player,
+            game_state.game_over, game_state.winner, game_state.last_action_valid)
+
+
+def trace_digest(engine_class=GameState, seed=0, num_steps=GOLDEN_STEPS) -> str:
+    # Gioca num_steps mezzi-turni con seed e azioni fissate (reset a fine partita)
+    # e restituisce l'hash SHA-256 di esito e stato dopo ogni azione
+    random.seed(seed)
+    actions = random.Random(seed + 1000)
+    game_state = engine_class()
+    game_state.initialize_game()
+    digest = hashlib.sha256()
+    for _ in range(num_steps):
+        if game_state.game_over:
+            game_state.initialize_game()
+        action = ActionType(actions.randrange(len(ActionType)))
+        valid, reward = game_state.execute_action(action)
+        digest.update(repr((action.value, valid, round(reward, 6), state_signature(game_state))).encode())
+    return digest.hexdigest()
+
+
+def write_golden_traces(path=GOLDEN_TRACES_PATH):
+    # Rigenera i digest dal GameState di riferimento (solo se le regole cambiano volutamente)
+    traces = {str(seed): trace_digest(GameState, seed) for seed in GOLDEN_SEEDS}
+    with open(path, "w") as f:
+        json.dump({"num_steps": GOLDEN_STEPS, "traces": traces}, f, indent=2)
+        f.write("\n")
+    print(f"--- Tracce di riferimento scritte in {path} ---")
+
+
+def check_golden_traces(engine_class=GameState, path=GOLDEN_TRACES_PATH) -> bool:
+    # Un motore è equivalente alle regole correnti se riproduce tutti i digest
+    with open(path) as f:
+        golden = json.load(f)
+    ok = True
+    for seed, expected in golden["traces"].items():
+        if trace_digest(engine_class, int(seed), golden["num_steps"]) != expected:
+            print(f"Traccia divergente: {engine_class.__name__}, seed {seed}")
+            ok = False
+    return ok
+
+
+# --- MISURE ---
+
+def bench_execute_action(seed, num_steps=100000):
+    _seed_everything(seed)
+    game_state = GameState()
+    game_state.initialize_game()
+    actions = [ActionType(random.randrange(len(ActionType))) for _ in range(1024)]
+    start = time.perf_counter()
+    for step in range(num_steps):
+        if game_state.game_over:
+            game_state.initialize_game()
+        game_state.execute_action(actions[step & 1023])
+    return num_steps / (time.perf_counter() - start)
+
+
+def bench_scalar_env_steps(seed, num_steps=30000, difficulty=0.1):
+    # Passi dell'ambiente scalare come nel ciclo di training: mossa (casuale) dell'IA, sua
+    # osservazione dall'encoder incrementale e risposta dell'avversario scriptato
+    _seed_everything(seed)
+    game_state = GameState()
+    game_state.initialize_game()
+    encoder = ObservationEncoder(game_state.grid_size)
+    actions = [ActionType(random.randrange(len(ActionType))) for _ in range(1024)]
+    start = time.perf_counter()
+    for step in range(num_steps):
+        if game_state.game_over:
+            game_state.initialize_game()
+            encoder.reset()
+        if game_state.current_player == 0:
+            game_state.execute_action(game_state.get_simple_opponent_action(difficulty))
+        game_state.execute_action(actions[step & 1023])
+        encoder.encode(game_state)
+        if not game_state.game_over:
+            game_state.execute_action(game_state.get_simple_opponent_action(difficulty))
+    return num_steps / (time.perf_counter() - start)
+
+
+def bench_vec_env_steps(seed, num_envs=1024, num_batches=200, difficulty=0.1):
+    # Stessi passi (mossa dell'IA, osservazione, risposta dell'avversario, reset automatico)
+    # con VecGameState.step su num_envs partite: passi totali al secondo
+    from vec_game_logic import VecGameState
+    vec = VecGameState(num_envs, seed=seed)
+    vec.reset(difficulty)
+    actions = np.random.default_rng(seed).integers(len(ActionType), size=(64, num_envs))
+    start = time.perf_counter()
+    for batch in range(num_batches):
+        vec.step(actions[batch & 63], difficulty)
+    return num_batches * num_envs / (time.perf_counter() - start)
+
+
+def bench_observation(seed, num_states=2000, calls_per_state=10):
+    # Osservazioni su stati diversi; si misura solo il tempo di get_ai_observation
+    _seed_everything(seed)
+    game_state = GameState()
+    game_state.initialize_game()
+    elapsed = 0.0
+    for _ in range(num_states):
+        if game_state.game_over:
+            game_state.initialize_game()
+        game_state.execute_action(ActionType(random.randrange(len(ActionType))))
+        start = time.perf_counter()
+        for _ in range(calls_per_state):
+            game_state.get_ai_observation()
+        elapsed += time.perf_counter() - start
+    return num_states * calls_per_state / elapsed
+
+
+def bench_snapshot(seed, include_rng, num_states=2000, calls_per_state=10):
+    # Costo di una coppia snapshot + restore (microsecondi) su stati diversi
+    _seed_everything(seed)
+    game_state = GameState()
+    game_state.initialize_game()
+    elapsed = 0.0
+    for _ in range(num_states):
+        if game_state.game_over:
+            game_state.initialize_game()
+        game_state.execute_action(ActionType(random.randrange(len(ActionType))))
+        start = time.perf_counter()
+        for _ in range(calls_per_state):
+            game_state.restore(game_state.snapshot(include_rng))
+        elapsed += time.perf_counter() - start
+    return elapsed / (num_states * calls_per_state) * 1e6
+
+
+def bench_replay_buffer(seed, state_size, num_pushes=50000, num_samples=2000, batch_size=128):
+    from dqn_agent import ReplayBuffer
+    _seed_everything(seed)
+    buffer = ReplayBuffer(100000, state_size)
+    states = np.random.rand(1024, state_size).astype(np.float32)
+    start = time.perf_counter()
+    for i in range(num_pushes):
+        buffer.push(states[i & 1023], i % 6, 0.1, states[(i + 1) & 1023], False)
+    push_rate = num_pushes / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        buffer.sample(batch_size)
+    sample_rate = num_samples / (time.perf_counter() - start)
+    return push_rate, sample_rate
+
+
+def bench_compact_replay(seed, num_transitions=4096, num_pushes=50000, num_samples=2000, batch_size=128):
+    # Memoria compatta con osservazioni vere (la quantizzazione vale solo per quelle del gioco):
+    # push/s, batch/s e byte occupati per transizione a buffer pieno
+    from dqn_agent import CompactReplayBuffer
+    _seed_everything(seed)
+    game_state = GameState()
+    encoder = ObservationEncoder(game_state.grid_size)
+    transitions = []
+    while len(transitions) < num_transitions:
+        game_state.initialize_game()
+        encoder.reset()
+        state = encoder.encode(game_state).copy()
+        while not game_state.game_over:
+            action = random.randrange(len(ActionType))
+            _, reward = game_state.execute_action(ActionType(action))
+            next_state = encoder.encode(game_state).copy()
+            transitions.append((state, action, reward, next_state, game_state.game_over))
+            state = next_state
+    buffer = CompactReplayBuffer(100000, observation_size(game_state.grid_size))
+    start = time.perf_counter()
+    for i in range(num_pushes):
+        buffer.push(*transitions[i % num_transitions])
+    push_rate = num_pushes / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        buffer.sample(batch_size)
+    sample_rate = num_samples / (time.perf_counter() - start)
+    return push_rate, sample_rate, buffer.memory_bytes() / buffer.capacity
+
+
+def bench_sum_tree_sampling(seed, capacity, num_samples=2000, batch_size=128):
+    # Costo del campionamento proporzionale su un sum-tree pieno: deve restare
+    # quasi costante al crescere della capacità (profondità logaritmica)
+    from dqn_agent import SumTree
+    _seed_everything(seed)
+    tree = SumTree(capacity)
+    tree.update(np.arange(capacity), np.random.rand(capacity))
+    total = tree.total()
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        tree.find((np.arange(batch_size) + np.random.random(batch_size)) * total / batch_size)
+    return num_samples / (time.perf_counter() - start)
+
+
+def _fresh_agent(state_size, action_size, **options):
+    # Agente senza modello salvato, così le misure non dipendono da dqn_model.pth
+    from dqn_agent import DQNAgent
+    missing = os.path.join(tempfile.gettempdir(), "grid_duel_bench_missing.pth")
+    return DQNAgent(state_size, action_size, model_path=missing, **options)
+
+
+def bench_learn(seed, state_size, action_size, num_updates=200, **options):
+    _seed_everything(seed)
+    agent = _fresh_agent(state_size, action_size, **options)
+    for _ in range(2000):
+        agent.replay_buffer.push(np.random.rand(state_size), random.randrange(action_size),
+                                 random.uniform(-1, 1), np.random.rand(state_size), random.random() < 0.05)
+    # Riscaldamento: con torch.compile i primi aggiornamenti includono la compilazione
+    for _ in range(3):
+        agent.learn()
+    start = time.perf_counter()
+    for _ in range(num_updates):
+        agent.learn()
+    return num_updates / (time.perf_counter() - start)
+
+
+def bench_get_action(seed, state_size, action_size, num_calls=2000, cached=False):
+    # Distribuzione della latenza di una singola scelta greedy (microsecondi): con cached=False
+    # ogni chiamata usa un'osservazione nuova (forward completo), altrimenti sempre la stessa
+    _seed_everything(seed)
+    agent = _fresh_agent(state_size, action_size)
+    states = np.random.rand(1 if cached else num_calls, state_size).astype(np.float32)
+    latencies = np.empty(num_calls)
+    for i in range(num_calls):
+        state = states[0 if cached else i]
+        start = time.perf_counter()
+        agent.get_action(state, is_training=False)
+        latencies[i] = time.perf_counter() - start
+    return np.percentile(latencies * 1e6, [50, 90, 99])
+
+
+def run_benchmarks(seed=0) -> dict:
+    state_size = observation_size(GameState().grid_size)
+    action_size = len(ActionType)
+    push_rate, sample_rate = bench_replay_buffer(seed, state_size)
+    compact_push, compact_sample, compact_bytes = bench_compact_replay(seed)
+    p50, p90, p99 = bench_get_action(seed, state_size, action_size)
+    cached_p50 = bench_get_action(seed, state_size, action_size, cached=True)[0]
+    scalar_env_steps = bench_scalar_env_steps(seed)
+    vec_env_steps = bench_vec_env_steps(seed)
+    return {
+        "execute_action": _metric(bench_execute_action(seed), "steps/s"),
+        "env_steps_scalar": _metric(scalar_env_steps, "steps/s"),
+        "env_steps_vec_1024": _metric(vec_env_steps, "steps/s"),
+        "vec_speedup": _metric(vec_env_steps / scalar_env_steps, "x"),
+        "get_ai_observation": _metric(bench_observation(seed), "calls/s"),
+        "snapshot_restore": _metric(bench_snapshot(seed, False), "us", higher_is_better=False),
+        "snapshot_restore_rng": _metric(bench_snapshot(seed, True), "us", higher_is_better=False),
+        "replay_push": _metric(push_rate, "pushes/s"),
+        "replay_sample": _metric(sample_rate, "batches/s"),
+        "replay_compact_push": _metric(compact_push, "pushes/s"),
+        "replay_compact_sample": _metric(compact_sample, "batches/s"),
+        "replay_compact_bytes": _metric(compact_bytes, "bytes/transition", higher_is_better=False),
+        "per_sample_10k": _metric(bench_sum_tree_sampling(seed, 10_000), "batches/s"),
+        "per_sample_100k": _metric(bench_sum_tree_sampling(seed, 100_000), "batches/s"),
+        "per_sample_1m": _metric(bench_sum_tree_sampling(seed, 1_000_000), "batches/s"),
+        "learn": _metric(bench_learn(seed, state_size, action_size), "updates/s"),
+        "get_action_p50": _metric(p50, "us", higher_is_better=False),
+        "get_action_p90": _metric(p90, "us", higher_is_better=False),
+        "get_action_p99": _metric(p99, "us", higher_is_better=False),
+        "get_action_cached_p50": _metric(cached_p50, "us", higher_is_better=False),
+    }
+
+
+def compare_to_baseline(metrics: dict, baseline: dict, tolerance: float) -> list:
+    # Restituisce le metriche peggiorate oltre la tolleranza relativa
+    regressions = []
+    for name, metric in metrics.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]["value"]
+        value = metric["value"]
+        if metric["higher_is_better"]:
+            regressed = value < reference * (1 - tolerance)
+        else:
+            regressed = value > reference * (1 + tolerance)
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def run_bench_mode(output_path="bench_results.json", baseline_path="bench_baseline.json",
+                   tolerance=0.25, update_baseline=False, seed=0) -> int:
+    # Punto d'ingresso di --mode bench: restituisce il codice di uscita del processo
+    print("--- Verifica tracce di riferimento ---")
+    from bitboard_logic import BitboardGameState
+    traces_ok = all([check_golden_traces(GameState), check_golden_traces(BitboardGameState)])
+    print("Tracce: OK" if traces_ok else "Tracce: DIVERGENTI")
+    # Il motore vettoriale usa un altro generatore casuale: si confrontano le transizioni
+    from vec_game_logic import verify_against_reference
+    vec_mismatches = verify_against_reference(seed=seed)
+    print("VecGameState: OK" if not vec_mismatches else f"VecGameState: {vec_mismatches} DISCREPANZE")
+
+    print("--- Avvio benchmark ---")
+    metrics = run_benchmarks(seed)
+    with open(output_path, "w") as f:
+        json.dump(metrics, f, indent=2)
+        f.write("\n")
+
+    baseline = None
+    if update_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+            f.write("\n")
+        print(f"--- Baseline aggiornata in {baseline_path} ---")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    else:
+        print(f"--- Nessuna baseline in {baseline_path}: usa --update-baseline per crearla ---")
+
+    regressions = compare_to_baseline(metrics, baseline, tolerance) if baseline else []
+    for name, metric in metrics.items():
+        line = f"{name:20s} {metric['value']:14,.1f} {metric['unit']}"
+        if baseline and name in baseline:
+            line += f"  (baseline {baseline[name]['value']:,.1f})"
+        if name in regressions:
+            line += "  REGRESSIONE"
+        print(line)
+    print(f"VecGameState con 1024 partite: {metrics['vec_speedup']['value']:.1f}x il ciclo scalare "
+          f"(obiettivo {VEC_TARGET_SPEEDUP}x)")
+    print(f"--- Risultati scritti in {output_path} ---")
+    return 0 if traces_ok and not vec_mismatches and not regressions else 1
+
+
+# --- CONFRONTO DEI PERCORSI DEL LEARNER ---
+
+# (nome, compile_mode, bf16): il primo è il riferimento eager float32
+LEARNER_VARIANTS = (
+    ("eager_fp32", None, False),
+    ("script_fp32", "script", False),
+    ("compile_fp32", "compile", False),
+    ("eager_bf16", None, True),
+    ("compile_bf16", "compile", True),
+)
+
+
+def train_and_evaluate(seed, num_episodes, eval_games, compile_mode=None, bf16=False, action_masking=False,
+                       game_out=None):
+    # Addestra da zero con lo stesso seed e valuta in greedy a ogni livello di difficoltà;
+    # game_out, se indicato, riceve l'istanza Game usata (statistiche per episodio)
+    from game import Game
+    from evaluation import DIFFICULTY_LEVELS, play_games, summarize
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "dqn_model.pth")
+        _seed_everything(seed)
+        game = Game(model_path=model_path, compile_mode=compile_mode, bf16=bf16, action_masking=action_masking)
+        start = time.perf_counter()
+        game.train(num_episodes)
+        elapsed = time.perf_counter() - start
+        results = [summarize(*play_games(model_path, level, eval_games, seed + 1000 * level,
+                                         action_masking=action_masking))
+                   for level in DIFFICULTY_LEVELS]
+    if game_out is not None:
+        game_out.append(game)
+    return elapsed, results
+
+
+def run_learner_comparison(num_episodes=500, eval_games=1000, output_path="bench_results.json",
+                           seed=0) -> int:
+    # Aggiornamenti/s su un buffer sintetico e winrate finale di ogni variante rispetto a
+    # eager float32; una variante è in parità se il suo winrate medio cade nell'intervallo
+    # di Wilson del riferimento
+    from evaluation import wilson_interval
+    state_size = observation_size(GameState().grid_size)
+    action_size = len(ActionType)
+    report = {}
+    for name, compile_mode, bf16 in LEARNER_VARIANTS:
+        print(f"--- Variante {name} ---")
+        updates_per_second = bench_learn(seed, state_size, action_size,
+                                         compile_mode=compile_mode, bf16=bf16)
+        elapsed, results = train_and_evaluate(seed, num_episodes, eval_games, compile_mode, bf16)
+        wins = sum(r["win_rate"] * r["games"] for r in results)
+        games = sum(r["games"] for r in results)
+        report[name] = {"updates_per_second": updates_per_second, "train_seconds": elapsed,
+                        "win_rate": wins / games, "games": games, "results": results}
+
+    reference = report[LEARNER_VARIANTS[0][0]]
+    low, high = wilson_interval(round(reference["win_rate"] * reference["games"]), reference["games"])
+    print(f"{'Variante':14s} {'Agg./s':>10s} {'Speedup':>8s} {'Training':>10s} {'Winrate':>8s}")
+    for name, entry in report.items():
+        entry["speedup"] = entry["updates_per_second"] / reference["updates_per_second"]
+        entry["parity"] = low <= entry["win_rate"] <= high
+        print(f"{name:14s} {entry['updates_per_second']:10.1f} {entry['speedup']:7.2f}x "
+              f"{entry['train_seconds']:9.1f}s {entry['win_rate']:8.3f}"
+              + ("" if entry["parity"] else "  FUORI INTERVALLO"))
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"--- Risultati scritti in {output_path} ---")
+    return 0
+
+
+# --- AZIONI NON VALIDE CON E SENZA MASCHERA ---
+
+def run_action_mask_report(num_episodes=500, eval_games=1000, output_path="bench_results.json", seed=0) -> int:
+    # Quota di mosse non valide per episodio durante il training (media, mediana, 90° percentile,
+    # primo e ultimo quarto), in valutazione greedy e winrate, senza e con la maschera delle azioni
+    report = {}
+    for name, action_masking in (("unmasked", False), ("masked", True)):
+        print(f"--- Variante {name} ---")
+        trained = []
+        elapsed, results = train_and_evaluate(seed, num_episodes, eval_games, action_masking=action_masking,
+                                              game_out=trained)
+        rates = np.array(trained[0].invalid_action_rates)
+        quarter = max(len(rates) // 4, 1)
+        games = sum(r["games"] for r in results)
+        report[name] = {
+            "train_seconds": elapsed,
+            "train_invalid_mean": float(rates.mean()),
+            "train_invalid_p50": float(np.percentile(rates, 50)),
+            "train_invalid_p90": float(np.percentile(rates, 90)),
+            "train_invalid_first_quarter": float(rates[:quarter].mean()),
+            "train_invalid_last_quarter": float(rates[-quarter:].mean()),
+            "eval_invalid_rate": sum(r["invalid_action_rate"] * r["games"] for r in results) / games,
+            "win_rate": sum(r["win_rate"] * r["games"] for r in results) / games,
+            "results": results,
+        }
+    print(f"{'Variante':10s} {'Training':>10s} {'Non valide':>11s} {'1° quarto':>10s} {'Ultimo':>8s} "
+          f"{'Valutaz.':>9s} {'Winrate':>8s}")
+    for name, entry in report.items():
+        print(f"{name:10s} {entry['train_seconds']:9.1f}s {entry['train_invalid_mean']:11.1%} "
+              f"{entry['train_invalid_first_quarter']:10.1%} {entry['train_invalid_last_quarter']:8.1%} "
+              f"{entry['eval_invalid_rate']:9.1%} {entry['win_rate']:8.3f}")
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"--- Risultati scritti in {output_path} ---")
+    return 0
+
+
+# --- SCALABILITÀ RISPETTO ALLA GRIGLIA ---
+
+GRID_SIZES = (7, 15, 31, 63)
+
+
+def bench_env_steps(seed, grid_size, num_steps=50000):
+    # Passi dell'ambiente come nel ciclo di training: azione casuale e, dopo ogni mossa
+    # dell'IA, la sua osservazione dall'encoder incrementale
+    _seed_everything(seed)
+    game_state = GameState(grid_size)
+    game_state.initialize_game()
+    encoder = ObservationEncoder(grid_size)
+    actions = [ActionType(random.randrange(len(ActionType))) for _ in range(1024)]
+    start = time.perf_counter()
+    for step in range(num_steps):
+        if game_state.game_over:
+            game_state.initialize_game()
+            encoder.reset()
+        is_ai = game_state.current_player == 1
+        game_state.execute_action(actions[step & 1023])
+        if is_ai:
+            encoder.encode(game_state)
+    return num_steps / (time.perf_counter() - start)
+
+
+def run_grid_scaling(output_path="bench_results.json", grid_sizes=GRID_SIZES, seed=0) -> int:
+    # Step/s dell'ambiente e aggiornamenti/s della DQN (MLP e convoluzionale) per dimensione
+    # di griglia, con il rapporto rispetto alla griglia più piccola
+    action_size = len(ActionType)
+    report = {}
+    for grid_size in grid_sizes:
+        print(f"--- Griglia {grid_size}x{grid_size} ---")
+        state_size = observation_size(grid_size)
+        report[grid_size] = {
+            "cells": grid_size * grid_size,
+            "env_steps_per_second": bench_env_steps(seed, grid_size),
+            "mlp_updates_per_second": bench_learn(seed, state_size, action_size, num_updates=50,
+                                                  network='mlp', grid_size=grid_size),
+            "conv_updates_per_second": bench_learn(seed, state_size, action_size, num_updates=50,
+                                                   network='conv', grid_size=grid_size),
+        }
+
+    reference = report[grid_sizes[0]]
+    print(f"{'Griglia':>8s} {'Celle':>6s} {'Step/s':>10s} {'Rel.':>6s} {'MLP agg./s':>11s} {'Conv agg./s':>12s}")
+    for grid_size, entry in report.items():
+        entry["env_steps_relative"] = entry["env_steps_per_second"] / reference["env_steps_per_second"]
+        print(f"{grid_size:>6d}x{grid_size:<1d} {entry['cells']:>6d} {entry['env_steps_per_second']:10,.0f} "
+              f"{entry['env_steps_relative']:5.2f}x {entry['mlp_updates_per_second']:11.1f} "
+              f"{entry['conv_updates_per_second']:12.1f}")
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"--- Risultati scritti in {output_path} ---")
+    return 0
@@ -0,0 +1,226 @@
+import copy
+import random
+import time
+from typing import Optional, Tuple
+
+from game_logic import GameState, BuffToken, BuffType, ActionType, get_visibility_table
+
+# --- MASCHERE PRECALCOLATE ---
+
+# Ogni insieme di celle è un intero Python (a precisione arbitraria, quindi per qualsiasi
+# dimensione di griglia) con il bit (y - 1) * grid_size + (x - 1) associato alla cella (x, y)
+BUFF_TYPES = list(BuffType)
+
+
+class _LazyMasks(dict):
+    # Maschere calcolate al primo accesso: sulle griglie grandi se ne usa solo una piccola parte
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, key):
+        mask = self[key] = self.build(key)
+        return mask
+
+
+class BoardMasks:
+    # Maschere di una dimensione di griglia: adiacenza, allineamento e visibilità per cella
+    def __init__(self, grid_size: int):
+        self.grid_size = grid_size
+        self.num_cells = grid_size * grid_size
+        self.full_board = (1 << self.num_cells) - 1
+        self.neighbors = _LazyMasks(self._neighbor_mask)
+        self.rays = _LazyMasks(self._ray_mask)
+        self.vision = _LazyMasks(self._vision_mask)
+
+    def cell_index(self, x: int, y: int) -> int:
+        return (y - 1) * self.grid_size + (x - 1)
+
+    def cell_position(self, index: int) -> Tuple[int, int]:
+        return index % self.grid_size + 1, index // self.grid_size + 1
+
+    def _cells_mask(self, cells) -> int:
+        mask = 0
+        for x, y in cells:
+            mask |= 1 << self.cell_index(x, y)
+        return mask
+
+    def _neighbor_mask(self, index: int) -> int:
+        # Celle ortogonalmente adiacenti (bersagli validi per ATTACK)
+        x0, y0 = self.cell_position(index)
+        return self._cells_mask((x0 + dx, y0 + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))
+                                if 1 <= x0 + dx <= self.grid_size and 1 <= y0 + dy <= self.grid_size)
+
+    def _ray_mask(self, index: int) -> int:
+        # Celle sulla stessa riga, colonna o diagonale (bersagli validi per FREEZE), percorrendo
+        # gli otto raggi dalla cella: costo proporzionale al lato, non all'area
+        x0, y0 = self.cell_position(index)
+        mask = 1 << index
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)):
+            x, y = x0 + dx, y0 + dy
+            while 1 <= x <= self.grid_size and 1 <= y <= self.grid_size:
+                mask |= 1 << self.cell_index(x, y)
+                x, y = x + dx, y + dy
+        return mask
+
+    def _vision_mask(self, key) -> int:
+        # (x, y, raggio, direzione) -> bitboard delle celle visibili, dalla tabella di GameState
+        return self._cells_mask(get_visibility_table(self.grid_size)[key][0])
+
+
+_BOARD_MASKS = {}
+
+
+def get_board_masks(grid_size: int) -> BoardMasks:
+    masks = _BOARD_MASKS.get(grid_size)
+    if masks is None:
+        masks = _BOARD_MASKS[grid_size] = BoardMasks(grid_size)
+    return masks
+
+
+# --- STATO DI GIOCO SU BITBOARD ---
+
+class BitboardGameState(GameState):
+    # Variante opzionale di GameState con le stesse regole: i controlli di adiacenza,
+    # allineamento e occupazione usano bitboard e maschere precalcolate, la comparsa dei buff
+    # delega a GameState. Non è più veloce del riferimento (vedi benchmark in fondo al modulo):
+    # serve come seconda implementazione verificata (verify_against_reference e tracce di
+    # riferimento) e fornisce le bitboard di occupazione e visibilità a chi fa ricerca.
+    # Partecipanti e buff restano oggetti, quindi renderer e osservazioni funzionano invariati.
+    def __init__(self, grid_size: int = 7, rng: Optional[random.Random] = None):
+        super().__init__(grid_size, rng)
+        self.masks = get_board_masks(grid_size)
+        self.buff_board = 0
+
+    def initialize_game(self):
+        super().initialize_game()
+        self.buff_board = 0
+
+    def load_state(self, game_state: GameState):
+        # Copia uno stato qualsiasi (anche scalare) ricostruendo la bitboard dei buff
+        self.grid_size = game_state.grid_size
+        self.masks = get_board_masks(self.grid_size)
+        self.turn = game_state.turn
+        self.current_player = game_state.current_player
+        self.human = copy.copy(game_state.human)
+        self.ai = copy.copy(game_state.ai)
+        self.buffs = [copy.copy(buff) for buff in game_state.buffs]
+        self.game_over = game_state.game_over
+        self.winner = game_state.winner
+        self.last_action_valid = game_state.last_action_valid
+        self.max_turns = game_state.max_turns
+        self._rebuild_buff_board()
+
+    def restore(self, data: bytes):
+        super().restore(data)
+        if self.masks.grid_size != self.grid_size:
+            self.masks = get_board_masks(self.grid_size)
+        self._rebuild_buff_board()
+
+    def _rebuild_buff_board(self):
+        g = self.grid_size
+        board = 0
+        for buff in self.buffs:
+            board |= 1 << (buff.y - 1) * g + buff.x - 1
+        self.buff_board = board
+
+    def get_occupancy(self) -> int:
+        # Bitboard delle celle occupate da partecipanti o buff
+        g = self.grid_size
+        return (self.buff_board | 1 << (self.human.y - 1) * g + self.human.x - 1
+                | 1 << (self.ai.y - 1) * g + self.ai.x - 1)
+
+    def get_visibility_board(self, participant) -> int:
+        return self.masks.vision[self.get_visibility_key(participant)]
+
+    def is_adjacent(self, pos1: Tuple[int, int], pos2: Tuple[int, int]) -> bool:
+        masks = self.masks
+        return masks.neighbors[masks.cell_index(*pos1)] >> masks.cell_index(*pos2) & 1 == 1
+
+    def is_aligned(self, pos1: Tuple[int, int], pos2: Tuple[int, int]) -> bool:
+        masks = self.masks
+        return masks.rays[masks.cell_index(*pos1)] >> masks.cell_index(*pos2) & 1 == 1
+
+    def take_buff_at(self, x: int, y: int) -> Optional[BuffToken]:
+        # La bitboard scarta subito le celle senza buff (il caso comune)
+        bit = 1 << (y - 1) * self.grid_size + x - 1
+        if not self.buff_board & bit:
+            return None
+        self.buff_board &= ~bit
+        return super().take_buff_at(x, y)
+
+    def spawn_buff(self):
+        # Stessa estrazione di GameState (l'ordine delle celle libere fa parte delle regole):
+        # la bitboard dei buff registra soltanto la cella del nuovo buff
+        count = len(self.buffs)
+        super().spawn_buff()
+        if len(self.buffs) > count:
+            buff = self.buffs[-1]
+            self.buff_board |= 1 << (buff.y - 1) * self.grid_size + buff.x - 1
+
+    def expire_buffs(self):
+        super().expire_buffs()
+        self._rebuild_buff_board()
+
+
+# --- VERIFICA E BENCHMARK ---
+
+def _snapshot(game_state: GameState) -> tuple:
+    # Tutto lo stato confrontabile, con i buff ordinati per posizione
+    participants = tuple(
+        (p.x, p.y, p.hp, p.armor, p.vision_duration, p.freeze_status,
+         p.freeze_attack_count, p.last_movement_direction)
+        for p in (game_state.human, game_state.ai))
+    buffs = tuple(sorted((b.x, b.y, b.buff_type.value, b.duration) for b in game_state.buffs))
+    return (participants, buffs, game_state.turn, game_state.current_player,
+            game_state.game_over, game_state.winner, game_state.last_action_valid)
+
+
+def verify_against_reference(num_steps: int = 100000, seed: int = 0) -> int:
+    # Esegue la stessa azione casuale su GameState e BitboardGameState partendo dallo stesso
+    # stato e dallo stesso stato del generatore random, e confronta tutto il risultato
+    # (comparsa dei buff compresa). Restituisce le discrepanze.
+    random.seed(seed)
+    reference = GameState()
+    reference.initialize_game()
+    board = BitboardGameState()
+    mismatches = 0
+    for _ in range(num_steps):
+        if reference.game_over:
+            reference.initialize_game()
+        board.load_state(reference)
+        action = ActionType(random.randrange(len(ActionType)))
+        rng_state = random.getstate()
+        result = reference.execute_action(action)
+        random.setstate(rng_state)
+        if board.execute_action(action) != result:
+            mismatches += 1
+            continue
+        # La bitboard dei buff deve restare coerente con la lista dei buff
+        buff_board = board.buff_board
+        board._rebuild_buff_board()
+        if _snapshot(reference) != _snapshot(board) or buff_board != board.buff_board:
+            mismatches += 1
+    return mismatches
+
+
+def benchmark(engine_class, num_steps: int = 200000, seed: int = 0) -> float:
+    # Passi di gioco al secondo con azioni casuali e reset automatico
+    random.seed(seed)
+    game_state = engine_class()
+    game_state.initialize_game()
+    actions = [ActionType(random.randrange(len(ActionType))) for _ in range(1024)]
+    start = time.perf_counter()
+    for step in range(num_steps):
+        if game_state.game_over:
+            game_state.initialize_game()
+        game_state.execute_action(actions[step & 1023])
+    return num_steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"Discrepanze rispetto a GameState: {verify_against_reference()}")
+    reference_rate = benchmark(GameState)
+    board_rate = benchmark(BitboardGameState)
+    print(f"GameState:         {reference_rate:,.0f} step/s")
+    print(f"BitboardGameState: {board_rate:,.0f} step/s ({board_rate / reference_rate:.2f}x)")
@@ -0,0 +1,150 @@
+import copy
+import os
+import random
+import shutil
+import threading
+import time
+
+import numpy as np
+import torch
+
+from dqn_agent import PrioritizedReplayBuffer
+
+
+def _clone_state_dict(state_dict):
+    return {key: value.detach().clone() for key, value in state_dict.items()}
+
+
+def snapshot_training_state(agent, scheduler=None, episode=0):
+    # Copia coerente di tutto lo stato del training, presa nel thread del training:
+    # dopo questa chiamata il learner può proseguire mentre il salvataggio avviene altrove
+    buffer = agent.replay_buffer
+    meta = {
+        "episode": episode,
+        "time": time.time(),
+        "policy_net": _clone_state_dict(agent.policy_net.state_dict()),
+        "target_net": _clone_state_dict(agent.target_net.state_dict()),
+        "optimizer": copy.deepcopy(agent.optimizer.state_dict()),
+        "steps_done": agent.steps_done,
+        "updates_done": agent.updates_done,
+        "replay": {"layout": buffer.LAYOUT, "capacity": buffer.capacity,
+                   **{counter: getattr(buffer, counter) for counter in buffer.COUNTERS}},
+        "rng": {"python": random.getstate(), "numpy": np.random.get_state(),
+                "torch": torch.get_rng_state()},
+    }
+    if scheduler is not None:
+        meta["scheduler"] = {"env_steps": scheduler.env_steps, "credit": scheduler.credit}
+    # Campi del replay buffer (dipendono dalla disposizione), salvati come file .npy
+    arrays = {field: getattr(buffer, field)[:rows].copy() for field, rows in buffer.stored_fields()}
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        meta["replay"]["max_priority"] = buffer.max_priority
+        arrays["priorities"] = buffer.tree.priorities(np.arange(buffer.size))
+    return meta, arrays
+
+
+def restore_training_state(agent, directory, scheduler=None) -> int:
+    # Ripristina reti, ottimizzatore, contatori, RNG e replay buffer; restituisce l'episodio
+    meta = torch.load(os.path.join(directory, "state.pt"), map_location=agent.device, weights_only=False)
+    agent.policy_net.load_state_dict(meta["policy_net"])
+    agent.target_net.load_state_dict(meta["target_net"])
+    agent.optimizer.load_state_dict(meta["optimizer"])
+    agent.steps_done = meta["steps_done"]
+    agent.updates_done = meta["updates_done"]
+
+    buffer = agent.replay_buffer
+    replay = meta["replay"]
+    if replay["capacity"] != buffer.capacity:
+        raise ValueError(f"Checkpoint replay capacity {replay['capacity']} "
+                         f"does not match buffer capacity {buffer.capacity}")
+    # I checkpoint precedenti alla memoria compatta non registrano la disposizione
+    layout = replay.get("layout", "dense")
+    if layout != buffer.LAYOUT:
+        raise ValueError(f"Checkpoint replay layout '{layout}' does not match buffer layout '{buffer.LAYOUT}'")
+    for counter in buffer.COUNTERS:
+        setattr(buffer, counter, replay[counter])
+    size = buffer.size
+    for field, rows in buffer.stored_fields():
+        stored = np.load(os.path.join(directory, f"{field}.npy"), mmap_mode='r')
+        getattr(buffer, field)[:rows] = stored
+    if isinstance(buffer, PrioritizedReplayBuffer):
+        priorities = os.path.join(directory, "priorities.npy")
+        if os.path.exists(priorities):
+            buffer.tree.update(np.arange(size), np.load(priorities))
+            buffer.max_priority = replay["max_priority"]
+        else:
+            # Checkpoint da buffer uniforme: tutte le transizioni partono alla priorità massima
+            buffer.tree.update(np.arange(size), buffer.max_priority ** buffer.alpha)
+
+    if scheduler is not None and "scheduler" in meta:
+        scheduler.env_steps = meta["scheduler"]["env_steps"]
+        scheduler.credit = meta["scheduler"]["credit"]
+    random.setstate(meta["rng"]["python"])
+    np.random.set_state(meta["rng"]["numpy"])
+    torch.set_rng_state(meta["rng"]["torch"])
+    return meta["episode"]
+
+
+class CheckpointManager:
+    # Salvataggi completi e asincroni: snapshot nel thread del training, scrittura in un
+    # thread di background su una cartella temporanea rinominata atomicamente, rotazione
+    # delle cartelle più vecchie oltre keep
+    def __init__(self, directory="checkpoints", keep=3):
+        # Almeno un checkpoint: con keep=0 la rotazione non avrebbe nulla da cui riprendere
+        if keep < 1:
+            raise ValueError(f"keep must be at least 1, got {keep}")
+        self.directory = directory
+        self.keep = keep
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, agent, scheduler=None, episode=0):
+        meta, arrays = snapshot_training_state(agent, scheduler, episode)
+        # Al più una scrittura in corso: limita la memoria occupata dagli snapshot
+        self.wait()
+        self.thread = threading.Thread(target=self._write, args=(meta, arrays, episode))
+        self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _write(self, meta, arrays, episode):
+        name = f"ckpt-{episode:08d}"
+        final = os.path.join(self.directory, name)
+        temporary = os.path.join(self.directory, f".{name}.tmp")
+        try:
+            shutil.rmtree(temporary, ignore_errors=True)
+            os.makedirs(temporary)
+            for field, array in arrays.items():
+                np.save(os.path.join(temporary, f"{field}.npy"), array)
+            torch.save(meta, os.path.join(temporary, "state.pt"))
+            if os.path.exists(final):
+                shutil.rmtree(final)
+            os.rename(temporary, final)
+            self._rotate()
+        except OSError as error:
+            print(f"--- Checkpoint {name} non salvato: {error} ---")
+
+    def _rotate(self):
+        for name in self.list_checkpoints()[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def list_checkpoints(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("ckpt-"))
+
+    def latest(self):
+        names = self.list_checkpoints()
+        return os.path.join(self.directory, names[-1]) if names else None
+
+    def load_latest(self, agent, scheduler=None) -> int:
+        # Riprende dall'ultimo checkpoint completo; 0 se non ce ne sono
+        path = self.latest()
+        if path is None:
+            print(f"--- Nessun checkpoint in {self.directory}, avvio da zero ---")
+            return 0
+        start = time.perf_counter()
+        episode = restore_training_state(agent, path, scheduler)
+        print(f"--- Ripreso da {path} (episodio {episode}, {len(agent.replay_buffer)} transizioni) "
+              f"in {time.perf_counter() - start:.2f}s ---")
+        return episode
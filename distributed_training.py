@@ -0,0 +1,330 @@
+import multiprocessing as mp
+import queue
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+
+from dqn_agent import DQNAgent, UpdateScheduler, build_network, default_model_path, masked_argmax
+from game_logic import GameState, ActionType, ObservationEncoder, observation_size
+
+# --- CANALE DI TRANSIZIONI IN MEMORIA CONDIVISA ---
+
+# Campi di una transizione con forma (per transizione) e tipo, nell'ordine di Experience
+TRANSITION_FIELDS = (
+    ('state', 'obs', np.float32),
+    ('action', None, np.int64),
+    ('reward', None, np.float32),
+    ('next_state', 'obs', np.float32),
+    ('done', None, np.float32),
+)
+
+
+class TransitionChannel:
+    # Blocco di memoria condivisa diviso in slot da chunk_size transizioni:
+    # l'attore riempie uno slot libero, il learner lo copia nel replay buffer e lo restituisce
+    def __init__(self, num_slots, chunk_size, state_size, name=None):
+        self.num_slots = num_slots
+        self.chunk_size = chunk_size
+        self.state_size = state_size
+        shapes = []
+        nbytes = 0
+        for field, kind, dtype in TRANSITION_FIELDS:
+            shape = (num_slots, chunk_size, state_size) if kind == 'obs' else (num_slots, chunk_size)
+            shapes.append((field, shape, dtype, nbytes))
+            nbytes += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            # Gli attori (avviati con spawn) condividono il resource tracker del learner,
+            # che resta l'unico responsabile dell'unlink
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.arrays = {field: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                       for field, shape, dtype, offset in shapes}
+
+    def write(self, slot, chunk):
+        # Copia un chunk locale (dizionario di array) nello slot indicato
+        count = len(chunk['action'])
+        for field, array in self.arrays.items():
+            array[slot, :count] = chunk[field]
+        return count
+
+    def read(self, slot, count):
+        # Restituisce viste sulle prime count transizioni dello slot
+        return tuple(self.arrays[field][slot, :count] for field, _, _ in TRANSITION_FIELDS)
+
+    def close(self, unlink=False):
+        self.arrays = {}
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedWeights:
+    # Pesi della policy in un vettore float32 condiviso, con contatore di versione
+    def __init__(self, num_params, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=num_params * 4)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.vector = np.ndarray((num_params,), dtype=np.float32, buffer=self.shm.buf)
+
+    def publish(self, model, lock, version):
+        # Scrive i pesi correnti e incrementa la versione sotto lock
+        flat = torch.nn.utils.parameters_to_vector(model.parameters()).detach().cpu().numpy()
+        with lock:
+            self.vector[:] = flat
+            version.value += 1
+
+    def load_into(self, model, lock, version):
+        # Copia i pesi condivisi nel modello locale, restituendo la versione letta
+        with lock:
+            flat = torch.from_numpy(self.vector.copy())
+            current = version.value
+        torch.nn.utils.vector_to_parameters(flat, model.parameters())
+        return current
+
+    def close(self, unlink=False):
+        self.vector = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# --- PROCESSO ATTORE ---
+
+def actor_epsilon(actor_id, num_actors, base=0.4, alpha=7.0):
+    # Epsilon fisso per attore (schema Ape-X): esplorazione da base a quasi greedy
+    if num_actors == 1:
+        return base
+    return base ** (1 + alpha * actor_id / (num_actors - 1))
+
+
+def run_actor(actor_id, num_episodes, epsilon, seed, channel_name, weights_name,
+              num_slots, chunk_size, state_size, action_size,
+              ready_queue, free_queue, weights_lock, weights_version, action_masking=False,
+              grid_size=7, network='mlp'):
+    # Ogni attore usa un solo thread torch: il parallelismo viene dai processi
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    channel = TransitionChannel(num_slots, chunk_size, state_size, name=channel_name)
+    # Stessa architettura del learner, altrimenti i pesi condivisi non combaciano
+    policy = build_network(network, state_size, action_size, grid_size)
+    policy.eval()
+    weights = SharedWeights(sum(p.numel() for p in policy.parameters()), name=weights_name)
+    local_version = weights.load_into(policy, weights_lock, weights_version)
+
+    # Chunk locale riempito transizione per transizione e inviato quando pieno
+    chunk = {field: np.zeros((chunk_size, state_size) if kind == 'obs' else chunk_size, dtype=dtype)
+             for field, kind, dtype in TRANSITION_FIELDS}
+    filled = 0
+
+    def flush():
+        nonlocal filled
+        if filled == 0:
+            return
+        slot = free_queue.get()
+        count = channel.write(slot, {field: array[:filled] for field, array in chunk.items()})
+        ready_queue.put(('chunk', actor_id, slot, count))
+        filled = 0
+
+    game_state = GameState(grid_size)
+    encoder = ObservationEncoder(grid_size)
+    # Stesso curriculum di Game.train, calcolato sulla quota di episodi dell'attore
+    threshold = num_episodes / 4
+    update = threshold
+    difficulty = 1
+    for episode in range(num_episodes):
+        if episode >= threshold:
+            difficulty += 1
+            threshold += update
+
+        # Aggiorna la policy locale se il learner ha pubblicato nuovi pesi
+        if weights_version.value != local_version:
+            local_version = weights.load_into(policy, weights_lock, weights_version)
+
+        game_state.initialize_game()
+        encoder.reset()
+        state = encoder.encode(game_state)
+        while not game_state.game_over:
+            if game_state.current_player == 0:
+                game_state.execute_action(game_state.get_simple_opponent_action(difficulty * 0.1))
+            else:
+                legal_mask = game_state.legal_action_mask() if action_masking else None
+                if random.random() < epsilon:
+                    if legal_mask is None:
+                        action_idx = random.randrange(action_size)
+                    else:
+                        action_idx = int(random.choice(np.flatnonzero(legal_mask)))
+                else:
+                    with torch.no_grad():
+                        q_values = policy(torch.from_numpy(state).unsqueeze(0))
+                    if legal_mask is None:
+                        action_idx = q_values.argmax(1).item()
+                    else:
+                        action_idx = int(masked_argmax(q_values.numpy(), legal_mask[None])[0])
+                _, reward = game_state.execute_action(ActionType(action_idx))
+                next_state = encoder.encode(game_state)
+
+                chunk['state'][filled] = state
+                chunk['action'][filled] = action_idx
+                chunk['reward'][filled] = reward
+                chunk['next_state'][filled] = next_state
+                chunk['done'][filled] = game_state.game_over
+                filled += 1
+                if filled == chunk_size:
+                    flush()
+                state = next_state
+
+        ready_queue.put(('episode', actor_id, game_state.winner))
+
+    flush()
+    ready_queue.put(('done', actor_id))
+    channel.close()
+    weights.close()
+
+
+# --- PROCESSO LEARNER ---
+
+def train_distributed(num_episodes, num_actors, seed=0, sync_every=100,
+                      chunk_size=64, num_slots=4, model_path=None,
+                      evaluator=None, eval_every=0, prioritized=False, scheduler=None,
+                      target_sync=None, checkpoints=None, checkpoint_every=100, resume=False,
+                      compile_mode=None, bf16=False, compact_replay=False, replay_size=20000,
+                      action_masking=False, grid_size=7, network='mlp'):
+    print(f"--- Avvio addestramento distribuito: {num_episodes} episodi, {num_actors} attori ---")
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    state_size = observation_size(grid_size)
+    action_size = len(ActionType)
+    if model_path is None:
+        model_path = default_model_path(grid_size, network)
+    # Il learner possiede replay buffer, ottimizzatore e rete target
+    agent = DQNAgent(state_size, action_size, model_path=model_path, prioritized=prioritized,
+                     compile_mode=compile_mode, bf16=bf16, compact_replay=compact_replay,
+                     replay_size=replay_size, network=network, grid_size=grid_size)
+    if target_sync is not None:
+        agent.target_update_frequency = target_sync
+    # Gli aggiornamenti dovuti dipendono dai passi ricevuti dagli attori, non dai cicli del learner
+    if scheduler is None:
+        scheduler = UpdateScheduler()
+    # Ripresa: il learner ritrova buffer e ottimizzatore, gli attori giocano gli episodi mancanti
+    start_episode = 0
+    if resume and checkpoints is not None:
+        start_episode = checkpoints.load_latest(agent, scheduler)
+    remaining = max(0, num_episodes - start_episode)
+
+    ctx = mp.get_context('spawn')
+    ready_queue = ctx.Queue()
+    weights_lock = ctx.Lock()
+    weights_version = ctx.Value('i', 0, lock=False)
+    num_params = sum(p.numel() for p in agent.policy_net.parameters())
+    weights = SharedWeights(num_params)
+    weights.publish(agent.policy_net, weights_lock, weights_version)
+
+    channels, free_queues, actors = [], [], []
+    # Ripartisce gli episodi tra gli attori (i primi ricevono l'eventuale resto)
+    shares = [remaining // num_actors + (i < remaining % num_actors) for i in range(num_actors)]
+    for actor_id in range(num_actors):
+        channel = TransitionChannel(num_slots, chunk_size, state_size)
+        free_queue = ctx.Queue()
+        for slot in range(num_slots):
+            free_queue.put(slot)
+        epsilon = actor_epsilon(actor_id, num_actors)
+        process = ctx.Process(
+            target=run_actor,
+            args=(actor_id, shares[actor_id], epsilon, seed + 1 + actor_id, channel.name, weights.name,
+                  num_slots, chunk_size, state_size, action_size,
+                  ready_queue, free_queue, weights_lock, weights_version, action_masking,
+                  grid_size, network),
+            daemon=True)
+        process.start()
+        channels.append(channel)
+        free_queues.append(free_queue)
+        actors.append(process)
+        print(f"Attore {actor_id}: seed {seed + 1 + actor_id}, epsilon {epsilon:.3f}")
+
+    active = num_actors
+    finished = set()
+    episodes = start_episode
+    last_checkpoint = None
+    wins = 0
+    updates = 0
+    owed_updates = 0
+    env_steps = 0
+    start = time.perf_counter()
+    try:
+        while active > 0:
+            # Attende nuovi dati solo se non ci sono aggiornamenti da eseguire
+            block = owed_updates == 0
+            try:
+                message = ready_queue.get(timeout=0.1) if block else ready_queue.get_nowait()
+            except queue.Empty:
+                message = None
+
+            if message is not None:
+                kind, actor_id = message[0], message[1]
+                if kind == 'chunk':
+                    _, _, slot, count = message
+                    agent.replay_buffer.push_batch(*channels[actor_id].read(slot, count))
+                    free_queues[actor_id].put(slot)
+                    env_steps += count
+                    owed_updates += scheduler.on_env_steps(count)
+                elif kind == 'episode':
+                    episodes += 1
+                    wins += message[2] == 1
+                    if episodes % 100 == 0:
+                        elapsed = time.perf_counter() - start
+                        print(f"Episodio {episodes}/{num_episodes} completato. Winrate: {(wins / 100):.2f} "
+                              f"({env_steps / elapsed:.0f} step/s, {updates / elapsed:.1f} update/s)")
+                        wins = 0
+                        agent.save_model()
+                    # Checkpoint completo del learner scritto in background
+                    if checkpoints is not None and episodes % checkpoint_every == 0:
+                        checkpoints.save(agent, scheduler, episodes)
+                        last_checkpoint = episodes
+                    # Valutazione greedy del checkpoint in background, senza fermare il learner
+                    if evaluator is not None and eval_every and episodes % eval_every == 0:
+                        evaluator.submit(episodes, agent.policy_net)
+                elif kind == 'done':
+                    finished.add(actor_id)
+                    active -= 1
+            else:
+                # Un attore terminato con errore non invierà mai 'done': meglio fermarsi
+                # subito che attendere per sempre i suoi episodi
+                for actor_id, process in enumerate(actors):
+                    if actor_id not in finished and not process.is_alive() and process.exitcode != 0:
+                        raise RuntimeError(f"Attore {actor_id} terminato con exit code {process.exitcode}")
+
+            # Un aggiornamento dovuto per iterazione, così i messaggi degli attori restano serviti
+            if owed_updates > 0:
+                owed_updates -= 1
+                if agent.learn():
+                    updates += 1
+                    if updates % sync_every == 0:
+                        weights.publish(agent.policy_net, weights_lock, weights_version)
+    finally:
+        for process in actors:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for channel in channels:
+            channel.close(unlink=True)
+        weights.close(unlink=True)
+
+    print("--- Addestramento completato ---")
+    agent.save_model()
+    if checkpoints is not None:
+        # Il checkpoint finale manca solo se l'ultimo episodio non ne ha già scritto uno
+        if last_checkpoint != num_episodes:
+            checkpoints.save(agent, scheduler, num_episodes)
+        checkpoints.wait()
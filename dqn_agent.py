@@ -4,7 +4,9 @@ import torch.optim as optim
 import torch.nn.functional as F
 import numpy as np
 import random
-from collections import deque, namedtuple
+import hashlib
+from collections import namedtuple, OrderedDict
+from contextlib import nullcontext
 import os
 
 # Architettura DQN: rete MLP per mappare lo stato alle azioni
@@ -31,29 +33,460 @@ class DQN(nn.Module):
         return self.layer5(x)
 
 
+class ConvDQN(nn.Module):
+    # Variante convoluzionale per griglie di qualsiasi dimensione: i 4 canali per cella
+    # dell'osservazione passano per convoluzioni 3x3 (pesi indipendenti dalla griglia), due delle
+    # quali con stride 2 per contenere il costo sulle griglie grandi; un pooling adattivo riduce
+    # il risultato a 4x4 prima dell'MLP finale, che riceve anche le feature numeriche
+    def __init__(self, grid_size, output_size, channels=32, num_features=10):
+        super(ConvDQN, self).__init__()
+        self.grid_size = grid_size
+        self.conv1 = nn.Conv2d(4, channels // 2, kernel_size=3, padding=1)
+        self.conv2 = nn.Conv2d(channels // 2, channels, kernel_size=3, stride=2, padding=1)
+        self.conv3 = nn.Conv2d(channels, channels, kernel_size=3, stride=2, padding=1)
+        self.pool = nn.AdaptiveMaxPool2d(4)
+        self.layer1 = nn.Linear(channels * 16 + num_features, 256)
+        self.layer2 = nn.Linear(256, output_size)
+
+    def forward(self, x):
+        # Parte di griglia (y, x, canale) riordinata in (canale, y, x) per le convoluzioni
+        cells = self.grid_size * self.grid_size
+        grid = x[:, :cells * 4].reshape(-1, self.grid_size, self.grid_size, 4).permute(0, 3, 1, 2)
+        grid = F.relu(self.conv1(grid))
+        grid = F.relu(self.conv2(grid))
+        grid = F.relu(self.conv3(grid))
+        grid = self.pool(grid).flatten(1)
+        x = F.relu(self.layer1(torch.cat([grid, x[:, cells * 4:]], dim=1)))
+        return self.layer2(x)
+
+
+# Architetture disponibili per la DQN
+NETWORKS = ('mlp', 'conv')
+
+
+def build_network(network, state_size, action_size, grid_size=7):
+    # 'mlp' è la rete originale (dimensione dell'input fissata dalla griglia), 'conv' la variante
+    # convoluzionale, i cui pesi si possono riusare anche su griglie di dimensione diversa
+    if network == 'mlp':
+        return DQN(state_size, action_size)
+    if network == 'conv':
+        return ConvDQN(grid_size, action_size, num_features=state_size - grid_size * grid_size * 4)
+    raise ValueError(f"Unknown network: {network}")
+
+
+def default_model_path(grid_size=7, network='mlp'):
+    # Un file per configurazione: i pesi della MLP dipendono dalla dimensione della griglia
+    if grid_size == 7 and network == 'mlp':
+        return "dqn_model.pth"
+    return f"dqn_model_{network}_{grid_size}x{grid_size}.pth"
+
+
 # Replay buffer per memorizzare transizioni ed estrarre campioni non correlati
 Experience = namedtuple('Experience', ('state', 'action', 'reward', 'next_state', 'done'))
 
 class ReplayBuffer:
-    def __init__(self, capacity):
-        # Memoria con capacità massima per evitare consumo eccessivo di RAM
-        self.memory = deque([], maxlen=capacity)
+    # Disposizione della memoria e contatori, registrati nei checkpoint
+    LAYOUT = 'dense'
+    COUNTERS = ('position', 'size')
+
+    def __init__(self, capacity, state_size):
+        # Memoria circolare preallocata in array contigui: nessun oggetto Python per transizione
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        # Prossima posizione di scrittura e numero di transizioni memorizzate
+        self.position = 0
+        self.size = 0
+
+    def push(self, state, action, reward, next_state, done):
+        # Inserisce una nuova esperienza sovrascrivendo la più vecchia a buffer pieno
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
 
-    def push(self, *args):
-        # Inserisce una nuova esperienza nella memoria
-        self.memory.append(Experience(*args))
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        # Inserisce un batch di esperienze con un'unica scrittura vettoriale per array;
+        # se il batch supera la capacità si conservano solo le ultime transizioni
+        n = len(actions)
+        keep = min(n, self.capacity)
+        indices = (self.position + np.arange(n - keep, n)) % self.capacity
+        self.states[indices] = states[n - keep:]
+        self.actions[indices] = actions[n - keep:]
+        self.rewards[indices] = rewards[n - keep:]
+        self.next_states[indices] = next_states[n - keep:]
+        self.dones[indices] = dones[n - keep:]
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
 
     def sample(self, batch_size):
-        # Estrae un batch casuale per rompere la correlazione temporale tra transizioni
-        return random.sample(self.memory, batch_size)
+        # Estrae un batch casuale (con reinserimento, O(1) per campione) per rompere
+        # la correlazione temporale; restituisce array pronti per torch.from_numpy
+        indices = np.random.randint(0, self.size, size=batch_size)
+        return self.gather(indices)
+
+    def gather(self, indices):
+        # Transizioni agli indici indicati come Experience di array contigui
+        return Experience(self.states[indices], self.actions[indices], self.rewards[indices],
+                          self.next_states[indices], self.dones[indices])
+
+    def stored_fields(self):
+        # Array salvati nei checkpoint come (attributo, righe valide)
+        return [(field, self.size) for field in ('states', 'actions', 'rewards', 'next_states', 'dones')]
+
+    def memory_bytes(self):
+        return sum(getattr(self, field).nbytes for field, _ in self.stored_fields())
 
     def __len__(self):
-        return len(self.memory)
+        return self.size
+
+
+class CompactReplayBuffer(ReplayBuffer):
+    # Memoria compatta per le osservazioni del gioco: i canali della griglia (binari) sono
+    # impacchettati a bit, le feature numeriche (multipli di 1/3) quantizzate in un byte e ogni
+    # osservazione è memorizzata una volta sola: lo stato di una transizione è quasi sempre il
+    # next_state della precedente, e le transizioni conservano solo gli indici delle osservazioni.
+    # Lo spacchettamento avviene in modo vettoriale al campionamento e restituisce esattamente
+    # gli stessi float32 (~80 byte per transizione invece di ~1.6 KB con la griglia 7x7)
+    LAYOUT = 'compact'
+    COUNTERS = ('position', 'size', 'obs_position', 'obs_count')
+    FEATURE_SCALE = 3
+
+    def __init__(self, capacity, state_size, num_features=10):
+        self.capacity = capacity
+        self.state_size = state_size
+        self.num_bits = state_size - num_features
+        # Ogni transizione aggiunge al più due osservazioni: con 2 * capacity posti un'osservazione
+        # viene sovrascritta solo quando nessuna transizione in memoria la usa più
+        self.obs_capacity = 2 * capacity
+        self.grid_bits = np.zeros((self.obs_capacity, (self.num_bits + 7) // 8), dtype=np.uint8)
+        self.features = np.zeros((self.obs_capacity, num_features), dtype=np.uint8)
+        self.obs_position = 0
+        self.obs_count = 0
+        # Transizioni: indici delle osservazioni e campi scalari nel tipo più piccolo sufficiente
+        self.state_refs = np.zeros(capacity, dtype=np.int32)
+        self.next_state_refs = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.uint8)
+        self.position = 0
+        self.size = 0
+        # Indice e byte del next_state dell'ultima transizione inserita (None = nessuna)
+        self.last_next_ref = None
+        self.last_next_bytes = None
+
+    def encode(self, observations):
+        # (n, state_size) float -> bit della griglia e feature quantizzate
+        bits = np.packbits(observations[:, :self.num_bits] > 0.5, axis=1)
+        features = np.rint(observations[:, self.num_bits:] * self.FEATURE_SCALE).astype(np.uint8)
+        return bits, features
+
+    def decode(self, refs):
+        observations = np.empty((len(refs), self.state_size), dtype=np.float32)
+        observations[:, :self.num_bits] = np.unpackbits(self.grid_bits[refs], axis=1, count=self.num_bits)
+        observations[:, self.num_bits:] = self.features[refs]
+        observations[:, self.num_bits:] /= self.FEATURE_SCALE
+        return observations
+
+    def store_observations(self, bits, features):
+        # Scrive le osservazioni nei posti successivi dell'anello e ne restituisce gli indici
+        refs = (self.obs_position + np.arange(len(bits))) % self.obs_capacity
+        self.grid_bits[refs] = bits
+        self.features[refs] = features
+        self.obs_position = (self.obs_position + len(bits)) % self.obs_capacity
+        self.obs_count = min(self.obs_count + len(bits), self.obs_capacity)
+        return refs
+
+    def store_observation(self, observation):
+        # Versione per una sola osservazione, senza array temporanei per gli indici; l'assegnazione
+        # a uint8 tronca, quindi +0.5 arrotonda le feature (non negative)
+        ref = self.obs_position
+        self.grid_bits[ref] = np.packbits(observation[:self.num_bits] > 0.5)
+        self.features[ref] = observation[self.num_bits:] * self.FEATURE_SCALE + 0.5
+        self.obs_position = (ref + 1) % self.obs_capacity
+        self.obs_count = min(self.obs_count + 1, self.obs_capacity)
+        return ref
+
+    def push(self, state, action, reward, next_state, done):
+        # Nel training lo stato è il next_state della transizione precedente: basta confrontarne i byte
+        if state.tobytes() == self.last_next_bytes:
+            state_ref = self.last_next_ref
+        else:
+            state_ref = self.store_observation(state)
+        next_ref = self.store_observation(next_state)
+        i = self.position
+        self.state_refs[i] = state_ref
+        self.next_state_refs[i] = next_ref
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.last_next_ref = next_ref
+        self.last_next_bytes = next_state.tobytes()
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        # Versione vettoriale: uno stato uguale al next_state della transizione precedente del
+        # batch (o dell'ultima inserita) non viene memorizzato di nuovo
+        n = len(actions)
+        keep = min(n, self.capacity)
+        skip = n - keep
+        state_bits, state_features = self.encode(np.asarray(states[skip:]))
+        next_bits, next_features = self.encode(np.asarray(next_states[skip:]))
+        shared = np.zeros(keep, dtype=bool)
+        shared[1:] = ((state_bits[1:] == next_bits[:-1]).all(axis=1)
+                      & (state_features[1:] == next_features[:-1]).all(axis=1))
+        shared[0] = skip == 0 and np.asarray(states[0], dtype=np.float32).tobytes() == self.last_next_bytes
+        # Sequenza delle osservazioni da scrivere: [stato se nuovo], next_state per ogni transizione
+        new_state = ~shared
+        counts = 1 + new_state
+        ends = np.cumsum(counts)
+        next_slots = ends - 1
+        order = np.empty(ends[-1], dtype=np.int64)
+        order[next_slots] = keep + np.arange(keep)
+        order[next_slots[new_state] - 1] = np.nonzero(new_state)[0]
+        bits = np.concatenate([state_bits, next_bits])[order]
+        features = np.concatenate([state_features, next_features])[order]
+        refs = self.store_observations(bits, features)
+        next_refs = refs[next_slots]
+        state_refs = np.empty(keep, dtype=np.int64)
+        state_refs[new_state] = refs[next_slots[new_state] - 1]
+        previous = np.concatenate([[self.last_next_ref or 0], next_refs[:-1]])
+        state_refs[shared] = previous[shared]
+
+        indices = (self.position + np.arange(skip, n)) % self.capacity
+        self.state_refs[indices] = state_refs
+        self.next_state_refs[indices] = next_refs
+        self.actions[indices] = actions[skip:]
+        self.rewards[indices] = rewards[skip:]
+        self.dones[indices] = dones[skip:]
+        self.last_next_ref = int(next_refs[-1])
+        self.last_next_bytes = np.asarray(next_states[-1], dtype=np.float32).tobytes()
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def gather(self, indices):
+        return Experience(self.decode(self.state_refs[indices]), self.actions[indices].astype(np.int64),
+                          self.rewards[indices], self.decode(self.next_state_refs[indices]),
+                          self.dones[indices].astype(np.float32))
+
+    def stored_fields(self):
+        return [('state_refs', self.size), ('next_state_refs', self.size), ('actions', self.size),
+                ('rewards', self.size), ('dones', self.size),
+                ('grid_bits', self.obs_count), ('features', self.obs_count)]
+
+
+# Sum-tree in array: ogni nodo interno contiene la somma delle priorità dei figli,
+# così campionamento proporzionale e aggiornamenti costano O(log n)
+class SumTree:
+    def __init__(self, capacity):
+        # Numero di foglie arrotondato alla potenza di 2 successiva: foglie in [size, 2 * size)
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.depth = self.size.bit_length() - 1
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, priorities):
+        # Aggiornamento batch: scrive le foglie e ricalcola i soli antenati toccati, livello per livello
+        nodes = np.asarray(indices, dtype=np.int64) + self.size
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        # Discesa vettoriale dalla radice: per ogni valore cumulativo trova la foglia corrispondente
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values > left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.size
+
+    def priorities(self, indices):
+        return self.tree[np.asarray(indices) + self.size]
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    # Replay con priorità proporzionale all'errore TD: le transizioni informative
+    # (uccisioni, freeze riusciti, buff raccolti) vengono rivisitate più spesso
+    def __init__(self, capacity, state_size, alpha=0.6, eps=1e-5):
+        super().__init__(capacity, state_size)
+        self.tree = SumTree(capacity)
+        # alpha regola quanto la priorità influisce sul campionamento (0 = uniforme)
+        self.alpha = alpha
+        self.eps = eps
+        # Le nuove transizioni ricevono la priorità massima vista, per essere campionate almeno una volta
+        self.max_priority = 1.0
+
+    def push(self, state, action, reward, next_state, done):
+        index = self.position
+        super().push(state, action, reward, next_state, done)
+        self.tree.update([index], self.max_priority ** self.alpha)
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        n = len(actions)
+        keep = min(n, self.capacity)
+        indices = (self.position + np.arange(n - keep, n)) % self.capacity
+        super().push_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(indices, self.max_priority ** self.alpha)
+
+    def sample(self, batch_size, beta=0.4):
+        # Campionamento stratificato: un valore casuale in ciascuno di batch_size segmenti di uguale massa
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        indices = np.minimum(self.tree.find(values), self.size - 1)
+        # Pesi di importance sampling (N * P(i))^-beta, normalizzati sul massimo del batch
+        probabilities = self.tree.priorities(indices) / total
+        weights = (self.size * probabilities) ** -beta
+        weights = (weights / weights.max()).astype(np.float32)
+        return self.gather(indices), indices, weights
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self.alpha)
+
+
+class CompactPrioritizedReplayBuffer(PrioritizedReplayBuffer, CompactReplayBuffer):
+    # Replay prioritizzato sulla memoria compatta: priorità dal sum-tree, dati da CompactReplayBuffer
+    pass
+
+
+# Scheduler degli aggiornamenti: separa il passo dell'ambiente dall'apprendimento
+class UpdateScheduler:
+    def __init__(self, train_every=1, gradient_steps=1, replay_ratio=None, warmup_steps=0):
+        # Ogni train_every passi dell'ambiente esegue gradient_steps aggiornamenti;
+        # in alternativa replay_ratio fissa gli aggiornamenti per passo (anche frazionari)
+        self.train_every = train_every
+        self.gradient_steps = gradient_steps
+        self.replay_ratio = replay_ratio
+        # Nessun aggiornamento nei primi warmup_steps passi (solo riempimento del buffer)
+        self.warmup_steps = warmup_steps
+        self.env_steps = 0
+        self.credit = 0.0
+
+    def on_env_steps(self, count=1):
+        # Registra count passi dell'ambiente e restituisce quanti aggiornamenti eseguire ora
+        previous = self.env_steps
+        self.env_steps += count
+        eligible = self.env_steps - max(previous, self.warmup_steps)
+        if eligible <= 0:
+            return 0
+        if self.replay_ratio is not None:
+            self.credit += eligible * self.replay_ratio
+            updates = int(self.credit)
+            self.credit -= updates
+            return updates
+        # Numero di multipli di train_every attraversati dopo il warmup
+        start = max(previous, self.warmup_steps)
+        boundaries = self.env_steps // self.train_every - start // self.train_every
+        return boundaries * self.gradient_steps
 
 
 # Agente DQN: gestisce esplorazione, apprendimento e inferenza
+class QValueCache:
+    # Cache LRU dei valori Q per l'inferenza greedy: la chiave è l'hash dei byte dell'osservazione.
+    # I contatori di versione dei parametri cambiano a ogni modifica in-place dei pesi
+    # (passo dell'ottimizzatore, load_state_dict, ricaricamento a caldo): quando cambiano
+    # la cache viene svuotata automaticamente
+    def __init__(self, network, forward=None, capacity=65536):
+        self.network = network
+        self.forward = forward or network
+        # Elenco dei parametri fissato una volta: load_state_dict li aggiorna in-place
+        self.parameters = list(network.parameters())
+        self.device = self.parameters[0].device
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.weights_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def check_weights(self):
+        version = tuple(param._version for param in self.parameters)
+        if version != self.weights_version:
+            self.entries.clear()
+            self.weights_version = version
+
+    def q_values(self, observations: np.ndarray) -> np.ndarray:
+        # Valori Q per un batch (B, state_size) con un solo forward per le osservazioni mancanti
+        self.check_weights()
+        observations = np.ascontiguousarray(observations, dtype=np.float32)
+        keys = [hashlib.blake2b(row.tobytes(), digest_size=16).digest() for row in observations]
+        rows = [self.entries.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        for key, row in zip(keys, rows):
+            if row is not None:
+                self.entries.move_to_end(key)
+        if missing:
+            with torch.no_grad():
+                batch = torch.from_numpy(observations[missing]).to(self.device)
+                computed = self.forward(batch).float().cpu().numpy()
+            for i, row in zip(missing, computed):
+                rows[i] = row
+                self.entries[keys[i]] = row
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return np.stack(rows)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def masked_argmax(q_values: np.ndarray, legal_masks=None) -> np.ndarray:
+    # Argmax per riga di (B, azioni); le azioni escluse da legal_masks valgono -inf
+    if legal_masks is None:
+        return q_values.argmax(1)
+    return np.where(legal_masks, q_values, -np.inf).argmax(1)
+
+
+# Modalità di compilazione della rete: eager (nessuna), torch.compile o TorchScript
+COMPILE_MODES = ('none', 'compile', 'script')
+
+
+def compile_network(network, mode):
+    # Restituisce un callable che condivide i parametri di network: state_dict, ottimizzatore
+    # e checkpoint continuano a usare il modulo originale
+    if mode in (None, 'none'):
+        return network
+    if mode == 'compile':
+        return torch.compile(network)
+    if mode == 'script':
+        return torch.jit.script(network)
+    raise ValueError(f"Unknown compile mode: {mode}")
+
+
+def configure_threads(intra_op=0, inter_op=0):
+    # Thread di torch per le operazioni (intra-op) e tra operazioni indipendenti (inter-op);
+    # 0 lascia il default. inter_op va impostato prima di qualsiasi lavoro parallelo
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        torch.set_num_interop_threads(inter_op)
+
+
 class DQNAgent:
-    def __init__(self, state_size, action_size, model_path="dqn_model.pth"):
+    def __init__(self, state_size, action_size, model_path="dqn_model.pth", prioritized=False,
+                 compile_mode=None, bf16=False, q_cache_size=65536, network='mlp', grid_size=7,
+                 compact_replay=False, replay_size=20000):
         self.state_size = state_size
         self.action_size = action_size
         self.model_path = model_path
@@ -69,30 +502,74 @@ class DQNAgent:
         # Dimensione batch per gli aggiornamenti di rete
         self.batch_size = 128
         # Dimensione massima del replay buffer
-        self.replay_buffer_size = 20000
-        # Frequenza di aggiornamento della rete target per stabilizzare il training
+        self.replay_buffer_size = replay_size
+        # Frequenza di aggiornamento della rete target, in aggiornamenti del gradiente
         self.target_update_frequency = 1000
+        # Replay prioritizzato: beta cresce da beta_start a 1 in per_beta_updates aggiornamenti
+        self.prioritized = prioritized
+        self.per_beta_start = 0.4
+        self.per_beta_updates = 100000
+        # Aggiornamenti del gradiente eseguiti (indipendenti dalle azioni scelte)
+        self.updates_done = 0
+        # Cronometro per fase opzionale (instrumentation.PhaseTimer), None = nessuna misura
+        self.timer = None
 
         # Se disponibile, sfrutta GPU per velocizzare le operazioni tensoriali
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f"Using device: {self.device}")
 
-        # Reti di policy e target
-        self.policy_net = DQN(state_size, action_size).to(self.device)
-        self.target_net = DQN(state_size, action_size).to(self.device)
+        # Reti di policy e target (MLP o convoluzionale, vedi build_network)
+        self.network = network
+        self.grid_size = grid_size
+        self.policy_net = build_network(network, state_size, action_size, grid_size).to(self.device)
+        self.target_net = build_network(network, state_size, action_size, grid_size).to(self.device)
         # Carica modello preesistente se presente
         self.load_model()
         # Inizializza la rete target con gli stessi pesi della rete policy
         self.target_net.load_state_dict(self.policy_net.state_dict())
         self.target_net.eval()
+        # Percorso veloce opzionale: forward compilati e autocast bfloat16 (solo su CPU)
+        self.compile_mode = compile_mode
+        self.policy_forward = compile_network(self.policy_net, compile_mode)
+        self.target_forward = compile_network(self.target_net, compile_mode)
+        self.bf16 = bf16 and self.device.type == "cpu"
+        # Cache dei valori Q per le scelte greedy senza esplorazione (0 = disattivata)
+        self.q_cache = QValueCache(self.policy_net, self.greedy_forward, q_cache_size) if q_cache_size > 0 else None
 
         # Ottimizzatore per la rete policy
         self.optimizer = optim.Adam(self.policy_net.parameters(), lr=self.learning_rate)
-        # Buffer per memorizzare esperienze
-        self.replay_buffer = ReplayBuffer(self.replay_buffer_size)
+        # Buffer per memorizzare esperienze (uniforme o prioritizzato, denso o compatto)
+        self.compact_replay = compact_replay
+        if prioritized:
+            buffer_class = CompactPrioritizedReplayBuffer if compact_replay else PrioritizedReplayBuffer
+        else:
+            buffer_class = CompactReplayBuffer if compact_replay else ReplayBuffer
+        self.replay_buffer = buffer_class(self.replay_buffer_size, state_size)
         self.steps_done = 0
 
-    def get_action(self, state, is_training=True):
+    def autocast(self):
+        # Contesto di autocast bfloat16 per i forward; nullo sul percorso float32
+        if self.bf16:
+            return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+        return nullcontext()
+
+    def greedy_forward(self, state_tensor):
+        with self.autocast():
+            return self.policy_forward(state_tensor)
+
+    def get_greedy_actions(self, states: np.ndarray, legal_masks=None) -> np.ndarray:
+        # Azioni greedy per un batch di osservazioni, passando dalla cache se attiva;
+        # con legal_masks (B, azioni) l'argmax considera solo le azioni legali
+        if self.q_cache is not None:
+            q_values = self.q_cache.q_values(states)
+        else:
+            with torch.no_grad():
+                state_tensor = torch.as_tensor(states, dtype=torch.float32, device=self.device)
+                q_values = self.greedy_forward(state_tensor).float().cpu().numpy()
+        return masked_argmax(q_values, legal_masks)
+
+    def get_action(self, state, is_training=True, legal_mask=None):
+        # legal_mask (es. GameState.legal_action_mask) limita esplorazione e argmax alle azioni legali
         # Calcola epsilon corrente con decadimento esponenziale
         epsilon = self.epsilon_end + (self.epsilon_start - self.epsilon_end) * \
                   np.exp(-1. * self.steps_done / self.epsilon_decay)
@@ -100,57 +577,107 @@ class DQNAgent:
 
         # Esplora con probabilità epsilon durante il training, altrimenti sfrutta la policy appresa
         if is_training and random.random() < epsilon:
-            return random.randrange(self.action_size)
+            if legal_mask is None:
+                return random.randrange(self.action_size)
+            return int(random.choice(np.flatnonzero(legal_mask)))
+        elif not is_training and self.q_cache is not None:
+            # Le osservazioni si ripetono spesso in partita: i valori Q arrivano dalla cache
+            q_values = self.q_cache.q_values(np.asarray(state)[None])
+            return int(masked_argmax(q_values, None if legal_mask is None else legal_mask[None])[0])
         else:
-            with torch.no_grad():
+            with torch.no_grad(), self.autocast():
                 # Prepara lo stato per la rete
-                state_tensor = torch.tensor(state, dtype=torch.float32, device=self.device).unsqueeze(0)
-                q_values = self.policy_net(state_tensor)
-                # Seleziona l'azione con il valore Q massimo
-                return q_values.max(1)[1].item()
+                state_tensor = torch.as_tensor(state, dtype=torch.float32, device=self.device).unsqueeze(0)
+                q_values = self.policy_forward(state_tensor)
+                # Seleziona l'azione con il valore Q massimo (tra quelle legali, se indicate)
+                if legal_mask is None:
+                    return q_values.max(1)[1].item()
+                return int(masked_argmax(q_values.float().cpu().numpy(), legal_mask[None])[0])
 
     def learn(self):
         # Attende di avere abbastanza esperienze prima di aggiornare la rete
         if len(self.replay_buffer) < self.batch_size:
-            return
+            return False
 
-        # Preleva un batch di esperienze
-        experiences = self.replay_buffer.sample(self.batch_size)
-        batch = Experience(*zip(*experiences))
+        # Preleva un batch di esperienze già impacchettato in array contigui
+        if self.prioritized:
+            beta = min(1.0, self.per_beta_start +
+                       (1.0 - self.per_beta_start) * self.updates_done / self.per_beta_updates)
+            batch, indices, weights = self.replay_buffer.sample(self.batch_size, beta)
+        else:
+            batch = self.replay_buffer.sample(self.batch_size)
+            weights = None
+        timer = self.timer
+        if timer is not None:
+            timer.mark("replay_sample")
+        td_errors = self.learn_batch(batch, weights)
+        if self.prioritized:
+            self.replay_buffer.update_priorities(indices, td_errors)
+            if timer is not None:
+                timer.mark("priorities")
+        return True
 
-        # Converte i dati in tensori per il calcolo
-        state_batch = torch.tensor(np.array(batch.state), dtype=torch.float32, device=self.device)
-        action_batch = torch.tensor(batch.action, dtype=torch.long, device=self.device).unsqueeze(1)
-        reward_batch = torch.tensor(batch.reward, dtype=torch.float32, device=self.device)
-        next_state_batch = torch.tensor(np.array(batch.next_state), dtype=torch.float32, device=self.device)
-        done_batch = torch.tensor(batch.done, dtype=torch.float32, device=self.device)
+    def learn_batch(self, batch, weights=None):
+        # Un aggiornamento del gradiente su un batch già pronto (dal replay buffer o da un
+        # dataset offline); con weights la loss è pesata per importance sampling.
+        # Restituisce gli errori TD del batch (per aggiornare le priorità) oppure None
+        self.updates_done += 1
+        timer = self.timer
 
-        # Calcola Q(s, a) per le azioni effettivamente eseguite
-        q_values = self.policy_net(state_batch).gather(1, action_batch)
+        # Converte i dati in tensori senza copie intermedie
+        state_batch = torch.from_numpy(batch.state).to(self.device)
+        action_batch = torch.from_numpy(batch.action).to(self.device).unsqueeze(1)
+        reward_batch = torch.from_numpy(batch.reward).to(self.device)
+        next_state_batch = torch.from_numpy(batch.next_state).to(self.device)
+        done_batch = torch.from_numpy(batch.done).to(self.device)
+        if timer is not None:
+            timer.mark("tensors")
 
-        # Calcola il valore target: r + gamma * max_a' Q_target(s', a') (senza gradiente)
-        next_q_values = self.target_net(next_state_batch).max(1)[0].detach()
+        # Calcola Q(s, a) per le azioni effettivamente eseguite e il valore target
+        # r + gamma * max_a' Q_target(s', a') (senza gradiente); con bf16 solo i forward
+        # sono in precisione ridotta, loss e target restano in float32
+        with self.autocast():
+            q_values = self.policy_forward(state_batch).gather(1, action_batch).float()
+            with torch.no_grad():
+                next_q_values = self.target_forward(next_state_batch).max(1)[0].float()
         expected_q_values = reward_batch + (self.gamma * next_q_values * (1 - done_batch))
 
         # Loss Huber per robustezza a outlier nelle ricompense
-        loss = F.smooth_l1_loss(q_values, expected_q_values.unsqueeze(1))
+        td_errors = None
+        if weights is not None:
+            # Ogni termine è pesato per correggere il bias del campionamento prioritizzato
+            losses = F.smooth_l1_loss(q_values, expected_q_values.unsqueeze(1), reduction='none').squeeze(1)
+            loss = (torch.from_numpy(weights).to(self.device) * losses).mean()
+            td_errors = (expected_q_values - q_values.squeeze(1)).detach().cpu().numpy()
+        else:
+            loss = F.smooth_l1_loss(q_values, expected_q_values.unsqueeze(1))
+        if timer is not None:
+            timer.mark("forward")
 
         # Backpropagation: azzera i gradienti, calcola e applica l'ottimizzazione
         self.optimizer.zero_grad()
         loss.backward()
-        # Clamping dei gradienti per evitare esplosione dei gradienti
-        for param in self.policy_net.parameters():
-            param.grad.data.clamp_(-1, 1)
+        # Clamping dei gradienti per evitare esplosione dei gradienti (un'unica operazione
+        # foreach su tutti i parametri invece di un clamp per parametro)
+        torch.nn.utils.clip_grad_value_(self.policy_net.parameters(), 1)
+        if timer is not None:
+            timer.mark("backward")
         self.optimizer.step()
 
-        # Ogni tot step, aggiorna la rete target per migliorare la stabilità
-        if self.steps_done % self.target_update_frequency == 0:
+        # Ogni tot aggiornamenti, sincronizza la rete target per migliorare la stabilità
+        if self.updates_done % self.target_update_frequency == 0:
             self.target_net.load_state_dict(self.policy_net.state_dict())
+        if timer is not None:
+            timer.mark("optimizer_step")
+        return td_errors
 
     def save_model(self):
-        # Salva i pesi della rete policy su file
+        # Salva i pesi della rete policy su file; scrittura su un file temporaneo e rinomina
+        # atomica, così chi ricarica il modello a caldo non legge mai un file a metà
         print("--- Saving model ---")
-        torch.save(self.policy_net.state_dict(), self.model_path)
+        temporary = f"{self.model_path}.tmp"
+        torch.save(self.policy_net.state_dict(), temporary)
+        os.replace(temporary, self.model_path)
 
     def load_model(self):
         # Se il file esiste, carica i pesi precedentemente salvati
@@ -159,3 +686,10 @@ class DQNAgent:
             self.policy_net.load_state_dict(torch.load(self.model_path, map_location=self.device))
         else:
             print("--- No model found, starting fresh ---")
+
+    def load_weights(self, state_dict):
+        # Sostituisce in-place i pesi della rete policy (i forward compilati li condividono);
+        # la cache dei valori Q si svuota perché cambiano le versioni dei parametri
+        self.policy_net.load_state_dict(state_dict)
+        if self.q_cache is not None:
+            self.q_cache.check_weights()
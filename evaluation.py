@@ -0,0 +1,218 @@
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import time
+
+import numpy as np
+import torch
+
+from dqn_agent import QValueCache, build_network, masked_argmax
+from game_logic import GameState, ActionType, ObservationEncoder, observation_size
+
+# Livelli di difficoltà dell'avversario semplice, come nel curriculum di Game.train
+DIFFICULTY_LEVELS = (1, 2, 3, 4)
+
+
+def wilson_interval(successes, trials, z=1.96):
+    # Intervallo di confidenza di Wilson (95% di default) per una proporzione
+    if trials == 0:
+        return (0.0, 0.0)
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+
+def load_policy(model_path, grid_size=7, network='mlp'):
+    # Carica i pesi greedy in una DQN su CPU, senza ottimizzatore né replay buffer;
+    # architettura e griglia devono essere quelle con cui il checkpoint è stato addestrato
+    policy = build_network(network, observation_size(grid_size), len(ActionType), grid_size)
+    policy.load_state_dict(torch.load(model_path, map_location="cpu"))
+    policy.eval()
+    return policy
+
+
+def play_games(model_path, level, num_games, seed, search_ms=0, parallel=64, action_masking=False,
+               grid_size=7, network='mlp'):
+    # Gioca num_games partite greedy contro l'avversario semplice; le partite avanzano
+    # a gruppi di parallel con un solo forward per tutte quelle in attesa dell'IA.
+    # Con search_ms > 0 ogni mossa dell'IA è invece scelta dalla ricerca a tempo;
+    # con action_masking l'argmax considera solo le azioni legali
+    torch.set_num_threads(1)
+    random.seed(seed)
+    policy = load_policy(model_path, grid_size, network)
+    # Le osservazioni si ripetono spesso (inizio partita, nebbia): forward solo per quelle nuove
+    q_cache = QValueCache(policy)
+    search = None
+    if search_ms > 0:
+        from search_agent import SearchAgent
+        search = SearchAgent(policy, time_budget=search_ms / 1000, seed=seed, grid_size=grid_size)
+    stats = {"games": 0, "wins": 0, "draws": 0, "losses": 0,
+             "half_turns": 0, "ai_actions": 0, "invalid_actions": 0,
+             "search_moves": 0, "search_nodes": 0, "search_seconds": 0.0, "search_depth": 0,
+             "q_cache_hits": 0, "q_cache_misses": 0}
+
+    started = 0
+    games = []
+    while started < num_games or games:
+        # Riempie i posti liberi con nuove partite
+        while started < num_games and len(games) < parallel:
+            game_state = GameState(grid_size)
+            game_state.initialize_game()
+            games.append((game_state, ObservationEncoder(game_state.grid_size)))
+            started += 1
+
+        # Turni dell'avversario fino al turno dell'IA o alla fine della partita
+        for game_state, _ in games:
+            while not game_state.game_over and game_state.current_player == 0:
+                game_state.execute_action(game_state.get_simple_opponent_action(level * 0.1))
+
+        waiting = [(game_state, encoder) for game_state, encoder in games
+                   if not game_state.game_over and game_state.current_player == 1]
+        if waiting:
+            if search is not None:
+                actions = []
+                for game_state, _ in waiting:
+                    actions.append(search.choose_action(game_state).value)
+                    stats["search_moves"] += 1
+                    stats["search_nodes"] += search.last_nodes
+                    stats["search_seconds"] += search.last_elapsed
+                    stats["search_depth"] += search.last_depth
+            else:
+                observations = np.stack([encoder.encode(game_state) for game_state, encoder in waiting])
+                legal_masks = None
+                if action_masking:
+                    legal_masks = np.stack([game_state.legal_action_mask() for game_state, _ in waiting])
+                actions = masked_argmax(q_cache.q_values(observations), legal_masks).tolist()
+            for (game_state, _), action_idx in zip(waiting, actions):
+                valid, _ = game_state.execute_action(ActionType(action_idx))
+                stats["ai_actions"] += 1
+                stats["invalid_actions"] += not valid
+
+        # Registra le partite concluse
+        remaining = []
+        for game_state, encoder in games:
+            if not game_state.game_over:
+                remaining.append((game_state, encoder))
+                continue
+            stats["games"] += 1
+            stats["half_turns"] += game_state.turn
+            if game_state.winner == 1:
+                stats["wins"] += 1
+            elif game_state.winner == -1:
+                stats["draws"] += 1
+            else:
+                stats["losses"] += 1
+        games = remaining
+    stats["q_cache_hits"] = q_cache.hits
+    stats["q_cache_misses"] = q_cache.misses
+    return level, stats
+
+
+def summarize(level, stats):
+    games = stats["games"]
+    summary = {"level": level, "difficulty": level * 0.1, "games": games}
+    for outcome, key in (("win", "wins"), ("draw", "draws"), ("loss", "losses")):
+        low, high = wilson_interval(stats[key], games)
+        summary[f"{outcome}_rate"] = stats[key] / games if games else 0.0
+        summary[f"{outcome}_ci95"] = [low, high]
+    summary["mean_half_turns"] = stats["half_turns"] / games if games else 0.0
+    summary["invalid_action_rate"] = (stats["invalid_actions"] / stats["ai_actions"]
+                                      if stats["ai_actions"] else 0.0)
+    lookups = stats["q_cache_hits"] + stats["q_cache_misses"]
+    summary["q_cache_hit_rate"] = stats["q_cache_hits"] / lookups if lookups else 0.0
+    if stats["search_moves"]:
+        summary["nodes_per_second"] = stats["search_nodes"] / stats["search_seconds"]
+        summary["mean_search_depth"] = stats["search_depth"] / stats["search_moves"]
+        summary["mean_search_ms"] = stats["search_seconds"] / stats["search_moves"] * 1000
+    return summary
+
+
+def evaluate(model_path="dqn_model.pth", games_per_level=1000, workers=None, seed=0,
+             levels=DIFFICULTY_LEVELS, chunk_games=250, search_ms=0, action_masking=False,
+             grid_size=7, network='mlp'):
+    # Distribuisce le partite di ogni livello in blocchi su un pool di processi; ogni blocco ha
+    # un seed proprio, senza sovrapposizioni tra livelli qualunque sia games_per_level
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for level in levels:
+        for offset in range(0, games_per_level, chunk_games):
+            count = min(chunk_games, games_per_level - offset)
+            tasks.append((model_path, level, count, seed + games_per_level * level + offset, search_ms, 64,
+                          action_masking, grid_size, network))
+
+    totals = {level: None for level in levels}
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers) as pool:
+        for level, stats in pool.starmap(play_games, tasks):
+            if totals[level] is None:
+                totals[level] = stats
+            else:
+                for key, value in stats.items():
+                    totals[level][key] += value
+    return [summarize(level, totals[level]) for level in levels]
+
+
+def print_report(results):
+    print(f"{'Livello':>7} {'Partite':>7} {'Vittorie':>22} {'Pareggi':>22} {'Sconfitte':>22} "
+          f"{'Mezzi-turni':>11} {'Invalide':>8}")
+    for r in results:
+        cells = [f"{r[f'{o}_rate']:.3f} [{r[f'{o}_ci95'][0]:.3f}, {r[f'{o}_ci95'][1]:.3f}]"
+                 for o in ("win", "draw", "loss")]
+        print(f"{r['level']:>7} {r['games']:>7} {cells[0]:>22} {cells[1]:>22} {cells[2]:>22} "
+              f"{r['mean_half_turns']:>11.1f} {r['invalid_action_rate']:>8.3f}")
+    hit_rate = sum(r["q_cache_hit_rate"] for r in results) / len(results)
+    print(f"Cache dei valori Q: {hit_rate:.1%} delle osservazioni senza forward")
+    for r in results:
+        if "nodes_per_second" in r:
+            print(f"Ricerca livello {r['level']}: {r['nodes_per_second']:,.0f} nodi/s, "
+                  f"profondità media {r['mean_search_depth']:.2f}, {r['mean_search_ms']:.1f} ms/mossa")
+
+
+# --- VALUTAZIONE IN BACKGROUND DURANTE IL TRAINING ---
+
+def _background_evaluation(snapshot_path, episode, log_path, games_per_level, workers, seed, action_masking,
+                           grid_size, network):
+    results = evaluate(snapshot_path, games_per_level, workers, seed, action_masking=action_masking,
+                       grid_size=grid_size, network=network)
+    with open(log_path, "a") as f:
+        f.write(json.dumps({"episode": episode, "time": time.time(), "results": results}) + "\n")
+    os.remove(snapshot_path)
+
+
+class BackgroundEvaluator:
+    # Valuta periodicamente i pesi correnti in un processo separato, così il learner non
+    # attende mai; se la valutazione precedente è ancora in corso si salta
+    def __init__(self, model_path, log_path="eval_log.jsonl", games_per_level=200,
+                 workers=1, seed=0, action_masking=False, grid_size=7, network='mlp'):
+        self.model_path = model_path
+        self.log_path = log_path
+        self.games_per_level = games_per_level
+        self.workers = workers
+        self.seed = seed
+        self.action_masking = action_masking
+        self.grid_size = grid_size
+        self.network = network
+        self.process = None
+
+    def submit(self, episode, policy_net):
+        if self.process is not None and self.process.is_alive():
+            return False
+        # Pesi della rete all'episodio indicato: il file del modello viene riscritto solo ogni
+        # 100 episodi, quindi copiarlo valuterebbe pesi più vecchi di quelli registrati nel log
+        snapshot_path = f"{self.model_path}.eval-{episode}"
+        torch.save(policy_net.state_dict(), snapshot_path)
+        ctx = mp.get_context("spawn")
+        self.process = ctx.Process(
+            target=_background_evaluation,
+            args=(snapshot_path, episode, self.log_path, self.games_per_level, self.workers, self.seed,
+                  self.action_masking, self.grid_size, self.network))
+        self.process.start()
+        return True
+
+    def close(self):
+        if self.process is not None:
+            self.process.join()
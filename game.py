@@ -1,138 +1,312 @@
-import pygame
 import sys
-from game_logic import GameState, ActionType
-from renderer import GameRenderer
-from dqn_agent import DQNAgent
-import random
+import time
+from game_logic import GameState, ActionType, ObservationEncoder, observation_size
+from dqn_agent import DQNAgent, UpdateScheduler, default_model_path
 
 class Game:
-    def __init__(self):
-        # Inizializza lo stato di gioco e il renderer grafico
-        self.game_state = GameState()
-        self.renderer = GameRenderer()
+    def __init__(self, prioritized_replay=False, model_path=None, compile_mode=None, bf16=False,
+                 search_ms=0, grid_size=7, network='mlp', compact_replay=False, replay_size=20000,
+                 action_masking=False):
+        # Inizializza lo stato di gioco; il renderer grafico (e quindi pygame)
+        # viene creato solo in modalità play, così il training resta headless
+        self.game_state = GameState(grid_size)
+        self.renderer = None
+        # Encoder incrementale delle osservazioni usato nel ciclo di training
+        self.encoder = ObservationEncoder(self.game_state.grid_size)
 
         # Configura l'agente DQN per il RL:
         # l'osservazione include lo stato della griglia (4 canali per cella) più 10 feature addizionali
-        observation_size = (self.game_state.grid_size ** 2 * 4) + 10
         action_size = len(ActionType)
+        # Senza un percorso esplicito, ogni griglia e architettura ha il proprio file di pesi
+        if model_path is None:
+            model_path = default_model_path(grid_size, network)
         # Si utilizza DQN per sfruttare il replay buffer e stabilizzare l'apprendimento
-        self.ai_agent = DQNAgent(observation_size, action_size)
+        self.ai_agent = DQNAgent(observation_size(grid_size), action_size, model_path=model_path,
+                                 prioritized=prioritized_replay, compile_mode=compile_mode, bf16=bf16,
+                                 network=network, grid_size=grid_size, compact_replay=compact_replay,
+                                 replay_size=replay_size)
+        # Esplorazione e scelta greedy limitate alle azioni legali (GameState.legal_action_mask)
+        self.action_masking = action_masking
+        # Quota di mosse non valide dell'IA in ciascun episodio dell'ultimo training
+        self.invalid_action_rates = []
+        # In alternativa alla scelta greedy, ricerca a tempo con la DQN come valutazione delle foglie
+        self.search_agent = None
+        if search_ms > 0:
+            from search_agent import SearchAgent
+            self.search_agent = SearchAgent(self.ai_agent.policy_net, self.ai_agent.gamma,
+                                            time_budget=search_ms / 1000, grid_size=grid_size)
 
-    def train(self, num_episodes):
+    def train(self, num_episodes, start_time=None, evaluator=None, eval_every=0, scheduler=None,
+              checkpoints=None, checkpoint_every=100, start_episode=0, recorder=None, monitor=None,
+              profiler=None):
         print(f"--- Avvio addestramento per {num_episodes} episodi ---")
+        # Di default un aggiornamento per ogni mossa dell'IA, come in origine
+        if scheduler is None:
+            scheduler = UpdateScheduler()
+        # Tempi per fase (instrumentation.TrainingMonitor): con monitor=None nessuna misura
+        timer = None
+        if monitor is not None:
+            timer = monitor.timer
+            monitor.begin(self.ai_agent, scheduler)
+        self.ai_agent.timer = timer
         # Dopo ogni quarto del training, aumentiamo la difficoltà dell'avversario controllato da policy semplice
         threshold = num_episodes / 4
         update = threshold
         difficulty = 1
         wins = 0
+        # Mosse dell'IA e mosse non valide (penalizzate) dall'ultimo resoconto
+        ai_actions = 0
+        invalid_actions = 0
+        self.invalid_action_rates = []
+        # Episodio dell'ultimo checkpoint scritto, per non ripetere quello finale
+        last_checkpoint = None
+        # In caso di ripresa da checkpoint, riallinea il curriculum all'episodio di partenza
+        while start_episode >= threshold:
+            difficulty += 1
+            threshold += update
 
-        for episode in range(num_episodes):
+        for episode in range(start_episode, num_episodes):
             # Aumenta la difficoltà in modo graduale per evitare un salto troppo brusco nella capacità dell'IA
             if episode >= threshold:
                 difficulty += 1
                 threshold += update
 
+            if profiler is not None:
+                profiler.on_episode_start(episode)
             # Imposta un nuovo episodio di gioco
             self.game_state.initialize_game()
-            state = self.game_state.get_ai_observation()
+            self.encoder.reset()
+            state = self.encoder.encode(self.game_state)
+            if recorder is not None:
+                recorder.begin_episode(self.game_state, "train")
+            episode_actions = 0
+            episode_invalid = 0
 
             while not self.game_state.game_over:
                 # Turno dell'avversario controllato da policy semplice
                 if self.game_state.current_player == 0:
+                    if timer is not None:
+                        timer.restart()
                     action = self.get_simple_opponent_action(difficulty * 0.1)
-                    self.game_state.execute_action(action)
+                    if timer is not None:
+                        timer.mark("opponent")
+                    valid, reward = self.game_state.execute_action(action)
+                    if timer is not None:
+                        timer.mark("execute_action")
+                    if recorder is not None:
+                        recorder.record_turn(self.game_state, False, action, valid, reward)
+                    # Misura il tempo di avvio fino al primo step dell'ambiente
+                    if start_time is not None:
+                        print(f"--- Primo step dopo {time.perf_counter() - start_time:.3f}s dall'avvio ---")
+                        start_time = None
 
                 # Turno dell'agente RL
                 elif self.game_state.current_player == 1:
+                    if timer is not None:
+                        timer.restart()
                     # Seleziona l'azione tramite epsilon-greedy (is_training=True abilita esplorazione)
-                    action_idx = self.ai_agent.get_action(state, is_training=True)
+                    legal_mask = self.game_state.legal_action_mask() if self.action_masking else None
+                    action_idx = self.ai_agent.get_action(state, is_training=True, legal_mask=legal_mask)
                     action = ActionType(action_idx)
+                    if timer is not None:
+                        timer.mark("action_selection")
 
                     # Esegue l'azione e riceve la ricompensa
-                    _, reward = self.game_state.execute_action(action)
-                    next_state = self.game_state.get_ai_observation()
+                    valid, reward = self.game_state.execute_action(action)
+                    if timer is not None:
+                        timer.mark("execute_action")
+                    episode_actions += 1
+                    episode_invalid += not valid
+                    if recorder is not None:
+                        recorder.record_turn(self.game_state, True, action, valid, reward)
+                        if timer is not None:
+                            timer.restart()
+                    next_state = self.encoder.encode(self.game_state)
                     done = self.game_state.game_over
+                    if timer is not None:
+                        timer.mark("observation")
 
                     # Memorizza la transizione nel replay buffer per apprendimento batch
                     self.ai_agent.replay_buffer.push(state, action_idx, reward, next_state, done)
-                    # Aggiorna i pesi della rete con un mini-batch estratto dal buffer
-                    self.ai_agent.learn()
+                    if timer is not None:
+                        timer.mark("replay_push")
+                    # Aggiorna i pesi della rete con i mini-batch previsti dallo scheduler
+                    for _ in range(scheduler.on_env_steps()):
+                        self.ai_agent.learn()
 
                     state = next_state
 
-            # Conta le vittorie per calcolare il winrate a intervalli regolari
-            wins += self.game_state.winner
+            if recorder is not None:
+                recorder.end_episode(self.game_state)
+            # Conta le vittorie (non i pareggi) per calcolare il winrate a intervalli regolari
+            wins += self.game_state.winner == 1
+            ai_actions += episode_actions
+            invalid_actions += episode_invalid
+            self.invalid_action_rates.append(episode_invalid / max(episode_actions, 1))
             if (episode + 1) % 100 == 0:
                 # Stampa il tasso di vittorie ogni 100 episodi per monitorare i progressi
-                print(f"Episodio {episode + 1}/{num_episodes} completato. Winrate: {(wins / 100):.2f}")
+                print(f"Episodio {episode + 1}/{num_episodes} completato. Winrate: {(wins / 100):.2f} "
+                      f"(step IA: {scheduler.env_steps}, aggiornamenti: {self.ai_agent.updates_done}, "
+                      f"azioni non valide: {invalid_actions / max(ai_actions, 1):.1%})")
                 wins = 0
+                ai_actions = 0
+                invalid_actions = 0
                 # Salva il modello per conservare lo stato corrente dell'apprendimento
                 self.ai_agent.save_model()
+            # Checkpoint completo (ottimizzatore, contatori, replay buffer) scritto in background
+            if checkpoints is not None and (episode + 1) % checkpoint_every == 0:
+                checkpoints.save(self.ai_agent, scheduler, episode + 1)
+                last_checkpoint = episode + 1
+            # Valutazione greedy del checkpoint in background, senza fermare il training
+            if evaluator is not None and eval_every and (episode + 1) % eval_every == 0:
+                evaluator.submit(episode + 1, self.ai_agent.policy_net)
+            if monitor is not None:
+                monitor.end_episode(episode + 1, self.ai_agent, scheduler)
+            if profiler is not None:
+                profiler.on_episode_end(episode)
 
+        self.ai_agent.timer = None
+        if profiler is not None:
+            profiler.finish()
         print("--- Addestramento completato ---")
         # Salvataggio finale del modello dopo tutti gli episodi
         self.ai_agent.save_model()
+        if checkpoints is not None:
+            if last_checkpoint != num_episodes:
+                checkpoints.save(self.ai_agent, scheduler, num_episodes)
+            checkpoints.wait()
+
+    def play(self, recorder=None, watch_interval=0):
+        # pygame viene importato solo qui: le altre modalità non aprono finestre
+        import pygame
+        from concurrent.futures import ThreadPoolExecutor
+        from renderer import GameRenderer
+        if self.renderer is None:
+            self.renderer = GameRenderer(grid_size=self.game_state.grid_size)
+
+        # Eventi personalizzati: mossa calcolata dal thread di inferenza, fine della pausa dell'IA
+        # e nuovi pesi pronti
+        ai_action_event = pygame.event.custom_type()
+        ai_turn_event = pygame.event.custom_type()
+        model_event = pygame.event.custom_type()
+        # Pausa minima tra due mosse consecutive dell'IA, per renderle visibili all'utente
+        ai_move_delay = 200
+        # L'inferenza gira su un thread dedicato: input e rendering non si bloccano mai
+        inference = ThreadPoolExecutor(max_workers=1)
+        # Numero della partita corrente: le mosse calcolate per una partita riavviata vengono scartate
+        game_id = 0
+        pending = False
+        ai_ready_at = 0
+
+        # Con watch_interval > 0 il file dei pesi viene controllato ogni watch_interval secondi
+        # e i nuovi pesi caricati in background (es. da un training in corso)
+        reloader = None
+        if watch_interval > 0:
+            from model_reload import ModelReloader
+            reloader = ModelReloader(self.ai_agent.model_path, self.ai_agent.policy_net, self.ai_agent.device,
+                                     watch_interval, lambda: pygame.event.post(pygame.event.Event(model_event)))
+            reloader.start()
+            self.renderer.model_info = reloader.describe()
+
+        def load_weights(state_dict):
+            self.ai_agent.load_weights(state_dict)
+            # Valori e valutazioni memorizzati dalla ricerca appartengono ai pesi precedenti
+            if self.search_agent is not None:
+                self.search_agent.clear()
+
+        def swap_weights():
+            # Lo scambio gira sul thread di inferenza, in coda a un'eventuale mossa in calcolo:
+            # avviene quindi sempre tra due turni dell'IA, mai durante un forward o una ricerca
+            state_dict = reloader.take()
+            if state_dict is None:
+                return
+            inference.submit(load_weights, state_dict)
+            self.renderer.model_info = reloader.describe()
+            print(f"--- Nuovi pesi da {self.ai_agent.model_path}: {reloader.describe()} ---")
+
+        def infer(state, legal_mask, requested_game):
+            action_idx = self.ai_agent.get_action(state, is_training=False, legal_mask=legal_mask)
+            pygame.event.post(pygame.event.Event(ai_action_event, action=action_idx, game_id=requested_game))
+
+        def search(position, requested_game):
+            action = self.search_agent.choose_action(position)
+            print(f"--- Ricerca: {self.search_agent.report()} ---")
+            pygame.event.post(pygame.event.Event(ai_action_event, action=action.value, game_id=requested_game))
+
+        def start_game():
+            # Una partita interrotta dal riavvio resta nel log senza vincitore
+            if recorder is not None:
+                recorder.end_episode(self.game_state)
+            self.game_state.initialize_game()
+            if recorder is not None:
+                recorder.begin_episode(self.game_state, "play")
+
+        def apply(action, is_ai):
+            valid, reward = self.game_state.execute_action(action)
+            if recorder is not None:
+                recorder.record_turn(self.game_state, is_ai, action, valid, reward)
+                if self.game_state.game_over:
+                    recorder.end_episode(self.game_state)
 
-    def play(self):
         # Avvia una nuova partita in modalità interattiva
-        self.game_state.initialize_game()
+        start_game()
         running = True
-        clock = pygame.time.Clock()
 
         while running:
-            # Turno del giocatore umano: acquisizione input da tastiera o mouse
-            if self.game_state.current_player == 0 and not self.game_state.game_over:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                        running = False
-                    if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                        self.game_state.initialize_game()
+            # Turno dell'IA: la mossa viene chiesta al thread di inferenza (politica senza esplorazione)
+            if self.game_state.current_player == 1 and not self.game_state.game_over and not pending:
+                remaining = ai_ready_at - pygame.time.get_ticks()
+                if remaining > 0:
+                    # Pausa non bloccante: un timer risveglia il ciclo quando l'IA può muovere
+                    pygame.time.set_timer(ai_turn_event, remaining, loops=1)
+                else:
+                    pending = True
+                    if self.search_agent is not None:
+                        # La ricerca lavora su una copia: solo il thread principale modifica la partita
+                        position = GameState(self.game_state.grid_size)
+                        position.restore(self.game_state.snapshot(include_rng=False))
+                        inference.submit(search, position, game_id)
+                    else:
+                        legal_mask = self.game_state.legal_action_mask() if self.action_masking else None
+                        inference.submit(infer, self.game_state.get_ai_observation(), legal_mask, game_id)
 
+            # Renderizza lo stato attuale (solo le parti cambiate) e attende il prossimo evento
+            # senza consumare CPU; poi elabora anche gli eventi già in coda
+            self.renderer.render(self.game_state)
+            for event in [pygame.event.wait()] + pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_r:
+                    # Riavvio: un'eventuale mossa dell'IA in calcolo appartiene alla partita precedente
+                    start_game()
+                    game_id += 1
+                    pending = False
+                    ai_ready_at = 0
+                elif event.type == pygame.WINDOWEXPOSED:
+                    self.renderer.invalidate()
+                elif event.type == ai_action_event:
+                    if event.game_id == game_id:
+                        pending = False
+                        apply(ActionType(event.action), True)
+                        ai_ready_at = pygame.time.get_ticks() + ai_move_delay
+                elif event.type == model_event:
+                    swap_weights()
+                # Turno del giocatore umano: acquisizione input da tastiera
+                elif self.game_state.current_player == 0 and not self.game_state.game_over:
                     action = self.renderer.get_human_action(event)
                     if action:
-                        self.game_state.execute_action(action)
-
-            # Turno dell'IA: utilizza la politica appresa senza esplorazione
-            elif self.game_state.current_player == 1 and not self.game_state.game_over:
-                state = self.game_state.get_ai_observation()
-                action_idx = self.ai_agent.get_action(state, is_training=False)
-                action = ActionType(action_idx)
-                self.game_state.execute_action(action)
-                # Piccola pausa per rendere visibile la mossa dell'IA all'utente
-                pygame.time.delay(200)
-
-            # Gestione dello stato di fine partita: permette di riavviare o chiudere
-            if self.game_state.game_over:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
-                        running = False
-                    if event.type == pygame.KEYDOWN and event.key == pygame.K_r:
-                        self.game_state.initialize_game()
-
-            # Renderizza lo stato attuale del gioco e controlla il framerate
-            self.renderer.render(self.game_state)
-            clock.tick(30)
+                        apply(action, False)
 
         # Pulizia delle risorse e chiusura del gioco
+        if reloader is not None:
+            reloader.stop()
+        inference.shutdown(wait=False, cancel_futures=True)
+        if recorder is not None:
+            recorder.end_episode(self.game_state)
+            recorder.close()
         pygame.quit()
         sys.exit()
 
     def get_simple_opponent_action(self, difficulty):
-        # Policy di base per l'avversario durante l'addestramento:
-        # se adiacente all'IA, decide tra ATTACK e FREEZE in base a una soglia variabile
-        ai_pos = self.game_state.ai.get_position()
-        human_pos = self.game_state.human.get_position()
-
-        if self.game_state.is_adjacent(human_pos, ai_pos):
-            # La difficoltà influisce sulla probabilità di attacco diretto
-            if random.uniform(0, 1) + difficulty > 0.75:
-                return ActionType.ATTACK
-            else:
-                return ActionType.FREEZE
-
-        # Altrimenti, muove l'avversario verso l'IA scegliendo la direzione dominante
-        dx, dy = ai_pos[0] - human_pos[0], ai_pos[1] - human_pos[1]
-        if abs(dx) > abs(dy):
-            return ActionType.MOVE_RIGHT if dx > 0 else ActionType.MOVE_LEFT
-        else:
-            return ActionType.MOVE_DOWN if dy > 0 else ActionType.MOVE_UP
+        # Policy di base per l'avversario durante l'addestramento (vedi GameState)
+        return self.game_state.get_simple_opponent_action(difficulty)
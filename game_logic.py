@@ -1,4 +1,7 @@
+import math
 import random
+import struct
+from array import array
 from enum import Enum
 from typing import List, Tuple, Optional
 import numpy as np
@@ -26,9 +29,26 @@ class ActionType(Enum):
     ATTACK = 4
     FREEZE = 5
 
+# Maschere delle azioni legali per ogni combinazione di bit (bit i = azione di valore i legale),
+# precalcolate e in sola lettura: legal_action_mask non alloca nulla
+def _build_legal_masks() -> tuple:
+    masks = []
+    for bits in range(1 << len(ActionType)):
+        mask = np.array([(bits >> action.value) & 1 for action in ActionType], dtype=bool)
+        mask.flags.writeable = False
+        masks.append(mask)
+    return tuple(masks)
+
+_LEGAL_MASKS = _build_legal_masks()
+_ALL_LEGAL = (1 << len(ActionType)) - 1
+
 # --- CLASSE PARTECIPANTE --- 
 
 class Participant:
+    # Attributi fissi: oggetti più piccoli e copie/ripristini più rapidi
+    __slots__ = ('x', 'y', 'hp', 'armor', 'vision_duration', 'freeze_status',
+                 'last_movement_direction', 'freeze_attack_count', 'is_human')
+
     def __init__(self, x: int, y: int, is_human: bool = True):
         self.x = x
         self.y = y
@@ -100,6 +120,8 @@ class Participant:
 # --- CLASSE BUFF --- 
 
 class BuffToken:
+    __slots__ = ('x', 'y', 'buff_type', 'duration')
+
     def __init__(self, x: int, y: int, buff_type: BuffType):
         self.x = x
         self.y = y
@@ -114,11 +136,124 @@ class BuffToken:
         self.duration -= 1
         return self.duration <= 0
 
+# --- TABELLE DI VISIBILITÀ PRECALCOLATE --- 
+
+# Feature numeriche in coda all'osservazione (salute, armatura, buff, direzione, bias)
+NUM_FEATURES = 10
+
+def observation_size(grid_size: int) -> int:
+    # 4 canali per cella più le feature numeriche
+    return grid_size * grid_size * 4 + NUM_FEATURES
+
+# Spostamento (dx, dy) della "scia" di visione per ogni direzione di movimento
+_TRAIL_STEPS = {
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0),
+    Direction.RIGHT: (1, 0),
+}
+# Memoria massima (in byte di maschere) di una tabella di visibilità: sulle griglie molto grandi
+# la tabella viene svuotata e ripopolata invece di crescere con il numero di posizioni
+_VISIBILITY_TABLE_BYTES = 64 << 20
+
+def _compute_visibility(grid_size: int, x0: int, y0: int, base_radius: int,
+                        direction: Direction) -> tuple:
+    # Celle visibili in base a raggio e ultima direzione movimento, calcolate per slicing:
+    # il costo dipende dal raggio, non dall'area della griglia (a parte l'allocazione della maschera)
+    mask = np.zeros((grid_size, grid_size), dtype=bool)
+    # Visibilità quadrata attorno alla posizione, tagliata ai bordi (indici 0-based, estremi esclusi)
+    top, bottom = max(y0 - 1 - base_radius, 0), min(y0 + base_radius, grid_size)
+    left, right = max(x0 - 1 - base_radius, 0), min(x0 + base_radius, grid_size)
+    mask[top:bottom, left:right] = True
+    cells = [(x, y) for y in range(top + 1, bottom + 1) for x in range(left + 1, right + 1)]
+    # Effetto "scia" in direzione di movimento per migliorare esplorazione
+    if direction in _TRAIL_STEPS:
+        dx, dy = _TRAIL_STEPS[direction]
+        for k in (1, 2):
+            x, y = x0 + dx * (base_radius + k), y0 + dy * (base_radius + k)
+            if 1 <= x <= grid_size and 1 <= y <= grid_size:
+                mask[y - 1, x - 1] = True
+                cells.append((x, y))
+                top, bottom = min(top, y - 1), max(bottom, y)
+                left, right = min(left, x - 1), max(right, x)
+    mask.flags.writeable = False
+    # Finestra (top, bottom, left, right) che contiene tutte le celle visibili
+    return tuple(cells), mask, (top, bottom, left, right)
+
+class _VisibilityTable(dict):
+    # (x, y, raggio, direzione) -> (celle, maschera, finestra), calcolata al primo accesso
+    def __init__(self, grid_size: int):
+        super().__init__()
+        self.grid_size = grid_size
+        self.max_entries = max(1, _VISIBILITY_TABLE_BYTES // (grid_size * grid_size))
+
+    def __missing__(self, key):
+        if len(self) >= self.max_entries:
+            self.clear()
+        entry = self[key] = _compute_visibility(self.grid_size, *key)
+        return entry
+
+# Tabelle per dimensione di griglia
+_VISIBILITY_TABLES = {}
+
+def get_visibility_table(grid_size: int) -> dict:
+    # Tabella di visibilità (una per dimensione) indicizzata per posizione, raggio e direzione:
+    # ogni voce contiene la tupla delle celle visibili, una maschera booleana (grid_size, grid_size)
+    # in sola lettura indicizzata [y-1, x-1] e la finestra che racchiude le celle visibili
+    table = _VISIBILITY_TABLES.get(grid_size)
+    if table is None:
+        table = _VISIBILITY_TABLES[grid_size] = _VisibilityTable(grid_size)
+    return table
+
+# --- CELLE DI COMPARSA DEI BUFF --- 
+
+# Insieme di tutte le celle per dimensione di griglia, costruito una volta come faceva spawn_buff.
+# Il nuovo buff è random.choice sulla differenza tra questo set e le celle occupate, quindi il suo
+# ordine di iterazione fa parte delle regole: è deterministico (gli hash delle tuple di interi non
+# dipendono da PYTHONHASHSEED) e le partite con seed fisso restano riproducibili. Da non modificare
+_SPAWN_CELLS = {}
+
+def get_spawn_cells(grid_size: int) -> set:
+    cells = _SPAWN_CELLS.get(grid_size)
+    if cells is None:
+        cells = _SPAWN_CELLS[grid_size] = {(x, y) for x in range(1, grid_size + 1)
+                                           for y in range(1, grid_size + 1)}
+    return cells
+
+# --- SNAPSHOT COMPATTI --- 
+
+# Buff presenti al più contemporaneamente: uno ogni 3 turni, ciascuno dura 5 turni
+MAX_BUFFS = 2
+DIRECTIONS = tuple(Direction)
+BUFF_TYPES = tuple(BuffType)
+_DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+_BUFF_TYPE_CODES = {buff_type: code for code, buff_type in enumerate(BUFF_TYPES)}
+# Layout a dimensione fissa: griglia, turno, turni massimi, giocatore corrente, fine partita,
+# vincitore (-2 = nessuno), validità ultima azione; per umano e IA posizione, hp, armatura,
+# visione, freeze subito, freeze disponibili e direzione; numero di buff e (x, y, tipo, durata)
+_SNAPSHOT_FORMAT = struct.Struct("<BHHbbbb" + "HHbbbbbb" * 2 + "b" + "HHbb" * MAX_BUFFS)
+# Stato del Mersenne Twister del generatore (self.rng): gauss_next (NaN se assente) e 624 parole + indice
+_GAUSS_FORMAT = struct.Struct("<d")
+_RNG_WORDS = 625
+SNAPSHOT_SIZE = _SNAPSHOT_FORMAT.size
+SNAPSHOT_SIZE_WITH_RNG = SNAPSHOT_SIZE + _GAUSS_FORMAT.size + 4 * _RNG_WORDS
+
+def _make_participant(values, is_human: bool) -> Participant:
+    participant = Participant(values[0], values[1], is_human)
+    (participant.hp, participant.armor, participant.vision_duration, participant.freeze_status,
+     participant.freeze_attack_count) = values[2:7]
+    participant.last_movement_direction = DIRECTIONS[values[7]]
+    return participant
+
 # --- STATO DI GIOCO --- 
 
 class GameState:
-    def __init__(self):
-        self.grid_size = 7
+    def __init__(self, grid_size: int = 7, rng: Optional[random.Random] = None):
+        self.grid_size = grid_size
+        # Generatore delle estrazioni (posizioni iniziali, buff, avversario semplice): di default
+        # quello globale del modulo random; chi simula in un altro thread (es. la ricerca) ne
+        # passa uno proprio, così non consuma né ripristina lo stato di quello globale
+        self.rng = random if rng is None else rng
         self.turn = 1
         self.current_player = 0  # 0 = umano, 1 = IA
         self.human: Optional[Participant] = None
@@ -130,11 +265,12 @@ class GameState:
         self.max_turns = 1000  # Numero massimo di mezzi-turni
 
     def initialize_game(self):
-        # Posiziona casualmente umano e IA su celle diverse
-        positions = [(x, y) for x in range(1, 8) for y in range(1, 8)]
-        human_pos, ai_pos = random.sample(positions, 2)
-        self.human = Participant(human_pos[0], human_pos[1], is_human=True)
-        self.ai = Participant(ai_pos[0], ai_pos[1], is_human=False)
+        # Posiziona casualmente umano e IA su celle diverse; le celle sono numerate colonna per
+        # colonna senza costruirne la lista (stessi estratti di random.sample sulle posizioni)
+        g = self.grid_size
+        human_cell, ai_cell = self.rng.sample(range(g * g), 2)
+        self.human = Participant(human_cell // g + 1, human_cell % g + 1, is_human=True)
+        self.ai = Participant(ai_cell // g + 1, ai_cell % g + 1, is_human=False)
         self.turn = 1
         self.current_player = 0
         self.buffs.clear()
@@ -142,6 +278,54 @@ class GameState:
         self.winner = None
         self.last_action_valid = True
 
+    def snapshot(self, include_rng: bool = True) -> bytes:
+        # Impacchetta tutto lo stato (e lo stato del generatore self.rng) in pochi byte
+        # a dimensione fissa: alternativa economica a copy.deepcopy per ricerca e rollout
+        human, ai, buffs = self.human, self.ai, self.buffs
+        if len(buffs) > MAX_BUFFS:
+            raise ValueError(f"Cannot snapshot more than {MAX_BUFFS} buffs")
+        slots = []
+        for buff in buffs:
+            slots += (buff.x, buff.y, _BUFF_TYPE_CODES[buff.buff_type], buff.duration)
+        slots += (0, 0, 0, 0) * (MAX_BUFFS - len(buffs))
+        data = _SNAPSHOT_FORMAT.pack(
+            self.grid_size, self.turn, self.max_turns, self.current_player, self.game_over,
+            -2 if self.winner is None else self.winner, self.last_action_valid,
+            human.x, human.y, human.hp, human.armor, human.vision_duration, human.freeze_status,
+            human.freeze_attack_count, _DIRECTION_CODES[human.last_movement_direction],
+            ai.x, ai.y, ai.hp, ai.armor, ai.vision_duration, ai.freeze_status,
+            ai.freeze_attack_count, _DIRECTION_CODES[ai.last_movement_direction],
+            len(buffs), *slots)
+        if include_rng:
+            # getstate domina il costo (~20us): la ricerca può escluderlo con include_rng=False
+            _, internal, gauss_next = self.rng.getstate()
+            data += (_GAUSS_FORMAT.pack(math.nan if gauss_next is None else gauss_next)
+                     + array('I', internal).tobytes())
+        return data
+
+    def restore(self, data: bytes):
+        # Ripristina uno snapshot; lo stato random viene ripristinato solo se incluso
+        values = _SNAPSHOT_FORMAT.unpack_from(data)
+        (self.grid_size, self.turn, self.max_turns, self.current_player, game_over,
+         winner, last_action_valid) = values[:7]
+        self.game_over = bool(game_over)
+        self.winner = None if winner == -2 else winner
+        self.last_action_valid = bool(last_action_valid)
+        self.human = _make_participant(values[7:15], True)
+        self.ai = _make_participant(values[15:23], False)
+        buffs = []
+        for offset in range(24, 24 + 4 * values[23], 4):
+            x, y, buff_type, duration = values[offset:offset + 4]
+            buff = BuffToken(x, y, BUFF_TYPES[buff_type])
+            buff.duration = duration
+            buffs.append(buff)
+        self.buffs = buffs
+        if len(data) > SNAPSHOT_SIZE:
+            gauss_next, = _GAUSS_FORMAT.unpack_from(data, SNAPSHOT_SIZE)
+            internal = array('I')
+            internal.frombytes(data[SNAPSHOT_SIZE + _GAUSS_FORMAT.size:])
+            self.rng.setstate((3, tuple(internal), None if math.isnan(gauss_next) else gauss_next))
+
     def get_current_participant(self) -> Participant:
         return self.human if self.current_player == 0 else self.ai
 
@@ -153,48 +337,80 @@ class GameState:
         if self.turn % 3 == 0:
             occupied = {self.human.get_position(), self.ai.get_position()}
             occupied.update(buff.get_position() for buff in self.buffs)
-            all_cells = {(x, y) for x in range(1, 8) for y in range(1, 8)}
-            vacant = list(all_cells - occupied)
+            vacant = list(get_spawn_cells(self.grid_size) - occupied)
             if vacant:
-                x, y = random.choice(vacant)
-                buff_type = random.choice(list(BuffType))
+                x, y = self.rng.choice(vacant)
+                buff_type = self.rng.choice(list(BuffType))
                 self.buffs.append(BuffToken(x, y, buff_type))
 
     def expire_buffs(self):
         # Rimuove i buff la cui durata è terminata
         self.buffs = [buff for buff in self.buffs if not buff.expire()]
 
+    def get_visibility_key(self, participant: Participant) -> Tuple[int, int, int, Direction]:
+        # Chiave della tabella di visibilità: posizione, raggio e ultima direzione movimento
+        return (participant.x, participant.y, participant.get_vision_radius(),
+                participant.last_movement_direction)
+
     def get_visible_cells(self, participant: Participant) -> List[Tuple[int, int]]:
-        # Calcola le celle visibili in base a raggio e ultima direzione movimento
-        visible = set()
-        base_radius = participant.get_vision_radius()
-        x0, y0 = participant.x, participant.y
-        # Visibilità circolare
-        for dx in range(-base_radius, base_radius + 1):
-            for dy in range(-base_radius, base_radius + 1):
-                x, y = x0 + dx, y0 + dy
-                if 1 <= x <= self.grid_size and 1 <= y <= self.grid_size:
-                    visible.add((x, y))
-        # Effetto "scia" in direzione di movimento per migliorare esplorazione
-        if participant.last_movement_direction != Direction.NONE:
-            for k in (1, 2):
-                if participant.last_movement_direction == Direction.UP:
-                    x, y = x0, y0 - base_radius - k
-                elif participant.last_movement_direction == Direction.DOWN:
-                    x, y = x0, y0 + base_radius + k
-                elif participant.last_movement_direction == Direction.LEFT:
-                    x, y = x0 - base_radius - k, y0
-                elif participant.last_movement_direction == Direction.RIGHT:
-                    x, y = x0 + base_radius + k, y0
-                else:
-                    continue
-                if 1 <= x <= self.grid_size and 1 <= y <= self.grid_size:
-                    visible.add((x, y))
-        return list(visible)
+        # Celle visibili lette dalla tabella precalcolata (vedi _compute_visibility)
+        table = get_visibility_table(self.grid_size)
+        return list(table[self.get_visibility_key(participant)][0])
+
+    def get_visible_mask(self, participant: Participant) -> np.ndarray:
+        # Maschera booleana (riga = y-1, colonna = x-1) in sola lettura, senza ricalcoli
+        table = get_visibility_table(self.grid_size)
+        return table[self.get_visibility_key(participant)][1]
+
+    def get_visible_window(self, participant: Participant) -> Tuple[int, int, int, int]:
+        # (top, bottom, left, right), 0-based ed estremi esclusi: fuori dalla finestra nessuna
+        # cella è visibile, quindi chi aggiorna maschere o osservazioni può limitarsi a essa
+        table = get_visibility_table(self.grid_size)
+        return table[self.get_visibility_key(participant)][2]
 
     def is_adjacent(self, pos1: Tuple[int, int], pos2: Tuple[int, int]) -> bool:
         return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1]) == 1
 
+    def is_aligned(self, pos1: Tuple[int, int], pos2: Tuple[int, int]) -> bool:
+        # Stessa riga, colonna o diagonale (condizione di successo del freeze)
+        return (pos1[0] == pos2[0] or pos1[1] == pos2[1] or
+                abs(pos1[0] - pos2[0]) == abs(pos1[1] - pos2[1]))
+
+    def legal_action_mask(self) -> np.ndarray:
+        # Azioni che execute_action accetterebbe dal giocatore corrente (indicizzate per valore):
+        # movimenti dentro la griglia e non sulla cella dell'avversario, ATTACK se adiacente,
+        # FREEZE con almeno una carica. Un partecipante congelato salta il turno con qualunque
+        # azione. L'avversario adiacente è sempre visibile (raggio minimo 1), quindi per l'IA la
+        # maschera non rivela nulla che non sia già nell'osservazione
+        participant = self.get_current_participant()
+        if participant.freeze_status > 0:
+            return _LEGAL_MASKS[_ALL_LEGAL]
+        opponent = self.get_opponent()
+        x, y, g = participant.x, participant.y, self.grid_size
+        dx, dy = opponent.x - x, opponent.y - y
+        bits = 0
+        if y > 1 and (dx, dy) != (0, -1):
+            bits |= 1 << ActionType.MOVE_UP.value
+        if y < g and (dx, dy) != (0, 1):
+            bits |= 1 << ActionType.MOVE_DOWN.value
+        if x > 1 and (dx, dy) != (-1, 0):
+            bits |= 1 << ActionType.MOVE_LEFT.value
+        if x < g and (dx, dy) != (1, 0):
+            bits |= 1 << ActionType.MOVE_RIGHT.value
+        if abs(dx) + abs(dy) == 1:
+            bits |= 1 << ActionType.ATTACK.value
+        if participant.freeze_attack_count > 0:
+            bits |= 1 << ActionType.FREEZE.value
+        return _LEGAL_MASKS[bits]
+
+    def take_buff_at(self, x: int, y: int) -> Optional[BuffToken]:
+        # Rimuove e restituisce il buff nella cella indicata, se presente
+        for buff in self.buffs:
+            if buff.get_position() == (x, y):
+                self.buffs.remove(buff)
+                return buff
+        return None
+
     def execute_action(self, action: ActionType) -> Tuple[bool, float]:
         participant = self.get_current_participant()
         opponent = self.get_opponent()
@@ -225,11 +441,9 @@ class GameState:
                     and (new_x, new_y) != opponent.get_position()):
                 participant.set_position(new_x, new_y)
                 participant.last_movement_direction = direction
-                for buff in self.buffs[:]:
-                    if buff.get_position() == (new_x, new_y):
-                        reward += self.collect_buff(participant, buff)
-                        self.buffs.remove(buff)
-                        break
+                buff = self.take_buff_at(new_x, new_y)
+                if buff is not None:
+                    reward += self.collect_buff(participant, buff)
                 self.last_action_valid = True
             else:
                 self.last_action_valid = False
@@ -254,12 +468,9 @@ class GameState:
         # Attacco freeze: condizionato a possesso del buff e posizione relativa
         elif action == ActionType.FREEZE:
             if participant.freeze_attack_count > 0:
-                opp_x, opp_y = opponent.get_position()
-                par_x, par_y = participant.get_position()
                 participant.use_freeze_attack()
                 # Freeze riesce se su stessa riga, colonna o diagonale
-                if (par_x == opp_x or par_y == opp_y or
-                    abs(par_x - opp_x) == abs(par_y - opp_y)):
+                if self.is_aligned(participant.get_position(), opponent.get_position()):
                     opponent.freeze_status = 2
                     if is_ai_turn:
                         reward = 0.5
@@ -330,20 +541,39 @@ class GameState:
         self.spawn_buff()
         self.expire_buffs()
 
+    def get_simple_opponent_action(self, difficulty: float) -> ActionType:
+        # Policy di base per l'avversario durante l'addestramento:
+        # se adiacente all'IA, decide tra ATTACK e FREEZE in base a una soglia variabile
+        ai_pos = self.ai.get_position()
+        human_pos = self.human.get_position()
+
+        if self.is_adjacent(human_pos, ai_pos):
+            # La difficoltà influisce sulla probabilità di attacco diretto
+            if self.rng.uniform(0, 1) + difficulty > 0.75:
+                return ActionType.ATTACK
+            else:
+                return ActionType.FREEZE
+
+        # Altrimenti, muove l'avversario verso l'IA scegliendo la direzione dominante
+        dx, dy = ai_pos[0] - human_pos[0], ai_pos[1] - human_pos[1]
+        if abs(dx) > abs(dy):
+            return ActionType.MOVE_RIGHT if dx > 0 else ActionType.MOVE_LEFT
+        else:
+            return ActionType.MOVE_DOWN if dy > 0 else ActionType.MOVE_UP
+
     def get_ai_observation(self) -> np.ndarray:
         # Costruisce vettore di osservazione con maschera griglia e feature addizionali
         obs = np.zeros((self.grid_size, self.grid_size, 4), dtype=np.float32)
-        visible_cells = self.get_visible_cells(self.ai)
-        for (x, y) in visible_cells:
-            obs[y - 1, x - 1, 0] = 1.0  # celle visibili
+        visible = self.get_visible_mask(self.ai)
+        obs[:, :, 0] = visible  # celle visibili
         ai_x, ai_y = self.ai.get_position()
         obs[ai_y - 1, ai_x - 1, 1] = 1.0  # posizione IA
-        human_pos = self.human.get_position()
-        if human_pos in visible_cells:
-            obs[human_pos[1] - 1, human_pos[0] - 1, 2] = 1.0  # posizione umano
+        human_x, human_y = self.human.get_position()
+        if visible[human_y - 1, human_x - 1]:
+            obs[human_y - 1, human_x - 1, 2] = 1.0  # posizione umano
         for buff in self.buffs:
             bx, by = buff.get_position()
-            if (bx, by) in visible_cells:
+            if visible[by - 1, bx - 1]:
                 obs[by - 1, bx - 1, 3] = 1.0  # posizioni buff
         # Evita ambiguità: celle occupate non marcate come visibili libere
         occupied_mask = (obs[:, :, 1] > 0) | (obs[:, :, 2] > 0) | (obs[:, :, 3] > 0)
@@ -365,3 +595,84 @@ class GameState:
         ]
         # Concatenazione in vettore di osservazione continuo per DQN
         return np.concatenate([grid_flat, np.array(features, dtype=np.float32)])
+
+
+# --- CODIFICA INCREMENTALE DELLE OSSERVAZIONI --- 
+
+class ObservationEncoder:
+    # Produce lo stesso vettore di GameState.get_ai_observation riscrivendo solo le celle
+    # cambiate dal turno precedente. Usa buffer preallocati a rotazione: l'array restituito
+    # resta valido fino alle successive num_buffers - 1 chiamate (due di default, così
+    # state e next_state del ciclo di training non si sovrascrivono a vicenda).
+    def __init__(self, grid_size: int = 7, num_buffers: int = 2):
+        self.grid_size = grid_size
+        cells = grid_size * grid_size
+        self.buffers = [np.zeros(cells * 4 + 10, dtype=np.float32) for _ in range(num_buffers)]
+        # Vista (y, x, canale) sulla parte di griglia di ciascun buffer
+        self.grids = [buffer[:cells * 4].reshape(grid_size, grid_size, 4) for buffer in self.buffers]
+        self.records: List[Optional[Tuple]] = [None] * num_buffers
+        self.next_buffer = 0
+
+    def reset(self):
+        # Forza la riscrittura completa (da chiamare dopo initialize_game)
+        self.records = [None] * len(self.buffers)
+
+    def encode(self, game_state: GameState) -> np.ndarray:
+        index = self.next_buffer
+        self.next_buffer = (index + 1) % len(self.buffers)
+        buffer, grid, record = self.buffers[index], self.grids[index], self.records[index]
+        ai = game_state.ai
+        key = game_state.get_visibility_key(ai)
+        _, visible, window = get_visibility_table(self.grid_size)[key]
+
+        # Ripristina le celle marcate nella codifica precedente di questo buffer;
+        # se la visibilità è cambiata riscrive il canale 0 solo nella finestra visibile precedente
+        # e in quella nuova (fuori da entrambe vale 0), così il costo non cresce con l'area
+        if record is None:
+            grid.fill(0.0)
+            top, bottom, left, right = window
+            grid[top:bottom, left:right, 0] = visible[top:bottom, left:right]
+        else:
+            previous_key, previous_window, marked = record
+            for (x, y) in marked:
+                grid[y - 1, x - 1, 1:] = 0.0
+            if previous_key != key:
+                top, bottom, left, right = previous_window
+                grid[top:bottom, left:right, 0] = 0.0
+                top, bottom, left, right = window
+                grid[top:bottom, left:right, 0] = visible[top:bottom, left:right]
+            else:
+                for (x, y) in marked:
+                    grid[y - 1, x - 1, 0] = visible[y - 1, x - 1]
+
+        # Marca IA, umano visibile e buff visibili, azzerando il canale 0 delle celle occupate
+        marked = [(ai.x, ai.y)]
+        grid[ai.y - 1, ai.x - 1, 0] = 0.0
+        grid[ai.y - 1, ai.x - 1, 1] = 1.0
+        human = game_state.human
+        if visible[human.y - 1, human.x - 1]:
+            marked.append((human.x, human.y))
+            grid[human.y - 1, human.x - 1, 0] = 0.0
+            grid[human.y - 1, human.x - 1, 2] = 1.0
+        for buff in game_state.buffs:
+            if visible[buff.y - 1, buff.x - 1]:
+                marked.append((buff.x, buff.y))
+                grid[buff.y - 1, buff.x - 1, 0] = 0.0
+                grid[buff.y - 1, buff.x - 1, 3] = 1.0
+        self.records[index] = (key, window, marked)
+
+        # Feature numeriche nello stesso ordine di get_ai_observation
+        direction = ai.last_movement_direction
+        buffer[self.grid_size * self.grid_size * 4:] = (
+            ai.hp / 3.0,
+            float(ai.armor),
+            ai.vision_duration / 3.0,
+            float(ai.freeze_status),
+            float(ai.freeze_attack_count),
+            float(direction == Direction.UP),
+            float(direction == Direction.DOWN),
+            float(direction == Direction.LEFT),
+            float(direction == Direction.RIGHT),
+            1.0
+        )
+        return buffer
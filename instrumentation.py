@@ -0,0 +1,181 @@
+import json
+import os
+import time
+from time import perf_counter_ns
+
+# --- TIMER PER FASE ---
+
+class PhaseTimer:
+    # Cronometro a marcatori: mark(fase) attribuisce alla fase il tempo trascorso dal marcatore
+    # precedente (o da restart). Costa una lettura di perf_counter_ns e due somme per fase;
+    # chi lo usa controlla "timer is not None", così da disattivato non costa nulla
+    def __init__(self, synchronize=None):
+        # Su GPU i kernel sono asincroni: synchronize (es. torch.cuda.synchronize) viene chiamato
+        # a ogni marcatore, altrimenti forward e backward misurerebbero solo il lancio
+        self.synchronize = synchronize
+        # Fase -> [nanosecondi totali, chiamate]
+        self.phases = {}
+        self.last = perf_counter_ns()
+
+    def restart(self):
+        # Il tempo trascorso dall'ultimo marcatore non viene attribuito a nessuna fase
+        self.last = perf_counter_ns()
+
+    def mark(self, phase: str):
+        if self.synchronize is not None:
+            self.synchronize()
+        now = perf_counter_ns()
+        entry = self.phases.get(phase)
+        if entry is None:
+            entry = self.phases[phase] = [0, 0]
+        entry[0] += now - self.last
+        entry[1] += 1
+        self.last = now
+
+    def calls(self, phase: str) -> int:
+        entry = self.phases.get(phase)
+        return entry[1] if entry is not None else 0
+
+    def reset(self):
+        self.phases = {}
+        self.restart()
+
+
+def rss_bytes():
+    # Memoria residente del processo: /proc su Linux, altrimenti il picco da resource (None se assente)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss è in kilobyte su Linux e in byte su macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+# --- METRICHE DI TRAINING ---
+
+class TrainingMonitor:
+    # Aggrega i tempi per fase ogni every episodi e li scrive come una riga JSON, insieme a
+    # passi dell'ambiente e aggiornamenti al secondo, riempimento del replay buffer e memoria
+    def __init__(self, log_path="train_metrics.jsonl", every=100, synchronize=None):
+        self.log_path = log_path
+        self.every = every
+        self.timer = PhaseTimer(synchronize)
+        self.window_start = time.perf_counter()
+        self.window_updates = 0
+        self.window_ai_steps = 0
+
+    def begin(self, agent, scheduler):
+        # Apre la prima finestra di misura all'avvio del training
+        self.timer.reset()
+        self.window_start = time.perf_counter()
+        self.window_updates = agent.updates_done
+        self.window_ai_steps = scheduler.env_steps
+
+    def end_episode(self, episode, agent, scheduler):
+        # Da chiamare a fine episodio (episode conta da 1): chiude la finestra ogni every episodi
+        if episode % self.every:
+            return None
+        elapsed = time.perf_counter() - self.window_start
+        timer = self.timer
+        tracked = sum(total for total, _ in timer.phases.values()) / 1e9
+        # I mezzi-turni dell'ambiente sono le chiamate a execute_action di entrambi i giocatori
+        env_steps = timer.calls("execute_action")
+        updates = agent.updates_done - self.window_updates
+        buffer = agent.replay_buffer
+        rss = rss_bytes()
+        record = {
+            "episode": episode,
+            "seconds": elapsed,
+            "env_steps": env_steps,
+            "env_steps_per_sec": env_steps / elapsed,
+            "ai_steps": scheduler.env_steps - self.window_ai_steps,
+            "updates": updates,
+            "updates_per_sec": updates / elapsed,
+            "buffer_size": len(buffer),
+            "buffer_fill": len(buffer) / buffer.capacity,
+            "rss_mb": rss / 2 ** 20 if rss is not None else None,
+            "phases": {phase: {"seconds": total / 1e9,
+                               "share": total / 1e9 / elapsed,
+                               "calls": calls,
+                               "mean_us": total / 1e3 / calls}
+                       for phase, (total, calls) in sorted(timer.phases.items(), key=lambda item: -item[1][0])},
+            # Tempo non attribuito: log, checkpoint, valutazioni e fine episodio
+            "untracked_seconds": elapsed - tracked,
+        }
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        top = ", ".join(f"{phase} {entry['share']:.0%}" for phase, entry in list(record["phases"].items())[:4])
+        print(f"--- Fasi (episodi fino a {episode}): {record['env_steps_per_sec']:,.0f} step/s, "
+              f"{record['updates_per_sec']:.1f} aggiornamenti/s; {top} ---")
+        timer.reset()
+        self.window_start = time.perf_counter()
+        self.window_updates = agent.updates_done
+        self.window_ai_steps = scheduler.env_steps
+        return record
+
+
+# --- PROFILAZIONE A FINESTRA ---
+
+PROFILERS = ('cprofile', 'torch')
+
+
+class ProfileWindow:
+    # Profila gli episodi [start, start + count) con cProfile o torch.profiler e scrive il
+    # risultato in output (.prof per cProfile, trace Chrome .json per torch) più un riepilogo .txt
+    def __init__(self, kind="cprofile", start=0, count=10, output=None):
+        if kind not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {kind}")
+        self.kind = kind
+        self.start = start
+        self.stop = start + count
+        self.output = output or ("train_profile.prof" if kind == "cprofile" else "train_profile.json")
+        self.profiler = None
+        self.done = False
+
+    def on_episode_start(self, episode):
+        if self.done or self.profiler is not None or not self.start <= episode < self.stop:
+            return
+        print(f"--- Profilazione ({self.kind}) degli episodi {episode}-{self.stop - 1} ---")
+        if self.kind == "cprofile":
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            import torch
+            self.profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            self.profiler.__enter__()
+
+    def on_episode_end(self, episode):
+        # episode è l'indice dell'episodio appena concluso
+        if self.profiler is not None and episode + 1 >= self.stop:
+            self.finish()
+
+    def finish(self):
+        # Chiude la finestra anche se il training termina prima della sua fine
+        if self.profiler is None:
+            return
+        summary_path = os.path.splitext(self.output)[0] + ".txt"
+        if self.kind == "cprofile":
+            import io
+            import pstats
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output)
+            text = io.StringIO()
+            pstats.Stats(self.profiler, stream=text).sort_stats("cumulative").print_stats(40)
+            summary = text.getvalue()
+        else:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(self.output)
+            summary = self.profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=40)
+        with open(summary_path, "w") as f:
+            f.write(summary)
+        print(f"--- Profilo scritto in {self.output} (riepilogo in {summary_path}) ---")
+        self.profiler = None
+        self.done = True
@@ -1,4 +1,9 @@
+import time
+# Istante di avvio, registrato prima degli import pesanti (torch) per misurare il tempo al primo step
+START_TIME = time.perf_counter()
+
 import argparse
+import sys
 from game import Game
 
 def main():
@@ -12,8 +17,11 @@ def main():
         '--mode',
         type=str,
         default='play',
-        choices=['train', 'play'],
-        help="Scegli 'train' per addestrare l'IA oppure 'play' per sfidarla."
+        choices=['train', 'play', 'serve', 'loadtest', 'bench', 'eval', 'generate'],
+        help="Scegli 'train' per addestrare l'IA, 'play' per sfidarla, 'serve' per ospitare "
+             "partite in rete, 'loadtest' per misurare un server avviato, 'bench' "
+             "per i benchmark dei percorsi critici, 'eval' per un torneo di valutazione "
+             "oppure 'generate' per produrre un dataset offline di transizioni."
     )
     # Numero di episodi per l'addestramento: un valore elevato favorisce la convergenza
     parser.add_argument(
@@ -23,17 +31,315 @@ def main():
         help="Numero di episodi per l'addestramento dell'IA (default 10000)."
     )
 
+    # Numero di processi attori: con 0 l'addestramento resta a processo singolo
+    parser.add_argument(
+        '--actors',
+        type=int,
+        default=0,
+        help="Numero di processi attori per l'addestramento distribuito (default 0 = processo singolo)."
+    )
+    # Seed base: ogni attore usa seed + 1 + indice attore
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help="Seed base per learner e attori (default 0)."
+    )
+    # Ogni quanti aggiornamenti il learner ridistribuisce i pesi agli attori
+    parser.add_argument(
+        '--sync-every',
+        type=int,
+        default=100,
+        help="Aggiornamenti del learner tra due invii dei pesi agli attori (default 100)."
+    )
+
+    # Indirizzo del match server (modalità serve e loadtest)
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Host del match server.")
+    parser.add_argument('--port', type=int, default=8765, help="Porta del match server (default 8765).")
+    # Finestra di coalescenza delle richieste di inferenza: più ampia = batch più grandi, più latenza
+    parser.add_argument(
+        '--batch-window',
+        type=float,
+        default=0.002,
+        help="Secondi di attesa per raggruppare le mosse dell'IA in un unico forward (default 0.002)."
+    )
+    # Parametri del generatore di carico
+    parser.add_argument('--clients', type=int, default=200, help="Client concorrenti per loadtest (default 200).")
+    parser.add_argument('--duration', type=float, default=10.0, help="Durata del loadtest in secondi (default 10).")
+
+    # Opzioni della modalità bench: risultati, baseline di confronto e tolleranza relativa
+    parser.add_argument('--bench-output', type=str, default='bench_results.json',
+                        help="File JSON in cui scrivere i risultati del benchmark.")
+    parser.add_argument('--baseline', type=str, default='bench_baseline.json',
+                        help="File JSON della baseline con cui confrontare i risultati.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Peggioramento relativo tollerato prima di segnalare una regressione (default 0.25).")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Sovrascrive la baseline con i risultati correnti.")
+    parser.add_argument('--update-golden', action='store_true',
+                        help="Rigenera le tracce di riferimento da GameState (solo per modifiche volute alle regole).")
+
+    # Opzioni della valutazione: modello, partite per livello, processi e log in background
+    parser.add_argument('--model-path', type=str, default=None,
+                        help="File dei pesi della DQN (default: quello della griglia e dell'architettura "
+                             "scelte, dqn_model.pth per la MLP 7x7).")
+    parser.add_argument('--eval-games', type=int, default=1000,
+                        help="Partite greedy per livello di difficoltà (default 1000).")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Processi per la valutazione (default 0 = tutti i core).")
+    parser.add_argument('--eval-output', type=str, default=None,
+                        help="File JSON in cui scrivere i risultati della valutazione.")
+    parser.add_argument('--eval-every', type=int, default=0,
+                        help="In train, valuta il checkpoint in background ogni N episodi (default 0 = mai).")
+    parser.add_argument('--eval-log', type=str, default='eval_log.jsonl',
+                        help="File JSON-lines con i risultati delle valutazioni in background.")
+
+    # Replay prioritizzato (sum-tree) al posto del campionamento uniforme
+    parser.add_argument('--prioritized', action='store_true',
+                        help="Usa il prioritized experience replay durante l'addestramento.")
+    # Memoria del replay: osservazioni a bit e deduplicate invece di due copie float32 per transizione
+    parser.add_argument('--compact-replay', action='store_true',
+                        help="Memorizza il replay buffer in forma compatta (circa 20 volte meno memoria).")
+    parser.add_argument('--replay-size', type=int, default=20000,
+                        help="Capacità del replay buffer in transizioni (default 20000).")
+    # Esplorazione e scelta greedy limitate alle azioni legali (niente turni sprecati in mosse non valide)
+    parser.add_argument('--action-mask', action='store_true',
+                        help="Esclude le azioni non valide da esplorazione e argmax dell'IA.")
+
+    # Scheduler degli aggiornamenti: rapporto tra passi dell'ambiente e aggiornamenti del gradiente
+    parser.add_argument('--train-every', type=int, default=1,
+                        help="Passi dell'IA tra due sessioni di apprendimento (default 1).")
+    parser.add_argument('--gradient-steps', type=int, default=1,
+                        help="Aggiornamenti del gradiente per sessione di apprendimento (default 1).")
+    parser.add_argument('--replay-ratio', type=float, default=None,
+                        help="Aggiornamenti per passo dell'IA; se indicato sostituisce --train-every/--gradient-steps.")
+    parser.add_argument('--warmup-steps', type=int, default=0,
+                        help="Passi dell'IA prima del primo aggiornamento (default 0).")
+    parser.add_argument('--target-sync', type=int, default=None,
+                        help="Aggiornamenti del gradiente tra due sincronizzazioni della rete target (default 1000).")
+
+    # Checkpoint completi dello stato di training e ripresa dopo un'interruzione
+    parser.add_argument('--checkpoint-dir', type=str, default=None,
+                        help="Cartella dei checkpoint completi (disattivati se non indicata).")
+    parser.add_argument('--checkpoint-every', type=int, default=100,
+                        help="Episodi tra due checkpoint completi (default 100).")
+    parser.add_argument('--keep-checkpoints', type=int, default=3,
+                        help="Numero di checkpoint conservati, almeno 1 (default 3).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Riprende il training dall'ultimo checkpoint in --checkpoint-dir.")
+
+    # Percorso veloce del learner su CPU: rete compilata, autocast bfloat16 e thread di torch
+    parser.add_argument('--compile', type=str, default='none', choices=['none', 'compile', 'script'],
+                        help="Compila la DQN con torch.compile ('compile') o TorchScript ('script') (default none).")
+    parser.add_argument('--bf16', action='store_true',
+                        help="Esegue i forward del learner e dell'IA in autocast bfloat16 su CPU.")
+    parser.add_argument('--threads', type=int, default=0,
+                        help="Thread intra-op di torch (default 0 = default di torch).")
+    parser.add_argument('--interop-threads', type=int, default=0,
+                        help="Thread inter-op di torch (default 0 = default di torch).")
+    parser.add_argument('--compare-learners', action='store_true',
+                        help="In bench, confronta aggiornamenti/s e winrate dei percorsi del learner con eager float32.")
+    parser.add_argument('--compare-episodes', type=int, default=500,
+                        help="Episodi di training per variante in --compare-learners e --mask-report (default 500).")
+
+    # IA a ricerca: budget di tempo per mossa in millisecondi (play ed eval)
+    parser.add_argument('--search-ms', type=int, default=0,
+                        help="Budget per mossa della ricerca con DQN alle foglie (default 0 = DQN greedy).")
+    # Ricaricamento a caldo dei pesi in play, ad esempio da un training in corso
+    parser.add_argument('--watch-model', type=float, default=0,
+                        help="In play, controlla il file dei pesi ogni N secondi e carica i nuovi pesi (default 0 = mai).")
+
+    # Registrazione binaria delle partite (training a processo singolo e play)
+    parser.add_argument('--record', type=str, default=None,
+                        help="Cartella in cui registrare le partite giocate (disattivato se non indicata).")
+
+    # Dataset offline: generazione a shard e uso in train per pre-addestramento o pre-caricamento
+    parser.add_argument('--dataset', type=str, default='offline_data',
+                        help="Cartella degli shard del dataset offline (default offline_data).")
+    parser.add_argument('--transitions', type=int, default=1_000_000,
+                        help="Transizioni dell'IA da generare in modalità generate (default 1000000).")
+    parser.add_argument('--shard-size', type=int, default=65536,
+                        help="Transizioni per shard (default 65536).")
+    parser.add_argument('--data-policy', type=str, default='mixed', choices=['random', 'scripted', 'mixed'],
+                        help="Politica dell'IA per il dataset: casuale, scriptata o mista per episodio (default mixed).")
+    parser.add_argument('--pretrain-updates', type=int, default=0,
+                        help="In train, aggiornamenti offline sul dataset prima del primo episodio (default 0).")
+    parser.add_argument('--preseed', type=int, default=0,
+                        help="In train, transizioni del dataset caricate nel replay buffer prima del training (default 0).")
+
+    # Strumentazione del training: tempi per fase in JSON-lines e profilazione di una finestra di episodi
+    parser.add_argument('--instrument', action='store_true',
+                        help="Misura i tempi di ogni fase del training e li scrive in --instrument-log.")
+    parser.add_argument('--instrument-every', type=int, default=100,
+                        help="Episodi aggregati in ogni riga di --instrument-log (default 100).")
+    parser.add_argument('--instrument-log', type=str, default='train_metrics.jsonl',
+                        help="File JSON-lines con le metriche per fase (default train_metrics.jsonl).")
+    parser.add_argument('--profile', type=str, default='none', choices=['none', 'cprofile', 'torch'],
+                        help="Profila una finestra del training con cProfile o torch.profiler (default none).")
+    parser.add_argument('--profile-start', type=int, default=0,
+                        help="Primo episodio profilato (default 0).")
+    parser.add_argument('--profile-episodes', type=int, default=10,
+                        help="Episodi profilati (default 10).")
+    parser.add_argument('--profile-output', type=str, default=None,
+                        help="File del profilo (default train_profile.prof o train_profile.json).")
+
+    # Dimensione dell'arena e architettura della rete (train, play e generate)
+    parser.add_argument('--grid-size', type=int, default=7,
+                        help="Lato della griglia di gioco (default 7).")
+    parser.add_argument('--network', type=str, default='mlp', choices=['mlp', 'conv'],
+                        help="Architettura della DQN: MLP originale o variante convoluzionale (default mlp).")
+    parser.add_argument('--grid-scaling', action='store_true',
+                        help="In bench, misura step/s e aggiornamenti/s al variare della dimensione della griglia.")
+    parser.add_argument('--mask-report', action='store_true',
+                        help="In bench, confronta le mosse non valide per episodio senza e con --action-mask.")
+
     args = parser.parse_args()
 
+    # I thread vanno fissati prima di qualsiasi lavoro di torch
+    from dqn_agent import configure_threads, default_model_path
+    configure_threads(args.threads, args.interop_threads)
+    # Ogni griglia e architettura ha il proprio file di pesi, condiviso da tutte le modalità
+    model_path = args.model_path or default_model_path(args.grid_size, args.network)
+
+    if args.mode == 'eval':
+        # Torneo headless: carica il checkpoint e gioca in greedy a ogni livello di difficoltà
+        import json
+        import evaluation
+        results = evaluation.evaluate(model_path, args.eval_games, args.workers or None, args.seed,
+                                      search_ms=args.search_ms, action_masking=args.action_mask,
+                                      grid_size=args.grid_size, network=args.network)
+        evaluation.print_report(results)
+        if args.eval_output:
+            with open(args.eval_output, 'w') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if args.mode == 'generate':
+        # Generazione headless del dataset offline su un pool di processi
+        from offline_dataset import generate_dataset
+        generate_dataset(args.dataset, args.transitions, args.shard_size, args.data_policy,
+                         args.workers or None, args.seed, grid_size=args.grid_size)
+        return
+
+    evaluator = None
+    if args.mode == 'train' and args.eval_every > 0:
+        from evaluation import BackgroundEvaluator
+        evaluator = BackgroundEvaluator(model_path, args.eval_log, seed=args.seed,
+                                        action_masking=args.action_mask, grid_size=args.grid_size,
+                                        network=args.network)
+
+    if args.mode == 'bench':
+        # Benchmark headless: uscita non nulla in caso di regressioni o tracce divergenti
+        import benchmark
+        if args.update_golden:
+            benchmark.write_golden_traces()
+        if args.grid_scaling:
+            sys.exit(benchmark.run_grid_scaling(args.bench_output, seed=args.seed))
+        if args.mask_report:
+            sys.exit(benchmark.run_action_mask_report(args.compare_episodes, args.eval_games,
+                                                      args.bench_output, seed=args.seed))
+        if args.compare_learners:
+            sys.exit(benchmark.run_learner_comparison(args.compare_episodes, args.eval_games,
+                                                      args.bench_output, seed=args.seed))
+        sys.exit(benchmark.run_bench_mode(args.bench_output, args.baseline, args.tolerance,
+                                          args.update_baseline, seed=args.seed))
+
+    if args.mode in ('serve', 'loadtest'):
+        # Le modalità di rete non usano né Game né pygame
+        import asyncio
+        import match_server
+        if args.mode == 'serve':
+            from dqn_agent import DQNAgent
+            from game_logic import ActionType, observation_size
+            agent = DQNAgent(observation_size(args.grid_size), len(ActionType), model_path=model_path,
+                             network=args.network, grid_size=args.grid_size)
+            server = match_server.MatchServer(agent, batch_window=args.batch_window,
+                                              action_masking=args.action_mask, grid_size=args.grid_size)
+            asyncio.run(server.serve(args.host, args.port))
+        else:
+            asyncio.run(match_server.run_load_test(args.host, args.port, args.clients,
+                                                   args.duration, seed=args.seed))
+        return
+
+    scheduler = None
+    checkpoints = None
+    if args.mode == 'train':
+        from dqn_agent import UpdateScheduler
+        scheduler = UpdateScheduler(args.train_every, args.gradient_steps,
+                                    args.replay_ratio, args.warmup_steps)
+        if args.checkpoint_dir:
+            from checkpointing import CheckpointManager
+            checkpoints = CheckpointManager(args.checkpoint_dir, args.keep_checkpoints)
+
+    if args.mode == 'train' and args.actors > 0:
+        # Addestramento distribuito: il learner non ha bisogno dell'istanza Game
+        from distributed_training import train_distributed
+        train_distributed(num_episodes=args.episodes, num_actors=args.actors,
+                          seed=args.seed, sync_every=args.sync_every,
+                          evaluator=evaluator, eval_every=args.eval_every,
+                          prioritized=args.prioritized, scheduler=scheduler,
+                          target_sync=args.target_sync, checkpoints=checkpoints,
+                          checkpoint_every=args.checkpoint_every, resume=args.resume,
+                          compile_mode=args.compile, bf16=args.bf16,
+                          compact_replay=args.compact_replay, replay_size=args.replay_size,
+                          action_masking=args.action_mask, model_path=model_path,
+                          grid_size=args.grid_size, network=args.network)
+        if evaluator is not None:
+            evaluator.close()
+        return
+
     # Crea un'istanza del gioco; qui vengono inizializzate le strutture per lo stato e le politiche RL
-    game = Game()
+    game = Game(prioritized_replay=args.prioritized, model_path=model_path, compile_mode=args.compile, bf16=args.bf16,
+                search_ms=args.search_ms if args.mode == 'play' else 0,
+                grid_size=args.grid_size, network=args.network,
+                compact_replay=args.compact_replay, replay_size=args.replay_size,
+                action_masking=args.action_mask)
+
+    recorder = None
+    if args.record:
+        from trajectory_log import TrajectoryRecorder
+        recorder = TrajectoryRecorder(args.record, game.game_state.grid_size)
 
     if args.mode == 'train':
         # Avvia la fase di addestramento con il numero di episodi specificato
-        game.train(num_episodes=args.episodes)
+        if args.target_sync is not None:
+            game.ai_agent.target_update_frequency = args.target_sync
+        start_episode = 0
+        if args.resume and checkpoints is not None:
+            start_episode = checkpoints.load_latest(game.ai_agent, scheduler)
+        if start_episode == 0 and (args.pretrain_updates > 0 or args.preseed > 0):
+            # Partenza da un dataset offline invece che dalla sola esplorazione casuale
+            import offline_dataset
+            dataset = offline_dataset.ShardDataset(args.dataset)
+            if args.preseed > 0:
+                offline_dataset.preseed(game.ai_agent, dataset, args.preseed, seed=args.seed)
+            if args.pretrain_updates > 0:
+                offline_dataset.pretrain(game.ai_agent, dataset, args.pretrain_updates, seed=args.seed)
+        monitor = None
+        profiler = None
+        if args.instrument or args.profile != 'none':
+            import torch
+            from instrumentation import TrainingMonitor, ProfileWindow
+            if args.instrument:
+                # Su GPU i marcatori attendono i kernel in corso, altrimenti i tempi sarebbero solo di lancio
+                cuda = game.ai_agent.device.type == 'cuda'
+                monitor = TrainingMonitor(args.instrument_log, args.instrument_every,
+                                          synchronize=torch.cuda.synchronize if cuda else None)
+            if args.profile != 'none':
+                profiler = ProfileWindow(args.profile, args.profile_start, args.profile_episodes,
+                                         args.profile_output)
+        game.train(num_episodes=args.episodes, start_time=START_TIME,
+                   evaluator=evaluator, eval_every=args.eval_every, scheduler=scheduler,
+                   checkpoints=checkpoints, checkpoint_every=args.checkpoint_every,
+                   start_episode=start_episode, recorder=recorder, monitor=monitor,
+                   profiler=profiler)
+        if recorder is not None:
+            recorder.close()
+        if evaluator is not None:
+            evaluator.close()
     elif args.mode == 'play':
         # Avvia la modalità interattiva, utilizzando la politica appresa durante il training
-        game.play()
+        game.play(recorder, watch_interval=args.watch_model)
 
 if __name__ == "__main__":
     main()
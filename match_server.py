@@ -0,0 +1,267 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+
+import numpy as np
+
+from game_logic import GameState, ActionType, ObservationEncoder
+
+# --- INFERENZA A BATCH ---
+
+class BatchedPolicy:
+    # Raccoglie le richieste di azione arrivate entro una breve finestra temporale
+    # e le risolve con un unico forward di policy_net sul batch
+    def __init__(self, agent, batch_window=0.002, max_batch=256):
+        self.agent = agent
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.pending = []
+        self.wakeup = asyncio.Event()
+        self.forward_passes = 0
+        self.requests = 0
+
+    async def get_action(self, observation: np.ndarray, legal_mask=None) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((observation, legal_mask, future))
+        self.wakeup.set()
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            # Attende la finestra di coalescenza, salvo batch già pieno
+            if len(self.pending) < self.max_batch:
+                await asyncio.sleep(self.batch_window)
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            if not self.pending:
+                self.wakeup.clear()
+            try:
+                observations = np.stack([observation for observation, _, _ in batch])
+                # Maschere delle azioni legali solo se tutte le richieste del batch ne hanno una
+                legal_masks = None
+                if all(legal_mask is not None for _, legal_mask, _ in batch):
+                    legal_masks = np.stack([legal_mask for _, legal_mask, _ in batch])
+                # Il forward gira in un thread per non bloccare l'I/O delle connessioni
+                actions = await loop.run_in_executor(None, self._forward, observations, legal_masks)
+            except Exception as error:
+                # Un batch fallito non deve fermare il batcher: l'errore arriva alle sole
+                # richieste del batch e il ciclo continua con le successive
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.forward_passes += 1
+            self.requests += len(batch)
+            for (_, _, future), action in zip(batch, actions):
+                if not future.cancelled():
+                    future.set_result(int(action))
+
+    def _forward(self, observations: np.ndarray, legal_masks=None) -> np.ndarray:
+        # Un batch alla volta: la cache dei valori Q dell'agente non è condivisa tra thread
+        return self.agent.get_greedy_actions(observations, legal_masks)
+
+
+# --- SERVER DELLE PARTITE ---
+
+class Match:
+    def __init__(self, match_id: int, grid_size: int = 7):
+        self.match_id = match_id
+        self.game_state = GameState(grid_size)
+        self.game_state.initialize_game()
+        self.encoder = ObservationEncoder(grid_size)
+        self.lock = asyncio.Lock()
+
+
+class MatchServer:
+    # Server TCP a righe JSON che ospita molte partite umano contro IA nello stesso processo.
+    # Messaggi del client: {"type": "new"}, {"type": "move", "match_id": ..., "action": "MOVE_UP"},
+    # {"type": "close", "match_id": ...}. Ogni risposta contiene la vista dell'umano sulla partita.
+    # {"type": "stats"} restituisce i contatori di inferenza del server.
+    def __init__(self, agent, batch_window=0.002, max_batch=256, action_masking=False, grid_size=7):
+        self.policy = BatchedPolicy(agent, batch_window, max_batch)
+        # Griglia delle partite: deve essere quella su cui è stata addestrata la rete dell'agente
+        self.grid_size = grid_size
+        # Con action_masking l'IA sceglie solo tra le azioni legali
+        self.action_masking = action_masking
+        self.matches = {}
+        self.match_ids = itertools.count(1)
+        self.finished_matches = 0
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        batcher = asyncio.create_task(self.policy.run())
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"--- Match server in ascolto su {host}:{port} ---")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def handle_client(self, reader, writer):
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = await self.handle_message(json.loads(line), owned)
+                except (ValueError, KeyError, RuntimeError) as error:
+                    reply = {"type": "error", "message": str(error)}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Le partite di un client disconnesso vengono liberate
+            for match_id in owned:
+                self.matches.pop(match_id, None)
+            writer.close()
+
+    async def handle_message(self, message, owned):
+        # Messaggi malformati (non oggetti, campi del tipo sbagliato) diventano risposte di errore
+        if not isinstance(message, dict):
+            raise ValueError("Message must be a JSON object")
+        kind = message["type"]
+        if kind == "new":
+            match = Match(next(self.match_ids), self.grid_size)
+            self.matches[match.match_id] = match
+            owned.add(match.match_id)
+            return self.describe(match)
+        if kind == "stats":
+            return self.stats()
+        match_id = message["match_id"]
+        if not isinstance(match_id, int):
+            raise ValueError("match_id must be an integer")
+        # Un client può muovere o chiudere solo le partite create sulla propria connessione
+        if match_id not in owned:
+            raise KeyError(f"Match {match_id} does not belong to this connection")
+        match = self.matches[match_id]
+        if kind == "move":
+            if not isinstance(message["action"], str):
+                raise ValueError("action must be a string")
+            action = ActionType[message["action"]]
+            async with match.lock:
+                game_state = match.game_state
+                # Turni dell'IA rimasti in sospeso perché l'inferenza di una richiesta precedente
+                # è fallita: vengono rigiocati prima di accettare la mossa dell'umano
+                ai_actions = await self.play_ai_turns(match)
+                if not (game_state.game_over and ai_actions):
+                    if game_state.game_over or game_state.current_player != 0:
+                        raise ValueError("Not the human's turn")
+                    game_state.execute_action(action)
+                    ai_actions += await self.play_ai_turns(match)
+            if game_state.game_over:
+                self.finished_matches += 1
+            return self.describe(match, ai_actions)
+        if kind == "close":
+            self.matches.pop(match.match_id, None)
+            owned.discard(match.match_id)
+            return {"type": "closed", "match_id": match.match_id}
+        raise ValueError(f"Unknown message type: {kind}")
+
+    async def play_ai_turns(self, match):
+        # Esegue i turni dell'IA finché non tocca all'umano o la partita termina
+        game_state = match.game_state
+        actions = []
+        while not game_state.game_over and game_state.current_player == 1:
+            legal_mask = game_state.legal_action_mask() if self.action_masking else None
+            action_idx = await self.policy.get_action(match.encoder.encode(game_state).copy(), legal_mask)
+            game_state.execute_action(ActionType(action_idx))
+            actions.append(ActionType(action_idx).name)
+        return actions
+
+    def stats(self):
+        # Richieste di azione, batch elaborati e osservazioni servite dalla cache dei valori Q
+        q_cache = self.policy.agent.q_cache
+        return {
+            "type": "stats",
+            "active_matches": len(self.matches),
+            "finished_matches": self.finished_matches,
+            "requests": self.policy.requests,
+            "batches": self.policy.forward_passes,
+            "q_cache_hits": q_cache.hits if q_cache is not None else 0,
+            "q_cache_misses": q_cache.misses if q_cache is not None else self.policy.requests,
+        }
+
+    def describe(self, match, ai_actions=()):
+        # Vista dell'umano: l'IA e i buff compaiono solo se nelle celle visibili
+        game_state = match.game_state
+        visible = game_state.get_visible_mask(game_state.human)
+        human, ai = game_state.human, game_state.ai
+        return {
+            "type": "state",
+            "match_id": match.match_id,
+            "turn": game_state.turn,
+            "current_player": game_state.current_player,
+            "game_over": game_state.game_over,
+            "winner": game_state.winner,
+            "last_action_valid": game_state.last_action_valid,
+            "ai_actions": list(ai_actions),
+            "human": {"x": human.x, "y": human.y, "hp": human.hp, "armor": human.armor,
+                      "vision": human.vision_duration, "frozen": human.freeze_status,
+                      "freeze_attacks": human.freeze_attack_count},
+            "ai": ({"x": ai.x, "y": ai.y} if visible[ai.y - 1, ai.x - 1] else None),
+            "buffs": [{"x": b.x, "y": b.y, "type": b.buff_type.name}
+                      for b in game_state.buffs if visible[b.y - 1, b.x - 1]],
+        }
+
+
+# --- GENERATORE DI CARICO ---
+
+async def _load_client(host, port, deadline, latencies, results, seed):
+    # Un client che gioca partite consecutive con mosse casuali fino alla scadenza
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(message):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    actions = [action.name for action in ActionType]
+    try:
+        while time.perf_counter() < deadline:
+            state = await request({"type": "new"})
+            match_id = state["match_id"]
+            while not state["game_over"] and time.perf_counter() < deadline:
+                start = time.perf_counter()
+                state = await request({"type": "move", "match_id": match_id,
+                                       "action": rng.choice(actions)})
+                latencies.append(time.perf_counter() - start)
+            if state["game_over"]:
+                results["matches"] += 1
+            await request({"type": "close", "match_id": match_id})
+    finally:
+        writer.close()
+
+
+async def run_load_test(host="127.0.0.1", port=8765, num_clients=200, duration=10.0, seed=0):
+    # Apre num_clients connessioni concorrenti e misura latenza per mossa e partite/s
+    latencies = []
+    results = {"matches": 0}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(_load_client(host, port, deadline, latencies, results, seed + i)
+                           for i in range(num_clients)))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000.0
+    report = {
+        "clients": num_clients,
+        "moves": len(latencies),
+        "moves_per_sec": len(latencies) / elapsed,
+        "matches_per_sec": results["matches"] / elapsed,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies) else None,
+    }
+    # Contatori lato server (cache dei valori Q compresa)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps({"type": "stats"}) + "\n").encode())
+    await writer.drain()
+    report["server"] = json.loads(await reader.readline())
+    writer.close()
+    print(json.dumps(report, indent=2))
+    return report
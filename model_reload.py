@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+import torch
+
+# --- RICARICAMENTO A CALDO DEI PESI ---
+
+class ModelReloader:
+    # Controlla periodicamente il file dei pesi in un thread di background: quando cambia,
+    # lo carica e verifica chiavi e forme rispetto alla rete in uso. I pesi pronti restano in
+    # attesa finché il thread principale non li preleva con take() in un momento sicuro
+    # (tra due turni dell'IA), così lo scambio non avviene mai durante un'inferenza
+    def __init__(self, model_path, network, device="cpu", interval=1.0, on_ready=None):
+        self.model_path = model_path
+        self.device = device
+        self.interval = interval
+        # Chiamato dal thread di background quando nuovi pesi sono pronti (es. per svegliare la UI)
+        self.on_ready = on_ready
+        self.shapes = {key: value.shape for key, value in network.state_dict().items()}
+        self.lock = threading.Lock()
+        self.pending = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Versione e data di modifica del modello attivo: la versione 1 è quella caricata
+        # all'avvio, se il file esisteva già
+        self.version = 0
+        self.modified = None
+        self.seen = self.file_signature()
+        if self.seen is not None:
+            self.version = 1
+            self.modified = self.seen[0] / 1e9
+
+    def file_signature(self):
+        # (mtime in ns, dimensione) del file dei pesi, None se assente
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="model-reloader", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            signature = self.file_signature()
+            if signature is None or signature == self.seen:
+                continue
+            try:
+                state_dict = torch.load(self.model_path, map_location=self.device)
+            except Exception as error:
+                # File in scrittura da un processo che non usa la rinomina atomica: si riprova
+                print(f"--- Modello {self.model_path} non leggibile, nuovo tentativo: {error} ---")
+                continue
+            self.seen = signature
+            shapes = {key: value.shape for key, value in state_dict.items()}
+            if shapes != self.shapes:
+                print(f"--- Modello {self.model_path} ignorato: architettura diversa da quella in uso ---")
+                continue
+            with self.lock:
+                self.pending = (state_dict, signature[0] / 1e9)
+            if self.on_ready is not None:
+                self.on_ready()
+
+    def take(self):
+        # Pesi in attesa (state_dict) o None; aggiorna versione e data del modello attivo
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return None
+        state_dict, self.modified = pending
+        self.version += 1
+        return state_dict
+
+    def describe(self) -> str:
+        if self.modified is None:
+            return "Model: untrained"
+        return f"Model: v{self.version} ({time.strftime('%H:%M:%S', time.localtime(self.modified))})"
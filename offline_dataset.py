@@ -0,0 +1,244 @@
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+import numpy as np
+
+from dqn_agent import Experience
+from game_logic import GameState, ActionType, ObservationEncoder, observation_size
+
+# Politiche dell'IA con cui generare le transizioni offline
+DATA_POLICIES = ('random', 'scripted', 'mixed')
+# Livelli di difficoltà dell'avversario semplice, a rotazione tra gli episodi (come nel curriculum)
+OPPONENT_LEVELS = (1, 2, 3, 4)
+# Tutti i valori dell'osservazione sono multipli di 1/3 tra 0 e 3: moltiplicati per OBS_SCALE
+# diventano interi esatti e si memorizzano in un byte (4 volte meno spazio del float32)
+OBS_SCALE = 3
+# Campi di uno shard, nell'ordine di Experience, con il tipo su disco
+SHARD_FIELDS = (
+    ('state', np.uint8),
+    ('action', np.int64),
+    ('reward', np.float32),
+    ('next_state', np.uint8),
+    ('done', np.float32),
+)
+ACTIONS = tuple(ActionType)
+
+
+def quantize_observations(observations: np.ndarray) -> np.ndarray:
+    return np.rint(observations * OBS_SCALE).astype(np.uint8)
+
+
+def dequantize_observations(observations: np.ndarray) -> np.ndarray:
+    return observations.astype(np.float32) / np.float32(OBS_SCALE)
+
+
+def shard_path(directory, index, field):
+    return os.path.join(directory, f"shard-{index:05d}.{field}.npy")
+
+
+# --- POLITICHE DI GENERAZIONE ---
+
+def scripted_ai_action(game_state) -> ActionType:
+    # Speculare all'avversario semplice: se adiacente attacca (congela se ha una carica
+    # e l'umano non è già congelato), altrimenti si avvicina lungo l'asse dominante
+    ai, human = game_state.ai, game_state.human
+    if game_state.is_adjacent(ai.get_position(), human.get_position()):
+        if ai.freeze_attack_count > 0 and human.freeze_status == 0:
+            return ActionType.FREEZE
+        return ActionType.ATTACK
+    dx, dy = human.x - ai.x, human.y - ai.y
+    if abs(dx) > abs(dy):
+        return ActionType.MOVE_RIGHT if dx > 0 else ActionType.MOVE_LEFT
+    return ActionType.MOVE_DOWN if dy > 0 else ActionType.MOVE_UP
+
+
+def episode_epsilon(policy: str, rng: random.Random) -> float:
+    # Probabilità di una mossa casuale dell'IA per l'intero episodio
+    if policy == 'random':
+        return 1.0
+    if policy == 'scripted':
+        return 0.0
+    return rng.random()
+
+
+# --- GENERATORE ---
+
+def generate_shard(directory, index, count, policy, seed, grid_size=7):
+    # Gioca partite IA contro avversario semplice finché lo shard non contiene count transizioni
+    # dell'IA, con la stessa semantica di Game.train (next_state e done subito dopo la mossa
+    # dell'IA), e scrive un file .npy per campo
+    random.seed(seed)
+    rng = random.Random(seed + 1)
+    game_state = GameState(grid_size)
+    encoder = ObservationEncoder(game_state.grid_size)
+    state_size = encoder.buffers[0].size
+    arrays = {field: np.zeros((count, state_size) if field in ('state', 'next_state') else count, dtype=dtype)
+              for field, dtype in SHARD_FIELDS}
+    stats = {"episodes": 0, "wins": 0}
+
+    row = 0
+    episode = 0
+    while row < count:
+        difficulty = OPPONENT_LEVELS[(seed + episode) % len(OPPONENT_LEVELS)] * 0.1
+        epsilon = episode_epsilon(policy, rng)
+        episode += 1
+        game_state.initialize_game()
+        encoder.reset()
+        state = encoder.encode(game_state)
+        while not game_state.game_over and row < count:
+            if game_state.current_player == 0:
+                game_state.execute_action(game_state.get_simple_opponent_action(difficulty))
+                continue
+            if rng.random() < epsilon:
+                action = rng.choice(ACTIONS)
+            else:
+                action = scripted_ai_action(game_state)
+            _, reward = game_state.execute_action(action)
+            next_state = encoder.encode(game_state)
+            arrays['state'][row] = quantize_observations(state)
+            arrays['action'][row] = action.value
+            arrays['reward'][row] = reward
+            arrays['next_state'][row] = quantize_observations(next_state)
+            arrays['done'][row] = game_state.game_over
+            row += 1
+            state = next_state
+        if game_state.game_over:
+            stats["episodes"] += 1
+            stats["wins"] += game_state.winner == 1
+
+    for field, array in arrays.items():
+        np.save(shard_path(directory, index, field), array)
+    return index, stats
+
+
+def generate_dataset(directory, num_transitions, shard_size=65536, policy='mixed', workers=None, seed=0,
+                     grid_size=7):
+    # Divide le transizioni in shard di dimensione fissa (l'ultimo può essere più corto) generati
+    # da un pool di processi; meta.json viene scritto per ultimo e rende il dataset leggibile
+    if policy not in DATA_POLICIES:
+        raise ValueError(f"Unknown data policy: {policy}")
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    counts = [min(shard_size, num_transitions - start) for start in range(0, num_transitions, shard_size)]
+    tasks = [(directory, index, count, policy, seed + 7919 * index, grid_size)
+             for index, count in enumerate(counts)]
+    print(f"--- Generazione di {num_transitions} transizioni ({policy}) in {len(tasks)} shard "
+          f"con {workers} processi ---")
+
+    start = time.perf_counter()
+    totals = {"episodes": 0, "wins": 0}
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers) as pool:
+        for index, stats in pool.starmap(generate_shard, tasks):
+            for key, value in stats.items():
+                totals[key] += value
+    elapsed = time.perf_counter() - start
+
+    meta = {"version": 1, "grid_size": grid_size, "state_size": observation_size(grid_size), "obs_scale": OBS_SCALE,
+            "shard_size": shard_size, "shard_counts": counts, "policy": policy, "seed": seed,
+            "episodes": totals["episodes"], "ai_wins": totals["wins"]}
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"--- Dataset completato: {num_transitions} transizioni, {totals['episodes']} episodi, "
+          f"{num_transitions / elapsed:,.0f} transizioni/s ---")
+    return meta
+
+
+# --- LETTURA IN STREAMING ---
+
+class ShardDataset:
+    # Dataset offline letto dagli shard mappati in memoria: in RAM restano solo gli indici
+    # degli shard in lettura e il batch corrente, qualunque sia la dimensione su disco
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.grid_size = self.meta["grid_size"]
+        self.state_size = self.meta["state_size"]
+        self.shard_counts = self.meta["shard_counts"]
+
+    def check_agent(self, agent):
+        # Le osservazioni del dataset devono avere la dimensione attesa dalla rete
+        if agent.state_size != self.state_size:
+            raise ValueError(f"Dataset observations have size {self.state_size}, "
+                             f"the agent expects {agent.state_size}")
+
+    def __len__(self):
+        return sum(self.shard_counts)
+
+    def shard(self, index) -> dict:
+        # Viste in sola lettura sui campi dello shard (nessun dato caricato finché non letto)
+        return {field: np.load(shard_path(self.directory, index, field), mmap_mode='r')
+                for field, _ in SHARD_FIELDS}
+
+    def iter_batches(self, batch_size, shards_in_flight=4, shuffle=True, seed=None):
+        # Una passata sul dataset a batch di Experience in float32, come ReplayBuffer.sample.
+        # Gli shard vengono letti a gruppi di shards_in_flight in ordine casuale e le loro righe
+        # mescolate insieme: l'ultimo batch di ogni gruppo può essere più corto
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(self.shard_counts)) if shuffle else np.arange(len(self.shard_counts))
+        for start in range(0, len(order), shards_in_flight):
+            group = [int(index) for index in order[start:start + shards_in_flight]]
+            shards = [self.shard(index) for index in group]
+            owners = np.repeat(np.arange(len(group)), [self.shard_counts[index] for index in group])
+            rows = np.concatenate([np.arange(self.shard_counts[index]) for index in group])
+            if shuffle:
+                permutation = rng.permutation(len(rows))
+                owners, rows = owners[permutation], rows[permutation]
+            for offset in range(0, len(rows), batch_size):
+                yield self._gather(shards, owners[offset:offset + batch_size], rows[offset:offset + batch_size])
+
+    def _gather(self, shards, owners, rows) -> Experience:
+        # Legge le righe richieste shard per shard (in ordine crescente, per località sul disco)
+        parts = {field: [] for field, _ in SHARD_FIELDS}
+        for owner, shard in enumerate(shards):
+            selected = np.sort(rows[owners == owner])
+            if len(selected) == 0:
+                continue
+            for field, _ in SHARD_FIELDS:
+                parts[field].append(shard[field][selected])
+        batch = {field: np.concatenate(values) for field, values in parts.items()}
+        return Experience(dequantize_observations(batch['state']), batch['action'], batch['reward'],
+                          dequantize_observations(batch['next_state']), batch['done'])
+
+
+# --- USO DEL DATASET CON DQNAgent ---
+
+def pretrain(agent, dataset: ShardDataset, num_updates, batch_size=None, seed=0):
+    # Aggiornamenti offline della DQN sui batch del dataset, ripetendo le passate se necessario
+    dataset.check_agent(agent)
+    batch_size = batch_size or agent.batch_size
+    print(f"--- Pre-addestramento offline: {num_updates} aggiornamenti su {len(dataset)} transizioni ---")
+    start = time.perf_counter()
+    updates = 0
+    epoch = 0
+    while updates < num_updates:
+        for batch in dataset.iter_batches(batch_size, seed=seed + epoch):
+            agent.learn_batch(batch)
+            updates += 1
+            if updates % 10000 == 0:
+                print(f"Pre-addestramento: {updates}/{num_updates} aggiornamenti")
+            if updates >= num_updates:
+                break
+        epoch += 1
+    elapsed = time.perf_counter() - start
+    print(f"--- Pre-addestramento completato: {updates / elapsed:,.0f} aggiornamenti/s ---")
+    return updates
+
+
+def preseed(agent, dataset: ShardDataset, count, seed=0):
+    # Riempie il replay buffer con count transizioni casuali del dataset (al più la capacità)
+    dataset.check_agent(agent)
+    count = min(count, len(dataset), agent.replay_buffer.capacity)
+    pushed = 0
+    for batch in dataset.iter_batches(4096, seed=seed):
+        take = min(len(batch.action), count - pushed)
+        agent.replay_buffer.push_batch(*(field[:take] for field in batch))
+        pushed += take
+        if pushed >= count:
+            break
+    print(f"--- Replay buffer pre-caricato con {pushed} transizioni offline ---")
+    return pushed
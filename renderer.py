@@ -3,13 +3,20 @@ from typing import Optional
 from game_logic import GameState, BuffType, ActionType
 
 class GameRenderer:
-    def __init__(self, cell_size: int = 80):
-        # Inizializza Pygame, determina dimensioni finestra in base alla griglia e allo spazio UI
+    # Lato massimo della griglia in pixel e altezza minima per il pannello laterale
+    MAX_GRID_PIXELS = 800
+    MIN_HEIGHT = 560
+
+    def __init__(self, cell_size: int = 80, incremental: bool = True, grid_size: int = 7):
+        # Inizializza Pygame, determina dimensioni finestra in base alla griglia e allo spazio UI;
+        # sulle griglie grandi le celle si rimpiccioliscono per restare entro MAX_GRID_PIXELS
         pygame.init()
+        if grid_size * cell_size > self.MAX_GRID_PIXELS:
+            cell_size = max(4, self.MAX_GRID_PIXELS // grid_size)
         self.cell_size = cell_size
-        self.grid_size = 7
+        self.grid_size = grid_size
         self.width = self.grid_size * cell_size + 400  # 400 px riservati al pannello laterale
-        self.height = self.grid_size * cell_size
+        self.height = max(self.grid_size * cell_size, self.MIN_HEIGHT)
         self.screen = pygame.display.set_mode((self.width, self.height))
         pygame.display.set_caption("Grid Duel RL: Tactical Arena")
 
@@ -29,107 +36,145 @@ class GameRenderer:
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 18)
 
-    def render(self, game_state: GameState):
-        # Pulisce lo schermo con tonalità scura per contrastare la griglia bianca
-        self.screen.fill(self.DARK_GRAY)
+        # Modalità incrementale: si ridisegnano solo le celle e le righe del pannello cambiate
+        # e si aggiornano solo quei rettangoli; altrimenti ogni frame è un ridisegno completo
+        self.incremental = incremental
+        # Superfici già pronte: celle per contenuto e testi per (stringa, font, colore)
+        self.tile_cache = {}
+        self.text_cache = {}
+        # Contenuto attualmente a schermo: chiave di ogni cella, righe del pannello e vincitore
+        self.cell_keys = {}
+        self.ui_lines = []
+        self.banner = None
+        self.needs_full_redraw = True
+        # Versione del modello attivo mostrata nel pannello (None = riga assente)
+        self.model_info = None
+
+    def invalidate(self):
+        # Forza un ridisegno completo al prossimo frame (es. finestra riesposta)
+        self.needs_full_redraw = True
 
-        # Crea una superficie dedicata all'area di gioco (senza UI)
-        grid_surface = pygame.Surface((self.grid_size * self.cell_size,
-                                       self.grid_size * self.cell_size))
-        grid_surface.fill(self.WHITE)
+    def render_text(self, text: str, small: bool = False, color=None) -> pygame.Surface:
+        # Il rendering dei font è costoso: ogni stringa viene renderizzata una sola volta
+        key = (text, small, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            font = self.small_font if small else self.font
+            surface = font.render(text, True, color or self.WHITE)
+            self.text_cache[key] = surface
+        return surface
+
+    def render(self, game_state: GameState):
+        # Se la partita è finita, il vincitore viene mostrato in evidenza sopra griglia e pannello:
+        # la sua comparsa o scomparsa richiede un ridisegno completo
+        banner = self.winner_name(game_state) if game_state.game_over else None
+        full = self.needs_full_redraw or not self.incremental or banner != self.banner
+        if full:
+            # Pulisce lo schermo con tonalità scura per contrastare la griglia bianca
+            self.screen.fill(self.DARK_GRAY)
+            self.cell_keys = {}
+            self.ui_lines = []
+        dirty = []
 
         # Applica "foschia di guerra" per il giocatore umano:
         # nasconde celle non visibili in base al buff di visione
-        visible_cells = game_state.get_visible_cells(game_state.human)
+        visible = game_state.get_visible_mask(game_state.human)
+        buffs = {buff.get_position(): buff.buff_type for buff in game_state.buffs}
+        human_position = game_state.human.get_position()
+        ai_position = game_state.ai.get_position()
         for x in range(1, self.grid_size + 1):
             for y in range(1, self.grid_size + 1):
-                if (x, y) not in visible_cells:
-                    rect = pygame.Rect((x - 1) * self.cell_size,
-                                       (y - 1) * self.cell_size,
-                                       self.cell_size, self.cell_size)
-                    pygame.draw.rect(grid_surface, self.DARK_GRAY, rect)
-
-        # Disegna linee di griglia per delimitare chiaramente le celle
-        for i in range(self.grid_size + 1):
-            start = (i * self.cell_size, 0)
-            end_v = (i * self.cell_size, self.height)
-            pygame.draw.line(grid_surface, self.BLACK, start, end_v)
-            start_h = (0, i * self.cell_size)
-            end = (self.height, i * self.cell_size)
-            pygame.draw.line(grid_surface, self.BLACK, start_h, end)
-
-        # Rende i buff visibili nelle celle esposte: colore in base al tipo di buff
-        for buff in game_state.buffs:
-            pos = buff.get_position()
-            if pos in visible_cells:
-                x, y = pos
-                rect = pygame.Rect((x - 1) * self.cell_size + 10,
-                                   (y - 1) * self.cell_size + 10,
-                                   self.cell_size - 20, self.cell_size - 20)
-                # Verde per salute, grigio per armatura, viola per visione, arancio per freeze
-                if buff.buff_type == BuffType.HEALTH:
-                    color = self.GREEN
-                elif buff.buff_type == BuffType.ARMOR:
-                    color = self.GRAY
-                elif buff.buff_type == BuffType.VISION:
-                    color = self.PURPLE
-                else:
-                    color = self.ORANGE
-                pygame.draw.rect(grid_surface, color, rect)
-                # Disegna la lettera identificativa del buff al centro del rettangolo
-                text = self.small_font.render(buff.buff_type.value[0], True, self.BLACK)
-                text_rect = text.get_rect(center=rect.center)
-                grid_surface.blit(text, text_rect)
-
-        # Disegna il giocatore umano come ellisse blu
-        human_x, human_y = game_state.human.get_position()
-        human_rect = pygame.Rect((human_x - 1) * self.cell_size + 5,
-                                 (human_y - 1) * self.cell_size + 5,
-                                 self.cell_size - 10, self.cell_size - 10)
-        pygame.draw.ellipse(grid_surface, self.BLUE, human_rect)
-
-        # Disegna l'IA come ellisse rossa, solo se visibile all'umano
-        ai_x, ai_y = game_state.ai.get_position()
-        if (ai_x, ai_y) in visible_cells:
-            ai_rect = pygame.Rect((ai_x - 1) * self.cell_size + 5,
-                                  (ai_y - 1) * self.cell_size + 5,
-                                  self.cell_size - 10, self.cell_size - 10)
-            pygame.draw.ellipse(grid_surface, self.RED, ai_rect)
-
-        # Incolla la griglia sullo schermo principale
-        self.screen.blit(grid_surface, (0, 0))
+                # Contenuto della cella: buff e IA compaiono solo nelle celle esposte
+                seen = bool(visible[y - 1, x - 1])
+                key = (seen,
+                       buffs.get((x, y)) if seen else None,
+                       human_position == (x, y),
+                       seen and ai_position == (x, y))
+                if self.cell_keys.get((x, y)) == key:
+                    continue
+                self.cell_keys[(x, y)] = key
+                rect = pygame.Rect((x - 1) * self.cell_size, (y - 1) * self.cell_size,
+                                   self.cell_size, self.cell_size)
+                self.screen.blit(self.cell_tile(key), rect)
+                dirty.append(rect)
 
         # Rende il pannello laterale con informazioni di gioco e controlli
-        self.draw_ui(game_state)
-
-        # Se la partita è finita, mostra il vincitore in evidenza
-        if game_state.game_over:
-            if game_state.winner == 0:
-                winner_name = "Human"
-            elif game_state.winner == 1:
-                winner_name = "AI"
-            else:
-                winner_name = "DRAW"
-            winner_text = self.font.render(f"WINNER: {winner_name}!", True, self.BLACK)
+        dirty.extend(self.draw_ui(game_state))
+
+        if banner is not None and full:
+            winner_text = self.render_text(f"WINNER: {banner}!", color=self.BLACK)
             text_rect = winner_text.get_rect(center=(self.width / 2, 20))
             # Rettangolo giallo per dare risalto al messaggio
             pygame.draw.rect(self.screen, self.YELLOW, text_rect.inflate(20, 10))
             self.screen.blit(winner_text, text_rect)
+        self.banner = banner
+        self.needs_full_redraw = False
 
-        # Aggiorna il display con tutto ciò che è stato disegnato
-        pygame.display.flip()
+        # Aggiorna il display solo dove qualcosa è cambiato; nessuna chiamata se il frame è identico
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
 
-    def draw_ui(self, game_state: GameState):
-        # Coordinate iniziali per il pannello UI
+    def winner_name(self, game_state: GameState) -> str:
+        if game_state.winner == 0:
+            return "Human"
+        if game_state.winner == 1:
+            return "AI"
+        return "DRAW"
+
+    def cell_tile(self, key) -> pygame.Surface:
+        # Superficie di una cella per contenuto (visibile, buff, umano, IA), creata una volta sola
+        tile = self.tile_cache.get(key)
+        if tile is not None:
+            return tile
+        seen, buff_type, has_human, has_ai = key
+        size = self.cell_size
+        tile = pygame.Surface((size, size))
+        tile.fill(self.WHITE if seen else self.DARK_GRAY)
+        # Linee di griglia sul bordo superiore e sinistro: le celle adiacenti completano il reticolo
+        pygame.draw.line(tile, self.BLACK, (0, 0), (size, 0))
+        pygame.draw.line(tile, self.BLACK, (0, 0), (0, size))
+
+        # Rende i buff visibili nelle celle esposte: colore in base al tipo di buff
+        # Margini proporzionali alla cella (10 e 5 pixel con le celle da 80)
+        margin = size // 8
+        if buff_type is not None:
+            rect = pygame.Rect(margin, margin, size - 2 * margin, size - 2 * margin)
+            # Verde per salute, grigio per armatura, viola per visione, arancio per freeze
+            if buff_type == BuffType.HEALTH:
+                color = self.GREEN
+            elif buff_type == BuffType.ARMOR:
+                color = self.GRAY
+            elif buff_type == BuffType.VISION:
+                color = self.PURPLE
+            else:
+                color = self.ORANGE
+            pygame.draw.rect(tile, color, rect)
+            # Disegna la lettera identificativa del buff al centro del rettangolo
+            text = self.render_text(buff_type.value[0], small=True, color=self.BLACK)
+            tile.blit(text, text.get_rect(center=rect.center))
+
+        # Umano come ellisse blu, IA come ellisse rossa (solo se visibile all'umano)
+        participant_rect = pygame.Rect(margin // 2, margin // 2, size - margin, size - margin)
+        if has_human:
+            pygame.draw.ellipse(tile, self.BLUE, participant_rect)
+        if has_ai:
+            pygame.draw.ellipse(tile, self.RED, participant_rect)
+        self.tile_cache[key] = tile
+        return tile
+
+    def ui_text_lines(self, game_state: GameState) -> list:
+        # Righe del pannello laterale come (testo, font piccolo, posizione)
         ui_x = self.grid_size * self.cell_size + 20
         ui_y = 10
+        lines = []
 
-        # Disegna statistiche di un partecipante (human o AI)
-        def draw_participant_stats(participant, name, color_label, y_start):
+        # Statistiche di un partecipante (human o AI)
+        def participant_stats(participant, name, color_label, y_start):
             y = y_start
             # Titolo con nome e colore associato
-            header = self.font.render(f"{name} ({color_label})", True, self.WHITE)
-            self.screen.blit(header, (ui_x, y))
+            lines.append((f"{name} ({color_label})", False, (ui_x, y)))
             y += 25
             # Elenco delle statistiche chiave; hp, armatura, durate buff, stato freeze
             stats = [
@@ -140,39 +185,65 @@ class GameRenderer:
                 f"Frozen: {participant.freeze_status}"
             ]
             for stat in stats:
-                text = self.small_font.render(stat, True, self.WHITE)
-                self.screen.blit(text, (ui_x, y))
+                lines.append((stat, True, (ui_x, y)))
                 y += 20
             return y
 
-        # Mostra il numero del turno (ogni due mosse incrementa il contatore)
-        turn_text = self.font.render(f"Turn: {game_state.turn // 2}", True, self.WHITE)
-        self.screen.blit(turn_text, (ui_x, ui_y))
+        # Numero del turno (ogni due mosse incrementa il contatore)
+        lines.append((f"Turn: {game_state.turn // 2}", False, (ui_x, ui_y)))
         ui_y += 30
 
-        # Indica chi sta giocando in questo momento
+        # Chi sta giocando in questo momento
         current_player = "Human" if game_state.current_player == 0 else "AI"
-        player_text = self.font.render(f"Current Turn: {current_player}", True, self.WHITE)
-        self.screen.blit(player_text, (ui_x, ui_y))
+        lines.append((f"Current Turn: {current_player}", False, (ui_x, ui_y)))
         ui_y += 40
 
-        # Statistiche del giocatore umano
-        ui_y = draw_participant_stats(game_state.human, "HUMAN", "Blue", ui_y)
+        ui_y = participant_stats(game_state.human, "HUMAN", "Blue", ui_y)
         ui_y += 20
-        # Statistiche dell'agente IA
-        ui_y = draw_participant_stats(game_state.ai, "AI", "Red", ui_y)
+        ui_y = participant_stats(game_state.ai, "AI", "Red", ui_y)
         ui_y += 40
 
         # Sezione controlli: mostra i tasti utilizzabili
-        controls_header = self.font.render("CONTROLS:", True, self.WHITE)
-        self.screen.blit(controls_header, (ui_x, ui_y))
+        lines.append(("CONTROLS:", False, (ui_x, ui_y)))
         ui_y += 25
         controls = ["WASD: Move", "SPACE: Attack", "F: Freeze Attack", "R: Restart", "ESC: Quit"]
         for control in controls:
-            ctrl_text = self.small_font.render(control, True, self.WHITE)
-            self.screen.blit(ctrl_text, (ui_x, ui_y))
+            lines.append((control, True, (ui_x, ui_y)))
             ui_y += 18
 
+        # Modello in uso dall'IA (cambia quando i pesi vengono ricaricati a caldo)
+        if self.model_info is not None:
+            ui_y += 10
+            lines.append((self.model_info, True, (ui_x, ui_y)))
+        return lines
+
+    def draw_ui(self, game_state: GameState) -> list:
+        # Ridisegna solo le righe del pannello cambiate rispetto al frame precedente
+        # e restituisce i rettangoli da aggiornare
+        lines = self.ui_text_lines(game_state)
+        dirty = []
+        drawn = []
+        for i, line in enumerate(lines):
+            previous = self.ui_lines[i] if i < len(self.ui_lines) else None
+            if previous is not None and previous[0] == line:
+                drawn.append(previous)
+                continue
+            text, small, position = line
+            surface = self.render_text(text, small)
+            rect = surface.get_rect(topleft=position)
+            if previous is not None:
+                # Cancella il testo precedente con il colore di sfondo del pannello
+                self.screen.fill(self.DARK_GRAY, previous[1])
+                dirty.append(previous[1])
+            self.screen.blit(surface, rect)
+            dirty.append(rect)
+            drawn.append((line, rect))
+        for _, rect in self.ui_lines[len(lines):]:
+            self.screen.fill(self.DARK_GRAY, rect)
+            dirty.append(rect)
+        self.ui_lines = drawn
+        return dirty
+
     def get_human_action(self, event) -> Optional[ActionType]:
         # Mappa gli eventi di pressione tasto alle azioni di gioco
         if event.type != pygame.KEYDOWN:
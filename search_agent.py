@@ -0,0 +1,221 @@
+import random
+import time
+from collections import OrderedDict
+import numpy as np
+import torch
+
+from game_logic import GameState, ActionType, ObservationEncoder
+
+ACTIONS = tuple(ActionType)
+
+
+class TranspositionTable:
+    # Tabella hash a capacità limitata: oltre capacity viene scartata la voce usata meno di recente
+    def __init__(self, capacity=200_000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class SearchAgent:
+    # Ricerca expectimax a tempo sull'albero a turni alterni: nodi max per l'IA, nodi min per
+    # l'umano, nodi di chance (campionati) per la comparsa dei buff. Le foglie sono valutate con
+    # max_a Q(s, a) della DQN, che fornisce anche l'ordine e la selezione delle mosse dell'IA.
+    # La profondità conta le mosse dell'IA e cresce per approfondimento iterativo fino al budget.
+    def __init__(self, policy, gamma=0.99, time_budget=0.05, max_depth=8, beam=3,
+                 spawn_samples=2, table_size=200_000, seed=0, grid_size=7):
+        self.policy = policy
+        self.gamma = gamma
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        # Mosse dell'IA espanse nei nodi interni, scelte per Q decrescente (alla radice tutte)
+        self.beam = beam
+        # Esiti campionati per i nodi di chance in cui compare un nuovo buff
+        self.spawn_samples = spawn_samples
+        # Generatore proprio per determinizzazione e comparsa dei buff simulata: la ricerca gira
+        # sul thread di inferenza e non deve toccare il generatore globale della partita reale
+        self.rng = random.Random(seed)
+        # Stato privato su cui si applicano le mosse, ripristinato dagli snapshot
+        self.state = GameState(grid_size, self.rng)
+        self.encoder = ObservationEncoder(self.state.grid_size, num_buffers=1)
+        # Valori per (stato, profondità) e valutazioni Q della rete per stato
+        self.table = TranspositionTable(table_size)
+        self.evaluations = TranspositionTable(table_size)
+        self.deadline = 0.0
+        self.must_finish = True
+        # Statistiche dell'ultima ricerca e cumulative, per calibrare forza e latenza
+        self.last_nodes = 0
+        self.last_depth = 0
+        self.last_elapsed = 0.0
+        self.total_nodes = 0
+        self.total_time = 0.0
+        self.searches = 0
+
+    def clear(self):
+        # Da chiamare quando cambiano i pesi della rete: valori e valutazioni non sono più validi
+        self.table.clear()
+        self.evaluations.clear()
+
+    def nodes_per_second(self) -> float:
+        return self.total_nodes / self.total_time if self.total_time else 0.0
+
+    def choose_action(self, game_state: GameState) -> ActionType:
+        start = time.perf_counter()
+        self.deadline = start + self.time_budget
+        self.last_nodes = 0
+        root = self.determinize(game_state)
+        order = list(np.argsort(-self.evaluate(root)))
+        best = order[0]
+        for depth in range(1, self.max_depth + 1):
+            # La profondità 1 viene sempre completata, anche oltre il budget
+            self.must_finish = depth == 1
+            try:
+                values = {index: self.action_value(root, index, depth) for index in order}
+            except _SearchTimeout:
+                break
+            order.sort(key=lambda index: -values[index])
+            best = order[0]
+            self.last_depth = depth
+        self.last_elapsed = time.perf_counter() - start
+        self.total_nodes += self.last_nodes
+        self.total_time += self.last_elapsed
+        self.searches += 1
+        return ACTIONS[best]
+
+    def determinize(self, game_state: GameState) -> bytes:
+        # Stato radice coerente con ciò che l'IA osserva: i buff fuori vista vengono rimossi e,
+        # se l'umano non è visibile, viene collocato in una cella nascosta libera a caso
+        state = self.state
+        state.restore(game_state.snapshot(include_rng=False))
+        visible = state.get_visible_mask(state.ai)
+        state.buffs = [buff for buff in state.buffs if visible[buff.y - 1, buff.x - 1]]
+        human = state.human
+        if not visible[human.y - 1, human.x - 1]:
+            # Celle nascoste dalla maschera in un'unica operazione vettoriale, in ordine riga per riga
+            occupied = {state.ai.get_position()} | {buff.get_position() for buff in state.buffs}
+            rows, columns = np.nonzero(~visible)
+            hidden = [(x, y) for x, y in zip((columns + 1).tolist(), (rows + 1).tolist())
+                      if (x, y) not in occupied]
+            if hidden:
+                human.set_position(*self.rng.choice(hidden))
+        return state.snapshot(include_rng=False)
+
+    def evaluate(self, snapshot: bytes) -> np.ndarray:
+        # Valori Q dell'osservazione dell'IA nello stato indicato (in cache)
+        q_values = self.evaluations.get(snapshot)
+        if q_values is None:
+            self.evaluate_batch([snapshot])
+            q_values = self.evaluations.get(snapshot)
+        return q_values
+
+    def evaluate_batch(self, snapshots):
+        # Un solo forward per tutti gli stati non ancora valutati
+        missing = [snapshot for snapshot in dict.fromkeys(snapshots)
+                   if snapshot not in self.evaluations.entries]
+        if not missing:
+            return
+        observations = np.empty((len(missing), self.encoder.buffers[0].size), dtype=np.float32)
+        for row, snapshot in enumerate(missing):
+            self.state.restore(snapshot)
+            observations[row] = self.encoder.encode(self.state)
+        with torch.no_grad():
+            q_values = self.policy(torch.from_numpy(observations)).numpy()
+        for snapshot, row in zip(missing, q_values):
+            self.evaluations.put(snapshot, row)
+
+    def check_time(self):
+        if not self.must_finish and time.perf_counter() > self.deadline:
+            raise _SearchTimeout()
+
+    def successors(self, snapshot: bytes, action_index: int):
+        # Esiti di un'azione come (ricompensa, fine partita, snapshot); se al turno successivo
+        # compare un buff, il nodo di chance è approssimato con spawn_samples esiti campionati
+        state = self.state
+        state.restore(snapshot)
+        samples = self.spawn_samples if (state.turn + 1) % 3 == 0 else 1
+        outcomes = []
+        for sample in range(samples):
+            if sample:
+                state.restore(snapshot)
+            _, reward = state.execute_action(ACTIONS[action_index])
+            self.last_nodes += 1
+            outcomes.append((reward, state.game_over, state.snapshot(include_rng=False)))
+        return outcomes
+
+    def candidate_actions(self, snapshot: bytes, limit: int):
+        # Un partecipante congelato salta il turno qualunque azione scelga: basta espanderne una
+        self.state.restore(snapshot)
+        if self.state.get_current_participant().freeze_status > 0:
+            return [0]
+        if limit >= len(ACTIONS):
+            return range(len(ACTIONS))
+        return list(np.argsort(-self.evaluate(snapshot))[:limit])
+
+    def ai_value(self, snapshot: bytes, depth: int) -> float:
+        # Nodo max dell'IA: foglia Q a profondità 0, altrimenti la migliore tra le mosse del beam
+        if depth == 0:
+            return float(self.evaluate(snapshot).max())
+        entry = self.table.get(snapshot)
+        if entry is not None and entry[0] >= depth:
+            return entry[1]
+        self.check_time()
+        value = max(self.action_value(snapshot, index, depth)
+                    for index in self.candidate_actions(snapshot, self.beam))
+        self.table.put(snapshot, (depth, value))
+        return value
+
+    def action_value(self, snapshot: bytes, action_index: int, depth: int) -> float:
+        # Q di ricerca: ricompensa dell'IA più il valore scontato della risposta dell'umano
+        total = 0.0
+        outcomes = self.successors(snapshot, action_index)
+        for reward, game_over, child in outcomes:
+            total += reward if game_over else reward + self.gamma * self.human_value(child, depth)
+        return total / len(outcomes)
+
+    def human_value(self, snapshot: bytes, depth: int) -> float:
+        # Nodo min dell'umano: risposta peggiore per l'IA (vittoria umana = -1, pareggio = 0)
+        children = []
+        for index in self.candidate_actions(snapshot, len(ACTIONS)):
+            children.append(self.successors(snapshot, index))
+        if depth == 1:
+            # Le foglie di questo nodo sono valutate tutte insieme
+            self.evaluate_batch([child for outcomes in children for _, game_over, child in outcomes
+                                 if not game_over])
+        value = None
+        for outcomes in children:
+            total = 0.0
+            for reward, game_over, child in outcomes:
+                total += reward if game_over else self.ai_value(child, depth - 1)
+            total /= len(outcomes)
+            value = total if value is None else min(value, total)
+        return value
+
+    def report(self) -> str:
+        return (f"profondità {self.last_depth}, {self.last_nodes} nodi in {self.last_elapsed * 1000:.1f} ms "
+                f"({self.nodes_per_second():,.0f} nodi/s medi)")
@@ -0,0 +1,235 @@
+import json
+import os
+
+import numpy as np
+
+from game_logic import GameState, ActionType, DIRECTIONS, BUFF_TYPES
+
+# Un record per mezzo-turno, 14 byte: flag (bit 0 = attore IA, bit 1 = azione valida,
+# bit 2 = fine partita), azione, ricompensa in centesimi, stato compatto dei due partecipanti
+# dopo l'azione e buff comparso (0 = nessuno, altrimenti 1 + cella * 4 + tipo: 16 bit bastano
+# fino alla griglia 64x64)
+TURN_DTYPE = np.dtype([('flags', 'u1'), ('action', 'u1'), ('reward', '<i2'),
+                       ('state', '<u8'), ('spawn', '<u2')])
+# Indice degli episodi: primo record, numero di mezzi-turni, vincitore (-2 = interrotto),
+# origine (0 = training, 1 = partita umana) e stato compatto iniziale
+EPISODE_DTYPE = np.dtype([('offset', '<u8'), ('turns', '<u4'), ('winner', 'i1'),
+                          ('source', 'u1'), ('start_state', '<u8')])
+SOURCES = {"train": 0, "play": 1}
+
+FLAG_AI = 1
+FLAG_VALID = 2
+FLAG_GAME_OVER = 4
+
+# Stato compatto di un partecipante, 23 bit: cella (12 bit), hp (2), armatura (1), visione (2),
+# freeze subito (2), freeze disponibili (1), ultima direzione (3); umano nei bit bassi, IA sopra
+PARTICIPANT_BITS = 23
+_FIELDS = (('cell', 0, 12), ('hp', 12, 2), ('armor', 14, 1), ('vision_duration', 15, 2),
+           ('freeze_status', 17, 2), ('freeze_attack_count', 19, 1), ('direction', 20, 3))
+_DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
+def pack_participant(participant, grid_size: int) -> int:
+    return ((participant.y - 1) * grid_size + participant.x - 1
+            | participant.hp << 12
+            | participant.armor << 14
+            | participant.vision_duration << 15
+            | participant.freeze_status << 17
+            | participant.freeze_attack_count << 19
+            | _DIRECTION_CODES[participant.last_movement_direction] << 20)
+
+
+def pack_state(game_state: GameState) -> int:
+    return (pack_participant(game_state.human, game_state.grid_size)
+            | pack_participant(game_state.ai, game_state.grid_size) << PARTICIPANT_BITS)
+
+
+def unpack_states(packed: np.ndarray, grid_size: int) -> dict:
+    # Decodifica vettoriale: per "human" e "ai" un array per campo (x, y, hp, ...)
+    packed = np.asarray(packed, dtype=np.uint64)
+    states = {}
+    for who, shift in (("human", 0), ("ai", PARTICIPANT_BITS)):
+        fields = {}
+        for name, offset, bits in _FIELDS:
+            fields[name] = ((packed >> np.uint64(shift + offset)) & np.uint64((1 << bits) - 1)).astype(np.int64)
+        cell = fields.pop('cell')
+        fields['x'] = cell % grid_size + 1
+        fields['y'] = cell // grid_size + 1
+        states[who] = fields
+    return states
+
+
+def decode_spawns(spawn: np.ndarray, grid_size: int):
+    # Per ogni record: (x, y, indice in BUFF_TYPES) del buff comparso, -1 se nessuno
+    spawn = np.asarray(spawn, dtype=np.int64)
+    code = spawn - 1
+    cell = code // len(BUFF_TYPES)
+    x = np.where(spawn > 0, cell % grid_size + 1, -1)
+    y = np.where(spawn > 0, cell // grid_size + 1, -1)
+    buff_type = np.where(spawn > 0, code % len(BUFF_TYPES), -1)
+    return x, y, buff_type
+
+
+def _spawn_code(game_state: GameState) -> int:
+    # Un buff appena comparso è l'ultimo della lista e ha già perso un turno di durata
+    # (spawn_buff è seguito da expire_buffs in next_turn)
+    if game_state.game_over or game_state.turn % 3 != 0 or not game_state.buffs:
+        return 0
+    buff = game_state.buffs[-1]
+    if buff.duration != 4:
+        return 0
+    cell = (buff.y - 1) * game_state.grid_size + buff.x - 1
+    return 1 + cell * len(BUFF_TYPES) + BUFF_TYPES.index(buff.buff_type)
+
+
+class TrajectoryRecorder:
+    # Registra le partite in file binari a blocchi di chunk_turns record, mappati in memoria;
+    # l'indice degli episodi è in un file separato in sola aggiunta. Una cartella esistente
+    # viene estesa (gli episodi non conclusi di una sessione interrotta vanno persi)
+    def __init__(self, directory, grid_size=7, chunk_turns=1 << 20):
+        # La cella di un partecipante occupa 12 bit: griglie fino a 64x64
+        if grid_size * grid_size > 1 << 12:
+            raise ValueError(f"Grid size {grid_size} is too large for the trajectory log")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["grid_size"] != grid_size:
+                raise ValueError(f"Log grid size {meta['grid_size']} does not match {grid_size}")
+            chunk_turns = meta["chunk_turns"]
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"version": 1, "grid_size": grid_size, "chunk_turns": chunk_turns}, f)
+        self.grid_size = grid_size
+        self.chunk_turns = chunk_turns
+        self.index_file = open(os.path.join(directory, "episodes.bin"), "ab")
+        episodes = np.fromfile(os.path.join(directory, "episodes.bin"), dtype=EPISODE_DTYPE)
+        self.position = int(episodes[-1]['offset'] + episodes[-1]['turns']) if len(episodes) else 0
+        self.chunk = None
+        self.chunk_number = -1
+        self.episode = None
+
+    def _chunk_path(self, number):
+        return os.path.join(self.directory, f"chunk-{number:05d}.bin")
+
+    def _open_chunk(self, number):
+        if self.chunk is not None:
+            self.chunk.flush()
+        path = self._chunk_path(number)
+        mode = "r+" if os.path.exists(path) else "w+"
+        self.chunk = np.memmap(path, dtype=TURN_DTYPE, mode=mode, shape=(self.chunk_turns,))
+        self.chunk_number = number
+
+    def begin_episode(self, game_state: GameState, source="train"):
+        self.episode = np.zeros(1, dtype=EPISODE_DTYPE)[0]
+        self.episode['offset'] = self.position
+        self.episode['source'] = SOURCES[source]
+        self.episode['start_state'] = pack_state(game_state)
+
+    def record_turn(self, game_state: GameState, is_ai: bool, action: ActionType, valid: bool, reward: float):
+        # Da chiamare subito dopo execute_action con il suo esito
+        number, row = divmod(self.position, self.chunk_turns)
+        if number != self.chunk_number:
+            self._open_chunk(number)
+        self.chunk[row] = (is_ai * FLAG_AI | valid * FLAG_VALID | game_state.game_over * FLAG_GAME_OVER,
+                           action.value, round(reward * 100), pack_state(game_state), _spawn_code(game_state))
+        self.position += 1
+
+    def end_episode(self, game_state: GameState):
+        if self.episode is None:
+            return
+        self.episode['turns'] = self.position - self.episode['offset']
+        self.episode['winner'] = -2 if game_state.winner is None else game_state.winner
+        self.index_file.write(self.episode.tobytes())
+        self.index_file.flush()
+        self.episode = None
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self.chunk = None
+        self.index_file.close()
+
+
+class TrajectoryReader:
+    # Lettura senza copie: i blocchi sono mappati in memoria e un episodio è una vista sui record
+    # (o la concatenazione di due viste se attraversa il confine di un blocco)
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.grid_size = meta["grid_size"]
+        self.chunk_turns = meta["chunk_turns"]
+        self.episodes = np.fromfile(os.path.join(directory, "episodes.bin"), dtype=EPISODE_DTYPE)
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def total_turns(self) -> int:
+        return int(self.episodes['turns'].sum())
+
+    def _chunk(self, number):
+        chunk = self.chunks.get(number)
+        if chunk is None:
+            path = os.path.join(self.directory, f"chunk-{number:05d}.bin")
+            chunk = self.chunks[number] = np.memmap(path, dtype=TURN_DTYPE, mode="r")
+        return chunk
+
+    def turns(self, start: int, count: int) -> np.ndarray:
+        # Record [start, start + count) del log
+        parts = []
+        while count > 0:
+            number, row = divmod(start, self.chunk_turns)
+            take = min(count, self.chunk_turns - row)
+            parts.append(self._chunk(number)[row:row + take])
+            start += take
+            count -= take
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=TURN_DTYPE)
+
+    def episode(self, i: int):
+        # Accesso diretto: (voce dell'indice, record dei mezzi-turni)
+        header = self.episodes[i]
+        return header, self.turns(int(header['offset']), int(header['turns']))
+
+    def __iter__(self):
+        # Lettura in streaming di tutti gli episodi, nell'ordine di registrazione
+        for i in range(len(self.episodes)):
+            yield self.episode(i)
+
+    def replay(self, i: int):
+        # Ricostruisce la sequenza di GameState dell'episodio i (stato iniziale e dopo ogni
+        # mezzo-turno) rigiocando le azioni e imponendo i buff registrati; viene restituito
+        # sempre lo stesso oggetto aggiornato (usare snapshot() per conservarne una copia)
+        header, turns = self.episode(i)
+        states = unpack_states(np.append(header['start_state'], turns['state']), self.grid_size)
+        spawn_x, spawn_y, spawn_type = decode_spawns(turns['spawn'], self.grid_size)
+        game_state = GameState(self.grid_size)
+        game_state.initialize_game()
+        self._load_participants(game_state, states, 0)
+        yield game_state
+        for k in range(len(turns)):
+            game_state.current_player = int(turns['flags'][k] & FLAG_AI)
+            game_state.execute_action(ActionType(int(turns['action'][k])))
+            # La cella e il tipo del buff comparso vengono dal log, non dal generatore casuale
+            if spawn_x[k] >= 0:
+                buff = game_state.buffs[-1]
+                buff.x, buff.y = int(spawn_x[k]), int(spawn_y[k])
+                buff.buff_type = BUFF_TYPES[spawn_type[k]]
+            self._load_participants(game_state, states, k + 1)
+            yield game_state
+
+    def _load_participants(self, game_state, states, k):
+        for who, participant in (("human", game_state.human), ("ai", game_state.ai)):
+            fields = states[who]
+            participant.x, participant.y = int(fields['x'][k]), int(fields['y'][k])
+            participant.hp = int(fields['hp'][k])
+            participant.armor = int(fields['armor'][k])
+            participant.vision_duration = int(fields['vision_duration'][k])
+            participant.freeze_status = int(fields['freeze_status'][k])
+            participant.freeze_attack_count = int(fields['freeze_attack_count'][k])
+            participant.last_movement_direction = DIRECTIONS[fields['direction'][k]]
@@ -0,0 +1,512 @@
+from typing import Optional, Tuple, Union
+import numpy as np
+
+from game_logic import (GameState, Participant, BuffToken, BuffType, ActionType, Direction,
+                        get_visibility_table, observation_size)
+
+# --- CODIFICHE NUMERICHE ---
+
+# Indici dei partecipanti negli array (N, 2): stessa convenzione di current_player
+HUMAN = 0
+AI = 1
+
+# Direzioni codificate come interi: 0 = nessuna, poi UP, DOWN, LEFT, RIGHT
+DIRECTIONS = [Direction.NONE, Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT]
+DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+# Spostamento (dx, dy) associato a ciascuna direzione codificata
+DIRECTION_DX = np.array([0, 0, 0, -1, 1], dtype=np.int64)
+DIRECTION_DY = np.array([0, -1, 1, 0, 0], dtype=np.int64)
+
+# Tipi di buff nell'ordine dell'enumerazione BuffType
+BUFF_TYPES = list(BuffType)
+BUFF_INDEX = {b: i for i, b in enumerate(BUFF_TYPES)}
+BUFF_HEALTH, BUFF_ARMOR, BUFF_VISION, BUFF_FREEZE = range(4)
+
+# Un buff nasce ogni 3 turni e vive 5 turni (4 dopo il decremento del turno di nascita):
+# al massimo due buff possono coesistere, quindi due slot per partita sono sufficienti
+MAX_BUFFS = 2
+
+ActionsLike = Union[np.ndarray, list]
+
+
+# --- STATO DI GIOCO VETTORIALE ---
+
+class VecGameState:
+    """Simula N partite di Grid Duel in parallelo con array NumPy (struct-of-arrays).
+
+    Le regole replicano esattamente quelle di GameState, che resta l'implementazione
+    di riferimento; cambia solo il generatore casuale (np.random.Generator).
+    verify_against_reference confronta le transizioni con GameState.
+    """
+
+    def __init__(self, num_envs: int, seed: Optional[int] = None, grid_size: int = 7):
+        self.num_envs = num_envs
+        self.grid_size = grid_size
+        self.max_turns = 1000  # Numero massimo di mezzi-turni
+        self.rng = np.random.default_rng(seed)
+        n = num_envs
+
+        # Stato dei partecipanti: colonna 0 = umano, colonna 1 = IA
+        self.x = np.zeros((n, 2), dtype=np.int64)
+        self.y = np.zeros((n, 2), dtype=np.int64)
+        self.hp = np.zeros((n, 2), dtype=np.int64)
+        self.armor = np.zeros((n, 2), dtype=np.int64)
+        self.vision_duration = np.zeros((n, 2), dtype=np.int64)
+        self.freeze_status = np.zeros((n, 2), dtype=np.int64)
+        self.freeze_attack_count = np.zeros((n, 2), dtype=np.int64)
+        self.last_direction = np.zeros((n, 2), dtype=np.int64)
+
+        # Slot dei buff: durata 0 indica slot libero
+        self.buff_x = np.zeros((n, MAX_BUFFS), dtype=np.int64)
+        self.buff_y = np.zeros((n, MAX_BUFFS), dtype=np.int64)
+        self.buff_type = np.zeros((n, MAX_BUFFS), dtype=np.int64)
+        self.buff_duration = np.zeros((n, MAX_BUFFS), dtype=np.int64)
+
+        # Viste piatte (2N,) degli array precedenti: l'indicizzazione con un solo
+        # vettore di indici (2 * partita + colonna) è molto più rapida di quella a coppie
+        self._x = self.x.reshape(-1)
+        self._y = self.y.reshape(-1)
+        self._hp = self.hp.reshape(-1)
+        self._armor = self.armor.reshape(-1)
+        self._vision = self.vision_duration.reshape(-1)
+        self._frozen = self.freeze_status.reshape(-1)
+        self._charges = self.freeze_attack_count.reshape(-1)
+        self._direction = self.last_direction.reshape(-1)
+        self._buff_x = self.buff_x.reshape(-1)
+        self._buff_y = self.buff_y.reshape(-1)
+        self._buff_type = self.buff_type.reshape(-1)
+        self._buff_duration = self.buff_duration.reshape(-1)
+        self._rows2 = 2 * np.arange(n)
+
+        # Stato della partita
+        self.turn = np.ones(n, dtype=np.int64)
+        self.current_player = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -2, dtype=np.int64)  # -2 = partita in corso, -1 = pareggio
+        self.last_action_valid = np.ones(n, dtype=bool)
+
+        # Esito delle partite concluse (e reinizializzate) nell'ultima chiamata a step
+        self.finished = np.zeros(n, dtype=bool)
+        self.finished_winner = np.full(n, -2, dtype=np.int64)
+        self.finished_turns = np.zeros(n, dtype=np.int64)
+
+        # Coordinate (1-based) delle celle in ordine riga per riga, come nell'osservazione
+        cells = np.arange(self.grid_size * self.grid_size)
+        self.cell_x = cells % self.grid_size + 1
+        self.cell_y = cells // self.grid_size + 1
+        self.visibility_table = self._build_visibility_table()
+
+        self.initialize_games()
+
+    def _build_visibility_table(self) -> np.ndarray:
+        # Tabella (cella, raggio 1/2, direzione) -> maschera delle celle visibili,
+        # ricavata dalla tabella precalcolata usata anche da GameState (occupa 10 * celle^2 byte:
+        # adatta alle griglie piccole e medie)
+        cells = self.grid_size * self.grid_size
+        table = np.zeros((cells, 2, len(DIRECTIONS), cells), dtype=bool)
+        reference = get_visibility_table(self.grid_size)
+        for cell in range(cells):
+            x, y = int(self.cell_x[cell]), int(self.cell_y[cell])
+            for radius in range(2):
+                for d, direction in enumerate(DIRECTIONS):
+                    table[cell, radius, d] = reference[(x, y, radius + 1, direction)][1].reshape(-1)
+        return table
+
+    def _cell(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # Indice di cella riga per riga a partire da coordinate 1-based
+        return (y - 1) * self.grid_size + (x - 1)
+
+    # --- INIZIALIZZAZIONE ---
+
+    def initialize_games(self, mask: Optional[np.ndarray] = None):
+        # Posiziona casualmente umano e IA su celle diverse nelle partite selezionate
+        ids = np.arange(self.num_envs) if mask is None else np.nonzero(mask)[0]
+        if len(ids) == 0:
+            return
+        num_cells = self.grid_size * self.grid_size
+        first = self.rng.integers(num_cells, size=len(ids))
+        # Il secondo indice salta il primo per garantire celle distinte
+        second = self.rng.integers(num_cells - 1, size=len(ids))
+        second += second >= first
+        self.x[ids, HUMAN] = self.cell_x[first]
+        self.y[ids, HUMAN] = self.cell_y[first]
+        self.x[ids, AI] = self.cell_x[second]
+        self.y[ids, AI] = self.cell_y[second]
+
+        self.hp[ids] = 3
+        self.armor[ids] = 0
+        self.vision_duration[ids] = 0
+        self.freeze_status[ids] = 0
+        self.freeze_attack_count[ids] = 0
+        self.last_direction[ids] = 0
+        self.buff_duration[ids] = 0
+
+        self.turn[ids] = 1
+        self.current_player[ids] = 0
+        self.game_over[ids] = False
+        self.winner[ids] = -2
+        self.last_action_valid[ids] = True
+
+    # --- REGOLE ---
+
+    def execute_actions(self, actions: ActionsLike,
+                        mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Esegue per ogni partita selezionata l'azione del giocatore corrente,
+        # restituendo validità e ricompensa come GameState.execute_action.
+        # Tutte le operazioni lavorano sull'intero batch con maschere booleane.
+        a = np.asarray(actions, dtype=np.int64)
+        active = np.ones(self.num_envs, dtype=bool) if mask is None else mask
+        p = self.current_player
+        pc = self._rows2 + p        # indice piatto del giocatore corrente
+        oc = self._rows2 + (1 - p)  # indice piatto dell'avversario
+        is_ai = p == AI
+
+        # Partecipanti congelati: saltano il turno decrementando lo stato freeze
+        frozen_status = self._frozen[pc]
+        skip = active & (frozen_status > 0)
+        self._frozen[pc] = frozen_status - skip
+        act = active & ~skip
+
+        px, py = self._x[pc], self._y[pc]
+        ox, oy = self._x[oc], self._y[oc]
+
+        # Movimenti: aggiorna posizione e raccoglie l'eventuale buff nella nuova cella
+        is_move = act & (a <= ActionType.MOVE_RIGHT.value)
+        direction = np.where(is_move, a + 1, 0)
+        nx = px + DIRECTION_DX[direction]
+        ny = py + DIRECTION_DY[direction]
+        moved = (is_move & (nx >= 1) & (nx <= self.grid_size) & (ny >= 1) & (ny <= self.grid_size)
+                 & ((nx != ox) | (ny != oy)))
+        self._x[pc] = np.where(moved, nx, px)
+        self._y[pc] = np.where(moved, ny, py)
+        self._direction[pc] = np.where(moved, direction, self._direction[pc])
+        gain, collected = self._collect_buffs(pc, nx, ny, moved)
+
+        # Attacco corpo a corpo: l'armatura, se presente, assorbe il colpo
+        hit = act & (a == ActionType.ATTACK.value) & (np.abs(px - ox) + np.abs(py - oy) == 1)
+        absorbed = np.zeros_like(hit)
+        if hit.any():
+            opponent_armor = self._armor[oc]
+            absorbed = hit & (opponent_armor > 0)
+            self._armor[oc] = np.where(absorbed, 0, opponent_armor)
+            self._hp[oc] -= hit & ~absorbed
+
+        # Attacco freeze: consuma la carica e riesce su stessa riga, colonna o diagonale
+        freeze = act & (a == ActionType.FREEZE.value)
+        aligned = freeze
+        if freeze.any():
+            charges = self._charges[pc]
+            freeze &= charges > 0
+            self._charges[pc] = np.where(freeze, 0, charges)
+            aligned = (px == ox) | (py == oy) | (np.abs(px - ox) == np.abs(py - oy))
+            self._frozen[oc] = np.where(freeze & aligned, 2, self._frozen[oc])
+
+        # Ricompense dal punto di vista dell'IA; ogni azione non riuscita è invalida
+        valid = moved | hit | freeze
+        r = np.where(collected, gain, 0.0)
+        r = np.where(hit, np.where(absorbed, 0.1, 0.5), r)
+        r = np.where(freeze, np.where(aligned, 0.5, -0.1), r)
+        r = np.where(act & ~valid, -0.2, r)
+        r = np.where(is_ai, r, 0.0)
+        self.last_action_valid = np.where(act, valid, self.last_action_valid)
+
+        # Verifica condizioni di vittoria o pareggio
+        killed = act & (self._hp[oc] <= 0)
+        draw = act & ~killed & (self.turn >= self.max_turns)
+        over = killed | draw
+        self.game_over |= over
+        self.winner = np.where(killed, p, np.where(draw, -1, self.winner))
+        r = np.where(killed, np.where(is_ai, 1.0, -1.0), np.where(draw, 0.0, r))
+
+        # Aggiorna durata buff visione e passa al turno successivo
+        vision = self._vision[pc]
+        self._vision[pc] = vision - (act & (vision > 0))
+        self._next_turn(skip | (act & ~over))
+
+        return np.where(act, valid, True), r.astype(np.float32)
+
+    def _collect_buffs(self, pc: np.ndarray, x: np.ndarray, y: np.ndarray,
+                       moved: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Raccoglie il buff (al più uno) presente nella cella raggiunta,
+        # restituendo la ricompensa per l'IA e la maschera delle raccolte
+        match = (moved[:, None] & (self.buff_duration > 0)
+                 & (self.buff_x == x[:, None]) & (self.buff_y == y[:, None]))
+        found = match[:, 0] | match[:, 1]
+        if not found.any():
+            return np.zeros(self.num_envs), found
+        kind = np.where(match[:, 0], self.buff_type[:, 0], self.buff_type[:, 1])
+        self.buff_duration[match] = 0
+
+        hp = self._hp[pc]
+        heal = found & (kind == BUFF_HEALTH) & (hp < 3)
+        self._hp[pc] = hp + heal
+        armor = self._armor[pc]
+        shield = found & (kind == BUFF_ARMOR) & (armor == 0)
+        self._armor[pc] = np.where(shield, 1, armor)
+        vision = found & (kind == BUFF_VISION)
+        self._vision[pc] = np.where(vision, 3, self._vision[pc])
+        charges = self._charges[pc]
+        charge = found & (kind == BUFF_FREEZE) & (charges == 0)
+        self._charges[pc] = np.where(charge, 1, charges)
+        # Ricompensa positiva se il buff è stato utile, negativa se sprecato
+        return np.where(heal | shield | vision | charge, 0.3, -0.1), found
+
+    def _next_turn(self, mask: np.ndarray):
+        # Alterna il giocatore corrente, incrementa contatore turni e gestisce buff
+        self.current_player = self.current_player ^ mask
+        self.turn += mask
+        spawn = mask & (self.turn % 3 == 0)
+        if spawn.any():
+            self._spawn_buffs(np.nonzero(spawn)[0])
+        # Scadenza buff: decrementa la durata, gli slot a zero risultano liberi
+        self.buff_duration -= mask[:, None] & (self.buff_duration > 0)
+
+    def _spawn_buffs(self, ids: np.ndarray):
+        # Genera un buff in una cella libera scelta uniformemente per ciascuna partita:
+        # campionamento con rifiuto, al più 4 celle su 49 sono occupate
+        human = self._cell(self._x[2 * ids + HUMAN], self._y[2 * ids + HUMAN])
+        ai = self._cell(self._x[2 * ids + AI], self._y[2 * ids + AI])
+        alive = self.buff_duration[ids] > 0
+        buffs = np.where(alive, self._cell(self.buff_x[ids], self.buff_y[ids]), -1)
+        cell = np.empty(len(ids), dtype=np.int64)
+        pending = np.arange(len(ids))
+        while len(pending):
+            draw = self.rng.integers(self.grid_size * self.grid_size, size=len(pending))
+            rejected = ((draw == human[pending]) | (draw == ai[pending])
+                        | (draw == buffs[pending, 0]) | (draw == buffs[pending, 1]))
+            cell[pending] = draw
+            pending = pending[rejected]
+        slot = 2 * ids + np.where(alive[:, 0], 1, 0)
+        self._buff_x[slot] = self.cell_x[cell]
+        self._buff_y[slot] = self.cell_y[cell]
+        self._buff_type[slot] = self.rng.integers(len(BUFF_TYPES), size=len(ids))
+        self._buff_duration[slot] = 5
+
+    # --- OSSERVAZIONI ---
+
+    def get_visible_mask(self, who: int, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        # Maschera (N, celle) delle celle visibili, letta dalla tabella precalcolata
+        flat = (self._rows2 if ids is None else 2 * ids) + who
+        cell = self._cell(self._x[flat], self._y[flat])
+        radius = (self._vision[flat] > 0).astype(np.int64)
+        return self.visibility_table[cell, radius, self._direction[flat]]
+
+    def get_ai_observations(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        # Osservazioni (N, observation_size) identiche a GameState.get_ai_observation per ogni
+        # partita (o solo per le partite indicate da ids)
+        if ids is None:
+            ids = np.arange(self.num_envs)
+        n, cells = len(ids), self.grid_size * self.grid_size
+        width = observation_size(self.grid_size)
+        ai = 2 * ids + AI
+        human = 2 * ids + HUMAN
+        visible = self.get_visible_mask(AI, ids)
+
+        obs = np.zeros((n, width), dtype=np.float32)
+        flat = obs.reshape(-1)
+        obs[:, 0:cells * 4:4] = visible
+        # Indici piatti dell'inizio di ogni cella: riga * larghezza + cella * 4 canali.
+        # Le celle occupate non sono marcate come visibili libere (canale 0 azzerato).
+        row_start = np.arange(n) * width
+        ai_cell = row_start + 4 * self._cell(self._x[ai], self._y[ai])
+        flat[ai_cell] = 0.0
+        flat[ai_cell + 1] = 1.0
+        human_cell = self._cell(self._x[human], self._y[human])
+        seen = visible.reshape(-1)[np.arange(n) * cells + human_cell]
+        human_cell = row_start + 4 * human_cell
+        flat[human_cell] = 0.0
+        flat[human_cell + 2] = seen
+        for slot in range(MAX_BUFFS):
+            buff = 2 * ids + slot
+            buff_cell = self._cell(self._buff_x[buff], self._buff_y[buff])
+            alive = self._buff_duration[buff] > 0
+            seen = alive & visible.reshape(-1)[np.arange(n) * cells + buff_cell]
+            buff_cell = row_start + 4 * buff_cell
+            flat[buff_cell] *= ~alive
+            flat[buff_cell + 3] += seen
+
+        features = obs[:, cells * 4:]
+        features[:, 0] = self._hp[ai] / 3.0
+        features[:, 1] = self._armor[ai]
+        features[:, 2] = self._vision[ai] / 3.0
+        features[:, 3] = self._frozen[ai]
+        features[:, 4] = self._charges[ai]
+        direction = self._direction[ai]
+        flat[row_start + cells * 4 + 4 + direction] += direction > 0
+        features[:, 9] = 1.0  # bias costante per rete neurale
+        return obs
+
+    # --- AVVERSARIO E AMBIENTE DI TRAINING ---
+
+    def legal_action_masks(self) -> np.ndarray:
+        # Versione vettoriale di GameState.legal_action_mask: (N, azioni) per il giocatore corrente
+        pc = self._rows2 + self.current_player
+        oc = self._rows2 + (1 - self.current_player)
+        px, py = self._x[pc], self._y[pc]
+        dx, dy = self._x[oc] - px, self._y[oc] - py
+        masks = np.empty((self.num_envs, len(ActionType)), dtype=bool)
+        masks[:, ActionType.MOVE_UP.value] = (py > 1) & ~((dx == 0) & (dy == -1))
+        masks[:, ActionType.MOVE_DOWN.value] = (py < self.grid_size) & ~((dx == 0) & (dy == 1))
+        masks[:, ActionType.MOVE_LEFT.value] = (px > 1) & ~((dx == -1) & (dy == 0))
+        masks[:, ActionType.MOVE_RIGHT.value] = (px < self.grid_size) & ~((dx == 1) & (dy == 0))
+        masks[:, ActionType.ATTACK.value] = np.abs(dx) + np.abs(dy) == 1
+        masks[:, ActionType.FREEZE.value] = self._charges[pc] > 0
+        # Chi è congelato salta il turno qualunque azione scelga
+        masks[self._frozen[pc] > 0] = True
+        return masks
+
+    def get_simple_opponent_actions(self, difficulty: Union[float, np.ndarray]) -> np.ndarray:
+        # Versione vettoriale di GameState.get_simple_opponent_action per tutte le partite
+        hx, hy = self.x[:, HUMAN], self.y[:, HUMAN]
+        dx, dy = self.x[:, AI] - hx, self.y[:, AI] - hy
+        adjacent = np.abs(dx) + np.abs(dy) == 1
+        attack = self.rng.random(self.num_envs) + difficulty > 0.75
+        actions = np.where(np.abs(dx) > np.abs(dy),
+                           np.where(dx > 0, ActionType.MOVE_RIGHT.value, ActionType.MOVE_LEFT.value),
+                           np.where(dy > 0, ActionType.MOVE_DOWN.value, ActionType.MOVE_UP.value))
+        return np.where(adjacent,
+                        np.where(attack, ActionType.ATTACK.value, ActionType.FREEZE.value),
+                        actions)
+
+    def reset(self, difficulty: Union[float, np.ndarray] = 0.1) -> np.ndarray:
+        # Avvia nuove partite ovunque; l'osservazione precede la prima mossa dell'avversario
+        self.initialize_games()
+        obs = self.get_ai_observations()
+        self.execute_actions(self.get_simple_opponent_actions(difficulty))
+        return obs
+
+    def step(self, actions: ActionsLike, difficulty: Union[float, np.ndarray] = 0.1
+             ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Esegue una mossa dell'IA in ogni partita, seguita dalla risposta dell'avversario.
+
+        Ricalca il ciclo di Game.train: restituisce (next_obs, rewards, dones, obs), dove
+        next_obs è osservato subito dopo la mossa dell'IA e obs è lo stato da cui scegliere
+        la prossima azione (uguale a next_obs, o all'osservazione iniziale per le partite
+        concluse e reinizializzate automaticamente).
+        """
+        _, rewards = self.execute_actions(actions)
+        next_obs = self.get_ai_observations()
+        dones = self.game_over.copy()
+
+        # Turno dell'avversario nelle partite ancora in corso
+        opponent_actions = self.get_simple_opponent_actions(difficulty)
+        self.execute_actions(opponent_actions, mask=~self.game_over)
+
+        # Reset automatico delle partite concluse, registrandone l'esito
+        self.finished = self.game_over.copy()
+        self.finished_winner = np.where(self.finished, self.winner, -2)
+        self.finished_turns = np.where(self.finished, self.turn, 0)
+        obs = next_obs
+        if self.finished.any():
+            self.initialize_games(self.finished)
+            obs = next_obs.copy()
+            finished_ids = np.nonzero(self.finished)[0]
+            obs[finished_ids] = self.get_ai_observations(finished_ids)
+            opponent_actions = self.get_simple_opponent_actions(difficulty)
+            self.execute_actions(opponent_actions, mask=self.finished)
+        return next_obs, rewards, dones, obs
+
+    # --- CONVERSIONE DA/VERSO LO STATO SCALARE ---
+
+    def set_state(self, i: int, game_state: GameState):
+        # Copia uno stato scalare nella partita i (utile per confronti con il riferimento)
+        for who, participant in ((HUMAN, game_state.human), (AI, game_state.ai)):
+            self.x[i, who] = participant.x
+            self.y[i, who] = participant.y
+            self.hp[i, who] = participant.hp
+            self.armor[i, who] = participant.armor
+            self.vision_duration[i, who] = participant.vision_duration
+            self.freeze_status[i, who] = participant.freeze_status
+            self.freeze_attack_count[i, who] = participant.freeze_attack_count
+            self.last_direction[i, who] = DIRECTION_INDEX[participant.last_movement_direction]
+        if len(game_state.buffs) > MAX_BUFFS:
+            raise ValueError(f"At most {MAX_BUFFS} buffs are supported, got {len(game_state.buffs)}")
+        self.buff_duration[i] = 0
+        for slot, buff in enumerate(game_state.buffs):
+            self.buff_x[i, slot] = buff.x
+            self.buff_y[i, slot] = buff.y
+            self.buff_type[i, slot] = BUFF_INDEX[buff.buff_type]
+            self.buff_duration[i, slot] = buff.duration
+        self.turn[i] = game_state.turn
+        self.current_player[i] = game_state.current_player
+        self.game_over[i] = game_state.game_over
+        self.winner[i] = -2 if game_state.winner is None else game_state.winner
+        self.last_action_valid[i] = game_state.last_action_valid
+
+    def get_state(self, i: int) -> GameState:
+        # Ricostruisce un GameState scalare equivalente alla partita i
+        game_state = GameState(self.grid_size)
+        participants = []
+        for who in (HUMAN, AI):
+            participant = Participant(int(self.x[i, who]), int(self.y[i, who]), is_human=who == HUMAN)
+            participant.hp = int(self.hp[i, who])
+            participant.armor = int(self.armor[i, who])
+            participant.vision_duration = int(self.vision_duration[i, who])
+            participant.freeze_status = int(self.freeze_status[i, who])
+            participant.freeze_attack_count = int(self.freeze_attack_count[i, who])
+            participant.last_movement_direction = DIRECTIONS[self.last_direction[i, who]]
+            participants.append(participant)
+        game_state.human, game_state.ai = participants
+        for slot in range(MAX_BUFFS):
+            if self.buff_duration[i, slot] > 0:
+                buff = BuffToken(int(self.buff_x[i, slot]), int(self.buff_y[i, slot]),
+                                 BUFF_TYPES[self.buff_type[i, slot]])
+                buff.duration = int(self.buff_duration[i, slot])
+                game_state.buffs.append(buff)
+        game_state.turn = int(self.turn[i])
+        game_state.current_player = int(self.current_player[i])
+        game_state.game_over = bool(self.game_over[i])
+        game_state.winner = None if self.winner[i] == -2 else int(self.winner[i])
+        game_state.last_action_valid = bool(self.last_action_valid[i])
+        return game_state
+
+
+# --- VERIFICA RISPETTO AL RIFERIMENTO ---
+
+def _signature(game_state: GameState, skip_new_buff: bool = False) -> tuple:
+    # Stato confrontabile, con i buff ordinati per posizione; con skip_new_buff il buff appena
+    # comparso (durata 4) conta solo nel numero, perché cella e tipo dipendono dal generatore
+    participants = tuple(
+        (p.x, p.y, p.hp, p.armor, p.vision_duration, p.freeze_status,
+         p.freeze_attack_count, p.last_movement_direction)
+        for p in (game_state.human, game_state.ai))
+    buffs = tuple(sorted((b.x, b.y, b.buff_type.value, b.duration) for b in game_state.buffs
+                         if not (skip_new_buff and b.duration == 4)))
+    return (participants, buffs, len(game_state.buffs), game_state.turn, game_state.current_player,
+            game_state.game_over, game_state.winner, game_state.last_action_valid)
+
+
+def verify_against_reference(num_envs: int = 128, num_steps: int = 200, seed: int = 0,
+                             grid_size: int = 7) -> int:
+    # Porta num_envs partite scalari (azioni casuali, reset a fine partita) dentro VecGameState
+    # a ogni passo e confronta osservazioni, mossa dell'avversario scriptato (se non dipende dal
+    # caso), validità, ricompensa e stato dopo execute_actions. Nei turni di spawn il nuovo buff
+    # viene escluso dal confronto. Restituisce il numero di discrepanze.
+    rng = np.random.default_rng(seed)
+    games = [GameState(grid_size) for _ in range(num_envs)]
+    for game_state in games:
+        game_state.initialize_game()
+    vec = VecGameState(num_envs, seed=seed, grid_size=grid_size)
+    mismatches = 0
+    for _ in range(num_steps):
+        for i, game_state in enumerate(games):
+            if game_state.game_over:
+                game_state.initialize_game()
+            vec.set_state(i, game_state)
+        observations = vec.get_ai_observations()
+        opponent_actions = vec.get_simple_opponent_actions(0.5)
+        actions = rng.integers(len(ActionType), size=num_envs)
+        valid, rewards = vec.execute_actions(actions)
+        for i, game_state in enumerate(games):
+            if not np.array_equal(observations[i], game_state.get_ai_observation()):
+                mismatches += 1
+            if not game_state.is_adjacent(game_state.human.get_position(), game_state.ai.get_position()):
+                mismatches += opponent_actions[i] != game_state.get_simple_opponent_action(0.5).value
+            turn = game_state.turn
+            result_valid, reward = game_state.execute_action(ActionType(int(actions[i])))
+            spawned = game_state.turn != turn and game_state.turn % 3 == 0
+            # Le ricompense vettoriali sono float32
+            if (result_valid != valid[i] or np.float32(reward) != rewards[i]
+                    or _signature(game_state, spawned) != _signature(vec.get_state(i), spawned)):
+                mismatches += 1
+    return mismatches